@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Category, Candle
+from .models import BackInStockSubscription, Category, Candle
 
 
 @admin.register(Category)
@@ -13,14 +13,14 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Candle)
 class CandleAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "category", "price", "in_stock", "created_at")
+    list_display = ("id", "name", "category", "price", "stock_qty", "in_stock", "created_at")
     list_filter = ("in_stock", "category", "created_at")
     search_fields = ("name", "slug", "description", "category__name", "category__slug")
     ordering = ("-created_at",)
     date_hierarchy = "created_at"
 
     # Fast edits прямо в списке (очень удобно для одного администратора)
-    list_editable = ("price", "in_stock")
+    list_editable = ("price", "stock_qty")
 
     # Чтобы не было конфликтов: поле из list_display не должно быть первым editable
     # (Django requirement). У нас первым идёт id — ок.
@@ -31,7 +31,16 @@ class CandleAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {"fields": ("category", "name", "slug")}),
         ("Details", {"fields": ("description", "image")}),
-        ("Inventory & Pricing", {"fields": ("price", "in_stock")}),
+        ("Inventory & Pricing", {"fields": ("price", "stock_qty", "in_stock")}),
         ("Timestamps", {"fields": ("created_at",), "classes": ("collapse",)}),
     )
-    readonly_fields = ("created_at",)
\ No newline at end of file
+    readonly_fields = ("created_at", "in_stock")
+
+
+@admin.register(BackInStockSubscription)
+class BackInStockSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ("id", "candle", "email", "created_at", "notified_at")
+    list_filter = ("notified_at",)
+    search_fields = ("email", "candle__name", "candle__slug")
+    raw_id_fields = ("candle", "user")
+    ordering = ("-created_at",)
@@ -0,0 +1,110 @@
+# backend/candles/cache.py
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.utils.http import parse_etags, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+# Postgres sequence holding the catalog version (migration 0011), so every
+# worker and management command sees the same value.
+VERSION_SEQUENCE = "candles_catalog_version"
+HITS_KEY = "catalog:stats:hits"
+MISSES_KEY = "catalog:stats:misses"
+NOT_MODIFIED_KEY = "catalog:stats:not_modified"
+
+
+def _incr(key: str) -> int:
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def get_catalog_version() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT last_value FROM {VERSION_SEQUENCE}")
+        return cursor.fetchone()[0]
+
+
+def _next_version():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [VERSION_SEQUENCE])
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog payload by moving to a new version.
+    Runs after commit so readers never cache pre-commit data under the new version.
+    """
+    transaction.on_commit(_next_version)
+
+
+def get_cache_stats() -> dict:
+    """
+    The counters live in the default cache. With LocMemCache that is one
+    process, so "counters" names the worker whose numbers these are.
+    """
+    shared = not isinstance(caches["default"], LocMemCache)
+    return {
+        "version": get_catalog_version(),
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+        "not_modified": cache.get(NOT_MODIFIED_KEY, 0),
+        "counters": "shared" if shared else f"process {os.getpid()}",
+    }
+
+
+def catalog_cache_key(request, view, version: int) -> str:
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    lookup = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field, "")
+    fmt = getattr(request.accepted_renderer, "format", "")
+    # Plain API views have no router basename/action; fall back to class + method.
+    name = getattr(view, "basename", None) or type(view).__name__
+    action = getattr(view, "action", None) or request.method.lower()
+    return f"catalog:v{version}:{name}:{action}:{lookup}:{fmt}:{query}"
+
+
+class CatalogCacheMixin:
+    """
+    Serve list/retrieve from the cache, keyed by catalog version + normalized query.
+
+    Every response carries a strong ETag derived from that key, so a client
+    sending a matching If-None-Match gets 304 before any DB or serializer
+    work. The version comes from Postgres, so all workers agree on the ETag
+    whatever the cache backend.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        key = catalog_cache_key(request, self, get_catalog_version())
+        etag = '"%s"' % hashlib.md5(key.encode()).hexdigest()
+        headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            _incr(NOT_MODIFIED_KEY)
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = cache.get(key)
+        if data is not None:
+            _incr(HITS_KEY)
+            return Response(data, headers=headers)
+
+        _incr(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+            for name, value in headers.items():
+                response[name] = value
+        return response
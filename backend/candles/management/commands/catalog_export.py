@@ -0,0 +1,70 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from candles.models import Candle
+
+COLUMNS = ["slug", "name", "category", "description", "price", "stock_qty", "image"]
+
+
+class Command(BaseCommand):
+    help = "Stream the candle catalog to a CSV or JSONL file (readable by catalog_import)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file, or '-' for stdout.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be >= 1.")
+
+        started = time.monotonic()
+        count = 0
+        stream = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+        # .iterator() outside a transaction gets a WITH HOLD cursor, which
+        # Postgres materialises in full at commit; inside one it streams, and
+        # the export is a single consistent snapshot.
+        try:
+            with transaction.atomic():
+                rows = (
+                    Candle.objects.order_by("id")
+                    .values_list("slug", "name", "category__slug", "description", "price", "stock_qty", "image")
+                    .iterator(chunk_size=batch_size)
+                )
+                writer = csv.writer(stream) if fmt == "csv" else None
+                if writer:
+                    writer.writerow(COLUMNS)
+
+                for slug, name, category, description, price, stock_qty, image in rows:
+                    record = [
+                        slug,
+                        name,
+                        category,
+                        description,
+                        str(price),
+                        stock_qty,
+                        image.get_prep_value() if image else "",
+                    ]
+                    if writer:
+                        writer.writerow(record)
+                    else:
+                        stream.write(json.dumps(dict(zip(COLUMNS, record))) + "\n")
+                    count += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Exported {count} candles in {elapsed:.1f}s ({count / elapsed if elapsed else count:.0f} rows/sec)"
+            )
+        )
@@ -0,0 +1,218 @@
+import csv
+import itertools
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+from django.db import transaction
+
+from candles.cache import bump_catalog_version
+from candles.models import (
+    Candle,
+    CandleSalesRank,
+    Category,
+    allocate_candle_slugs,
+    record_restocks,
+    refresh_search_vectors,
+)
+
+UPDATE_FIELDS = ["category", "name", "description", "price", "stock_qty", "in_stock", "image"]
+# Candle.price is DecimalField(max_digits=10, decimal_places=2).
+MAX_PRICE = Decimal("99999999.99")
+# Candle.stock_qty is a PositiveIntegerField (Postgres integer).
+MAX_STOCK_QTY = 2147483647
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream candles from a CSV or JSONL file into the catalog. "
+        "Columns: name, price, category (name or slug), and optionally slug, "
+        "description, stock_qty, image. Rows whose slug already exists are updated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or '-' for stdin.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be >= 1.")
+
+        self.categories = {}
+        for pk, name, slug in Category.objects.values_list("id", "name", "slug"):
+            self.categories[name.lower()] = pk
+            self.categories[slug] = pk
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            if fmt == "csv":
+                numbered_rows = enumerate(csv.DictReader(stream), start=1)
+            else:
+                # Lines are parsed in build_candle so a bad one is skipped, not fatal.
+                numbered_rows = ((n, line) for n, line in enumerate(stream, start=1) if line.strip())
+            self.run(numbered_rows, batch_size)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def run(self, numbered_rows, batch_size):
+        started = time.monotonic()
+        totals = {"created": 0, "updated": 0, "skipped": 0}
+
+        while True:
+            batch = list(itertools.islice(numbered_rows, batch_size))
+            if not batch:
+                break
+
+            candles = []
+            for line_no, row in batch:
+                try:
+                    candles.append(self.build_candle(row))
+                except (ValueError, TypeError) as e:
+                    totals["skipped"] += 1
+                    self.stderr.write(f"row {line_no}: {e}")
+
+            created, updated = self.write_batch(candles, batch_size)
+            totals["created"] += created
+            totals["updated"] += updated
+
+            done = totals["created"] + totals["updated"]
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{done} rows written ({done / elapsed:.0f} rows/sec)")
+
+        bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        done = totals["created"] + totals["updated"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {totals['created']}, updated {totals['updated']}, skipped {totals['skipped']} "
+                f"in {elapsed:.1f}s ({done / elapsed if elapsed else done:.0f} rows/sec)"
+            )
+        )
+
+    @staticmethod
+    def check_length(model, field, value):
+        max_length = model._meta.get_field(field).max_length
+        if len(value) > max_length:
+            raise ValueError(f"{field} is longer than {max_length} characters")
+        return value
+
+    def category_id(self, value):
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"invalid category {value!r}")
+        value = (value or "").strip()
+        if not value:
+            raise ValueError("category is required")
+        self.check_length(Category, "name", value)
+
+        pk = self.categories.get(value) or self.categories.get(value.lower())
+        if pk is None:
+            category = Category.objects.create(name=value)
+            pk = category.pk
+            self.categories[value.lower()] = pk
+            self.categories[category.slug] = pk
+        return pk
+
+    def build_candle(self, row):
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"invalid JSON: {e.msg}")
+        if not isinstance(row, dict):
+            raise ValueError("expected a JSON object")
+
+        name = self.check_length(Candle, "name", str(row.get("name") or "").strip())
+        if not name:
+            raise ValueError("name is required")
+
+        slug = self.check_length(Candle, "slug", str(row.get("slug") or "").strip())
+        if slug:
+            try:
+                validate_slug(slug)
+            except ValidationError:
+                raise ValueError(f"invalid slug {slug!r}")
+
+        try:
+            price = Decimal(str(row.get("price") or "").strip())
+        except InvalidOperation:
+            raise ValueError(f"invalid price {row.get('price')!r}")
+        if not price.is_finite():
+            raise ValueError(f"invalid price {row.get('price')!r}")
+        if price <= 0:
+            raise ValueError("price must be greater than 0")
+        if price > MAX_PRICE or price != price.quantize(Decimal("0.01")):
+            raise ValueError(f"price {row.get('price')!r} does not fit 8 digits and 2 decimal places")
+
+        stock_qty = self.stock_qty(row.get("stock_qty"))
+
+        return Candle(
+            category_id=self.category_id(row.get("category")),
+            name=name,
+            slug=slug,
+            description=str(row.get("description") or ""),
+            price=price,
+            stock_qty=stock_qty,
+            in_stock=stock_qty > 0,
+            image=self.check_length(Candle, "image", str(row.get("image") or "").strip()) or None,
+        )
+
+    @staticmethod
+    def stock_qty(value):
+        if value is None or value == "":
+            return 0
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"invalid stock_qty {value!r}")
+        try:
+            qty = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise ValueError(f"invalid stock_qty {value!r}")
+        if not qty.is_finite() or qty != qty.to_integral_value():
+            raise ValueError(f"stock_qty {value!r} is not a whole number")
+        if not 0 <= qty <= MAX_STOCK_QTY:
+            raise ValueError(f"stock_qty must be between 0 and {MAX_STOCK_QTY}")
+        return int(qty)
+
+    @transaction.atomic
+    def write_batch(self, candles, batch_size):
+        # Last row wins when a slug repeats inside the batch.
+        with_slug = {c.slug: c for c in candles if c.slug}
+        existing = dict(
+            Candle.objects.filter(slug__in=list(with_slug)).values_list("slug", "stock_qty")
+        )
+        updated = len(existing)
+
+        needs_slug = [c for c in candles if not c.slug]
+        slugs = allocate_candle_slugs([c.name for c in needs_slug], reserved=with_slug)
+        for candle, slug in zip(needs_slug, slugs):
+            candle.slug = slug
+
+        rows = list(with_slug.values()) + needs_slug
+        Candle.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["slug"],
+            update_fields=UPDATE_FIELDS,
+        )
+
+        CandleSalesRank.objects.bulk_create(
+            [CandleSalesRank(candle_id=c.pk) for c in rows],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        refresh_search_vectors(Candle.objects.filter(pk__in=[c.pk for c in rows]))
+        # bulk_create skips Candle.save, so report 0 -> positive stock changes here.
+        record_restocks(
+            c.pk for slug, c in with_slug.items() if existing.get(slug) == 0 and c.stock_qty > 0
+        )
+        return len(rows) - updated, updated
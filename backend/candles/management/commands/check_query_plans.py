@@ -0,0 +1,135 @@
+import itertools
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from candles.models import Candle
+from candles.pagination import CandleKeysetPagination
+from candles.ranking import annotate_popularity
+from candles.search import CandleSearchFilter
+from candles.views import CandleViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN every supported catalog filter/search/ordering combination and fail if a "
+        "plan contains a sequential scan or an explicit sort over more than --min-rows rows. "
+        "Searches rank their matches at query time, so only sequential scans count against them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-rows", type=int, default=1000)
+        parser.add_argument("--analyze", action="store_true", help="Run ANALYZE on the catalog tables first.")
+        parser.add_argument("--verbose-plans", action="store_true")
+
+    def handle(self, *args, **options):
+        min_rows = options["min_rows"]
+
+        if options["analyze"]:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE candles_candle")
+                cursor.execute("ANALYZE candles_category")
+                cursor.execute("ANALYZE candles_candlesalesrank")
+
+        sample = Candle.objects.order_by("id").values("category_id", "name").first()
+        if sample is None:
+            raise CommandError("Catalog is empty; load data before checking plans.")
+
+        # Middle half of the price range, as a ?price__gte=&price__lte= pair would ask for.
+        prices = Candle.objects.order_by("price").values_list("price", flat=True)
+        count = prices.count()
+        low, high = prices[count // 4], prices[count * 3 // 4]
+        term = sample["name"].split()[0]
+
+        filter_options = {
+            "category": lambda qs: qs.filter(category_id=sample["category_id"]),
+            "in_stock": lambda qs: qs.filter(in_stock=True),
+            "price_range": lambda qs: qs.filter(price__gte=low, price__lte=high),
+        }
+        # ?search= runs full-text first and falls back to trigram similarity.
+        search_options = {
+            None: None,
+            "search": lambda qs: CandleSearchFilter.full_text_matches(qs, term),
+        }
+        if self.has_extension("pg_trgm"):
+            search_options["search_trigram"] = lambda qs: CandleSearchFilter.trigram_matches(qs, term)
+        else:
+            self.stderr.write("pg_trgm is not installed; skipping the trigram search plans.")
+
+        orderings = []
+        for field in CandleViewSet.ordering_fields:
+            orderings += [field, f"-{field}"]
+
+        failures = []
+        checked = 0
+        for search, apply_search in search_options.items():
+            # Searches without ?ordering= come back by relevance.
+            search_orderings = orderings + (["-rank"] if search else [])
+            for size in range(len(filter_options) + 1):
+                for names in itertools.combinations(filter_options, size):
+                    applied = [filter_options[name] for name in names] + ([apply_search] if search else [])
+
+                    for ordering in search_orderings:
+                        for label, queryset in self.page_querysets(applied, ordering):
+                            checked += 1
+                            plan = self.explain(queryset)
+                            problems = list(self.find_problems(plan, min_rows, allow_sort=bool(search)))
+                            case = f"filters={sorted(names) or '-'} search={search or '-'} ordering={ordering} {label}"
+                            if problems:
+                                failures.append(f"{case}: {'; '.join(problems)}")
+                            if options["verbose_plans"]:
+                                self.stdout.write(f"{case}\n{json.dumps(plan, indent=2)}")
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} of {checked} plans regressed:\n" + "\n".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS(f"{checked} plans OK (min rows {min_rows})."))
+
+    def page_querysets(self, applied, ordering):
+        paginator = CandleKeysetPagination()
+        tiebreaker = paginator.tiebreakers.get(ordering.lstrip("-"), paginator.tiebreaker)
+        paginator.ordering = (ordering, f"-{tiebreaker}" if ordering.startswith("-") else tiebreaker)
+        queryset = Candle.objects.select_related("category")
+        for apply in applied:
+            queryset = apply(queryset)
+        if ordering.lstrip("-") == "popularity":
+            queryset = annotate_popularity(queryset)
+        queryset = queryset.order_by(*paginator.ordering)
+        size = paginator.page_size + 1
+
+        yield "first page", queryset[:size]
+
+        middle = queryset.count() // 2
+        boundary = next(iter(queryset[middle:middle + 1]), None)
+        if boundary is not None:
+            position = paginator._get_position_from_instance(boundary, paginator.ordering)
+            seek = paginator._seek(queryset, position, ordering.startswith("-"))
+            yield "cursor page", seek[:size]
+
+    def explain(self, queryset):
+        return json.loads(queryset.explain(format="json"))[0]["Plan"]
+
+    def find_problems(self, node, min_rows, allow_sort=False):
+        node_type = node.get("Node Type")
+        if node_type == "Seq Scan":
+            rows = self.table_rows(node["Relation Name"])
+            if rows > min_rows:
+                yield f"Seq Scan on {node['Relation Name']} (~{rows} rows)"
+        elif node_type == "Sort" and not allow_sort and node.get("Plan Rows", 0) > min_rows:
+            yield f"Sort over ~{node['Plan Rows']} rows by {node.get('Sort Key')}"
+
+        for child in node.get("Plans", []):
+            yield from self.find_problems(child, min_rows, allow_sort)
+
+    def has_extension(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = %s", [name])
+            return cursor.fetchone() is not None
+
+    def table_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+        return row[0] if row else 0
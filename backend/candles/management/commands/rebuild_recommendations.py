@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from candles import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the co-purchase matrix and top-K recommendations from paid order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50_000, help="Orders per batch.")
+        parser.add_argument("--top-k", type=int, default=recommendations.TOP_K)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["top_k"] < 1:
+            raise CommandError("--batch-size and --top-k must be >= 1.")
+
+        started = time.monotonic()
+
+        def progress(low, high, last):
+            self.stdout.write(f"orders {low}-{high} of {last} ({time.monotonic() - started:.1f}s)")
+
+        recommendations.rebuild(
+            batch_size=options["batch_size"],
+            k=options["top_k"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Recommendations rebuilt in {time.monotonic() - started:.1f}s"))
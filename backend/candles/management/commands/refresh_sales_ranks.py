@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from candles import ranking
+
+
+class Command(BaseCommand):
+    help = "Recompute the 7/30 day sales windows (and all-time totals with --full) for popularity ranking."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Also recount all-time units from order history.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        changed = ranking.refresh(full=options["full"])
+        self.stdout.write(
+            self.style.SUCCESS(f"{changed} rank rows updated in {time.monotonic() - started:.1f}s")
+        )
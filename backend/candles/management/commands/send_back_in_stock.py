@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from candles import restock
+
+
+class Command(BaseCommand):
+    help = (
+        "Email back-in-stock watchers for every pending restock event. "
+        "Safe to interrupt: watchers are marked notified batch by batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Messages per connection round (capped at --rate when that is set).",
+        )
+        parser.add_argument("--rate", type=float, default=None, help="Max messages per second.")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running, polling for new events every N seconds.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be >= 1.")
+        if options["rate"] is not None and options["rate"] <= 0:
+            raise CommandError("--rate must be > 0.")
+
+        while True:
+            started = time.monotonic()
+            sent = restock.dispatch(
+                batch_size=options["batch_size"],
+                rate=options["rate"],
+                progress=self.report,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"{sent} back-in-stock emails sent in {time.monotonic() - started:.1f}s")
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def report(self, event, sent):
+        self.stdout.write(f"{event.candle.slug}: {sent} sent")
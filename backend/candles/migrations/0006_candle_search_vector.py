@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-17 01:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_search_vector(apps, schema_editor):
+    Candle = apps.get_model("candles", "Candle")
+    Category = apps.get_model("candles", "Category")
+
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1]
+    )
+    Candle.objects.update(
+        search_vector=(
+            SearchVector("name", weight="A", config="english")
+            + SearchVector("slug", weight="B", config="english")
+            + SearchVector(category_name, weight="B", config="english")
+            + SearchVector("description", weight="C", config="english")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candles', '0005_alter_candle_image'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='candle',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='candle',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='candle_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='candle',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='candle_name_trgm_gin', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candles', '0006_candle_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='candle',
+            index=models.Index(fields=['category', 'in_stock', '-created_at'], name='candle_cat_stock_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candle',
+            index=models.Index(fields=['in_stock', 'price'], name='candle_stock_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candle',
+            index=models.Index(fields=['created_at', 'id'], name='candle_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candle',
+            index=models.Index(fields=['price', 'id'], name='candle_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candle',
+            index=models.Index(fields=['name', 'id'], name='candle_name_id_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-17 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candles', '0007_catalog_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandleCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('candle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='candles.candle')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='candles.candle')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('candle', 'other'), name='candle_copurchase_pair_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CandleRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('candle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='candles.candle')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='candles.candle')),
+            ],
+            options={
+                'ordering': ['candle', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('candle', 'rank'), name='candle_recommendation_rank_uniq')],
+            },
+        ),
+    ]
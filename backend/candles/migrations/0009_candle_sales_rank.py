@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-17 01:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candles', '0008_candle_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandleSalesRank',
+            fields=[
+                ('candle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_rank', serialize=False, to='candles.candle')),
+                ('units_7d', models.PositiveIntegerField(default=0)),
+                ('units_30d', models.PositiveIntegerField(default=0)),
+                ('units_total', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['units_7d', 'candle'], name='candle_rank_7d_idx'), models.Index(fields=['units_30d', 'candle'], name='candle_rank_30d_idx'), models.Index(fields=['units_total', 'candle'], name='candle_rank_total_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            "INSERT INTO candles_candlesalesrank (candle_id, units_7d, units_30d, units_total, refreshed_at) "
+            "SELECT id, 0, 0, 0, NOW() FROM candles_candle ON CONFLICT DO NOTHING",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candles', '0010_back_in_stock'),
+    ]
+
+    operations = [
+        # Shared catalog version for candles.cache; setval() marks 1 as used so
+        # the first nextval() moves to 2.
+        migrations.RunSQL(
+            "CREATE SEQUENCE candles_catalog_version; SELECT setval('candles_catalog_version', 1);",
+            "DROP SEQUENCE candles_catalog_version;",
+        ),
+    ]
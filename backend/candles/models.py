@@ -1,8 +1,16 @@
 # backend/candles/models.py
+import re
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.utils.text import slugify
 from cloudinary.models import CloudinaryField
 
+from .cache import bump_catalog_version
+
 
 class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
@@ -23,8 +31,75 @@ class Category(models.Model):
                 slug = f"{base_slug}-{counter}"
                 counter += 1
             self.slug = slug
+
+        name_changed = False
+        if self.pk:
+            old_name = Category.objects.filter(pk=self.pk).values_list("name", flat=True).first()
+            name_changed = old_name is not None and old_name != self.name
+
         super().save(*args, **kwargs)
 
+        if name_changed:
+            refresh_search_vectors(self.candles.all())
+        bump_catalog_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_catalog_version()
+        return result
+
+
+SEARCH_CONFIG = "english"
+
+
+def candle_search_vector():
+    """
+    Weighted tsvector expression for a candle: name > slug/category > description.
+    Category name comes from a subquery so it works inside `.update()`.
+    """
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1]
+    )
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("slug", weight="B", config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight="B", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(queryset):
+    return queryset.update(search_vector=candle_search_vector())
+
+
+def allocate_candle_slugs(names, reserved=()):
+    """
+    Unique slugs for a batch of new candles, using a single query for collisions.
+    Follows the same `base`, `base-2`, `base-3`... scheme as Candle.save.
+    `reserved` holds slugs already claimed by the caller but not yet saved.
+    """
+    bases = [slugify(name)[:200] or "candle" for name in names]
+    unique_bases = sorted(set(bases))
+    if not unique_bases:
+        return []
+
+    pattern = r"^(%s)(-[0-9]+)?$" % "|".join(re.escape(b) for b in unique_bases)
+    taken = set(Candle.objects.filter(slug__regex=pattern).values_list("slug", flat=True))
+    taken.update(reserved)
+
+    counters = {}
+    slugs = []
+    for base in bases:
+        slug = base if base not in taken else None
+        counter = counters.get(base, 2)
+        while slug is None or slug in taken:
+            slug = f"{base}-{counter}"
+            counter += 1
+        counters[base] = counter
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
 
 class Candle(models.Model):
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name="candles")
@@ -42,13 +117,40 @@ class Candle(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Maintained by save() / refresh_search_vectors(); never edited directly.
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Catalog filter/ordering combinations; checked by `manage.py check_query_plans`.
+            models.Index(fields=["category", "in_stock", "-created_at"], name="candle_cat_stock_created_idx"),
+            models.Index(fields=["in_stock", "price"], name="candle_stock_price_idx"),
+            models.Index(fields=["created_at", "id"], name="candle_created_id_idx"),
+            models.Index(fields=["price", "id"], name="candle_price_id_idx"),
+            models.Index(fields=["name", "id"], name="candle_name_id_idx"),
+            GinIndex(fields=["search_vector"], name="candle_search_vector_gin"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="candle_name_trgm_gin"),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded stock so save() can spot an out-of-stock -> in-stock change.
+        instance._loaded_stock_qty = instance.__dict__.get("stock_qty")
+        return instance
+
     def save(self, *args, **kwargs):
+        adding = self._state.adding
+        restocked = (
+            not adding
+            and getattr(self, "_loaded_stock_qty", None) == 0
+            and self.stock_qty > 0
+        )
+
         if not self.slug:
             base_slug = slugify(self.name)
             slug = base_slug
@@ -66,5 +168,140 @@ class Candle(models.Model):
             if "stock_qty" in update_fields and "in_stock" not in update_fields:
                 update_fields.add("in_stock")
                 kwargs["update_fields"] = list(update_fields)
+            restocked = restocked and "stock_qty" in update_fields
+
+        super().save(*args, **kwargs)
+        self._loaded_stock_qty = self.stock_qty
+
+        if update_fields is None or update_fields & {"name", "slug", "description", "category"}:
+            refresh_search_vectors(Candle.objects.filter(pk=self.pk))
+        if adding:
+            CandleSalesRank.objects.get_or_create(candle=self)
+        if restocked:
+            record_restocks([self.pk])
+        bump_catalog_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_catalog_version()
+        return result
+
+
+class CandleCoPurchase(models.Model):
+    """
+    Sparse candle x candle matrix: number of paid orders containing both candles.
+    Stored in both directions; maintained by candles.recommendations.
+    """
+    candle = models.ForeignKey(Candle, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Candle, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["candle", "other"], name="candle_copurchase_pair_uniq"),
+        ]
+
+
+class CandleRecommendation(models.Model):
+    """Precomputed top-K "customers also bought" list per candle."""
+    candle = models.ForeignKey(Candle, on_delete=models.CASCADE, related_name="recommendations")
+    recommended = models.ForeignKey(Candle, on_delete=models.CASCADE, related_name="+")
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["candle", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["candle", "rank"], name="candle_recommendation_rank_uniq"),
+        ]
+
+
+class CandleSalesRank(models.Model):
+    """
+    Read model for popularity ordering: units sold per candle over 7 days, 30 days
+    and all time. One row per candle; maintained by candles.ranking.
+    """
+    candle = models.OneToOneField(Candle, on_delete=models.CASCADE, primary_key=True, related_name="sales_rank")
+    units_7d = models.PositiveIntegerField(default=0)
+    units_30d = models.PositiveIntegerField(default=0)
+    units_total = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["units_7d", "candle"], name="candle_rank_7d_idx"),
+            models.Index(fields=["units_30d", "candle"], name="candle_rank_30d_idx"),
+            models.Index(fields=["units_total", "candle"], name="candle_rank_total_idx"),
+        ]
+
+
+class BackInStockSubscription(models.Model):
+    """A "notify me" request for an out-of-stock candle."""
+    candle = models.ForeignKey(Candle, on_delete=models.CASCADE, related_name="stock_subscriptions")
+    email = models.EmailField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="stock_subscriptions",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["candle", "email"],
+                condition=models.Q(notified_at__isnull=True),
+                name="stock_subscription_pending_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["candle", "id"],
+                condition=models.Q(notified_at__isnull=True),
+                name="stock_subscription_pending_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.email} -> {self.candle_id}"
+
+
+class RestockEvent(models.Model):
+    """
+    Written when a candle goes from 0 to positive stock. The back-in-stock
+    dispatcher drains these; processed_at is set once every watcher is emailed.
+    """
+    candle = models.ForeignKey(Candle, on_delete=models.CASCADE, related_name="restock_events")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="restock_event_pending_idx",
+            ),
+        ]
+
+
+def record_restocks(candle_ids):
+    """
+    Detector entry point for any code path that raises stock_qty from 0,
+    including bulk updates that bypass Candle.save. Only writes one row per candle,
+    so it is cheap enough to run inside the saving transaction.
+    """
+    candle_ids = list(candle_ids)
+    if not candle_ids:
+        return
+    pending = set(
+        RestockEvent.objects.filter(candle_id__in=candle_ids, processed_at__isnull=True)
+        .values_list("candle_id", flat=True)
+    )
+    RestockEvent.objects.bulk_create(
+        [RestockEvent(candle_id=pk) for pk in candle_ids if pk not in pending]
+    )
 
-        super().save(*args, **kwargs)
\ No newline at end of file
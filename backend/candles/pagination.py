@@ -0,0 +1,147 @@
+# backend/candles/pagination.py
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class CandleKeysetPagination(CursorPagination):
+    """
+    Opt-in keyset pagination for the catalog.
+
+    Plain `GET /api/candles/candles/` keeps returning a list. Pagination kicks in
+    only when the client sends `?page_size=` or `?cursor=`.
+
+    The cursor stores the (ordering value, id) pair of the boundary row, so every
+    page is a `WHERE (field, id) > (...)` index seek instead of an OFFSET scan.
+    """
+
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at",)
+    tiebreaker = "id"
+    # Orderings backed by another table tie-break on that table's key so the
+    # whole seek fits in one index there (see candles.ranking.annotate_popularity).
+    tiebreakers = {"popularity": "popularity_candle_id"}
+    # Relevance annotation set by CandleSearchFilter. When the filtered queryset
+    # is ordered by it, pages follow that order instead of the default one.
+    rank_field = "rank"
+
+    def get_page_size(self, request):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        ranked = f"-{self.rank_field}"
+        if self.rank_field in queryset.query.annotations and queryset.query.order_by[:1] == (ranked,):
+            ordering = (ranked,)
+        else:
+            ordering = super().get_ordering(request, queryset, view)
+        primary = ordering[0]
+        if primary.lstrip("-") == self.tiebreaker:
+            return (primary,)
+        prefix = "-" if primary.startswith("-") else ""
+        tiebreaker = self.tiebreakers.get(primary.lstrip("-"), self.tiebreaker)
+        return (primary, f"{prefix}{tiebreaker}")
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            value, pk = json.loads(cursor.position)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=(value, pk))
+
+    def encode_cursor(self, cursor):
+        position = cursor.position
+        if position is not None:
+            position = json.dumps(list(position))
+        return super().encode_cursor(Cursor(offset=0, reverse=cursor.reverse, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        field_name = ordering[0].lstrip("-")
+        tiebreaker = ordering[-1].lstrip("-")
+        if isinstance(instance, dict):
+            return (str(instance[field_name]), instance[tiebreaker])
+        value = getattr(instance, field_name)
+        if hasattr(value, "isoformat"):
+            value = value.isoformat()
+        return (str(value), getattr(instance, tiebreaker))
+
+    def _seek(self, queryset, position, descending):
+        field_name = self.ordering[0].lstrip("-")
+        tiebreaker = self.ordering[-1].lstrip("-")
+        value, pk = position
+        lookup = "lt" if descending else "gt"
+        if field_name == tiebreaker:
+            return queryset.filter(**{f"{field_name}__{lookup}": pk})
+
+        bound = "lte" if descending else "gte"
+        # The redundant range bound lets Postgres start the index scan at the
+        # cursor; the OR only breaks ties on the boundary value.
+        return queryset.filter(**{f"{field_name}__{bound}": value}).filter(
+            Q(**{f"{field_name}__{lookup}": value})
+            | Q(**{field_name: value, f"{tiebreaker}__{lookup}": pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        descending = self.ordering[0].startswith("-")
+        if reverse:
+            queryset = queryset.order_by(
+                *[o[1:] if o.startswith("-") else f"-{o}" for o in self.ordering]
+            )
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = self._seek(queryset, current_position, descending != reverse)
+
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_following = len(results) > len(self.page)
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = current_position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
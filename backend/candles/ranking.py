@@ -0,0 +1,139 @@
+# backend/candles/ranking.py
+"""
+Bestseller / trending ranks.
+
+CandleSalesRank keeps units sold per candle over 7 days, 30 days and all
+time, so popularity ordering is an index scan on that table rather than a
+SUM over order history per request.
+
+- record_paid_orders() adds a newly paid order's units to every window.
+- refresh() recomputes the 7/30 day windows from the last 30 days of orders,
+  which is what lets old sales age out. Run it periodically
+  (manage.py refresh_sales_ranks); --full also recounts all-time totals.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from .models import Candle, CandleSalesRank
+
+# ?window= value -> CandleSalesRank column
+WINDOWS = {"7d": "units_7d", "30d": "units_30d", "all": "units_total"}
+
+POPULARITY_FIELD = "units_30d"
+
+
+def _tables():
+    return {
+        "ranks": CandleSalesRank._meta.db_table,
+        "candles": Candle._meta.db_table,
+        "items": OrderItem._meta.db_table,
+        "orders": Order._meta.db_table,
+    }
+
+
+def annotate_popularity(queryset):
+    """
+    Adds `popularity` (units sold in the last 30 days) for ordering, plus the
+    rank row's key as its tiebreaker. The isnull filter keeps the join INNER
+    so Postgres can walk the (units, candle) rank index.
+    """
+    return queryset.filter(sales_rank__isnull=False).annotate(
+        popularity=F(f"sales_rank__{POPULARITY_FIELD}"),
+        popularity_candle_id=F("sales_rank__candle_id"),
+    )
+
+
+def ensure_rank_rows():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {ranks} (candle_id, units_7d, units_30d, units_total, refreshed_at)
+            SELECT id, 0, 0, 0, NOW() FROM {candles}
+            ON CONFLICT (candle_id) DO NOTHING
+            """.format(**_tables())
+        )
+
+
+def record_paid_orders(order_ids):
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE {ranks} r
+            SET units_7d = r.units_7d + s.qty,
+                units_30d = r.units_30d + s.qty,
+                units_total = r.units_total + s.qty,
+                refreshed_at = NOW()
+            FROM (
+                SELECT candle_id, SUM(quantity) AS qty
+                FROM {items}
+                WHERE order_id = ANY(%s)
+                GROUP BY candle_id
+            ) s
+            WHERE r.candle_id = s.candle_id
+            """.format(**_tables()),
+            [order_ids],
+        )
+
+
+def refresh(full=False, now=None):
+    """Recompute windows; returns the number of rank rows that changed."""
+    now = now or timezone.now()
+    since_7d = now - timedelta(days=7)
+    since_30d = now - timedelta(days=30)
+    statuses = [str(s) for s in Order.PAID_STATUSES]
+    tables = _tables()
+
+    with transaction.atomic():
+        ensure_rank_rows()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE {ranks} r
+                SET units_7d = COALESCE(s.q7, 0),
+                    units_30d = COALESCE(s.q30, 0),
+                    refreshed_at = NOW()
+                FROM {ranks} cur
+                LEFT JOIN (
+                    SELECT i.candle_id,
+                           SUM(i.quantity) FILTER (WHERE o.created_at >= %s) AS q7,
+                           SUM(i.quantity) AS q30
+                    FROM {items} i
+                    JOIN {orders} o ON o.id = i.order_id
+                    WHERE o.status = ANY(%s) AND o.created_at >= %s
+                    GROUP BY i.candle_id
+                ) s ON s.candle_id = cur.candle_id
+                WHERE r.candle_id = cur.candle_id
+                  AND (r.units_7d <> COALESCE(s.q7, 0) OR r.units_30d <> COALESCE(s.q30, 0))
+                """.format(**tables),
+                [since_7d, statuses, since_30d],
+            )
+            changed = cursor.rowcount
+
+            if full:
+                cursor.execute(
+                    """
+                    UPDATE {ranks} r
+                    SET units_total = COALESCE(s.qty, 0), refreshed_at = NOW()
+                    FROM {ranks} cur
+                    LEFT JOIN (
+                        SELECT i.candle_id, SUM(i.quantity) AS qty
+                        FROM {items} i
+                        JOIN {orders} o ON o.id = i.order_id
+                        WHERE o.status = ANY(%s)
+                        GROUP BY i.candle_id
+                    ) s ON s.candle_id = cur.candle_id
+                    WHERE r.candle_id = cur.candle_id AND r.units_total <> COALESCE(s.qty, 0)
+                    """.format(**tables),
+                    [statuses],
+                )
+                changed += cursor.rowcount
+
+    return changed
@@ -0,0 +1,117 @@
+# backend/candles/recommendations.py
+"""
+"Customers also bought" engine.
+
+CandleCoPurchase holds, for every pair of candles, how many paid orders
+contained both. All counting is done in SQL over OrderItem self-joins, in
+order-id ranges, so a rebuild never pulls order lines into Python.
+CandleRecommendation is the top-K slice of that matrix per candle, which
+the API reads with a single indexed query.
+"""
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from orders.models import Order, OrderItem
+from .models import CandleCoPurchase, CandleRecommendation
+
+TOP_K = 12
+
+_PAIRS_SQL = """
+    INSERT INTO {pairs} (candle_id, other_id, orders)
+    SELECT a.candle_id, b.candle_id, COUNT(DISTINCT a.order_id)
+    FROM {items} a
+    JOIN {items} b ON b.order_id = a.order_id AND b.candle_id <> a.candle_id
+    WHERE {where}
+    GROUP BY a.candle_id, b.candle_id
+    ON CONFLICT (candle_id, other_id)
+    DO UPDATE SET orders = {pairs}.orders + EXCLUDED.orders
+"""
+
+_TOP_K_SQL = """
+    INSERT INTO {recs} (candle_id, recommended_id, score, rank)
+    SELECT candle_id, other_id, orders, rn
+    FROM (
+        SELECT candle_id, other_id, orders,
+               ROW_NUMBER() OVER (PARTITION BY candle_id ORDER BY orders DESC, other_id) AS rn
+        FROM {pairs}
+        {where}
+    ) ranked
+    WHERE rn <= %s
+"""
+
+
+def _tables():
+    return {
+        "pairs": CandleCoPurchase._meta.db_table,
+        "recs": CandleRecommendation._meta.db_table,
+        "items": OrderItem._meta.db_table,
+        "orders": Order._meta.db_table,
+    }
+
+
+def refresh_top_k(candle_ids=None, k=TOP_K):
+    """Rebuild the top-K rows for `candle_ids` (or every candle) from the pair matrix."""
+    tables = _tables()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if candle_ids is None:
+            cursor.execute("DELETE FROM {recs}".format(**tables))
+            cursor.execute(_TOP_K_SQL.format(where="", **tables), [k])
+        else:
+            candle_ids = list(candle_ids)
+            cursor.execute("DELETE FROM {recs} WHERE candle_id = ANY(%s)".format(**tables), [candle_ids])
+            cursor.execute(
+                _TOP_K_SQL.format(where="WHERE candle_id = ANY(%s)", **tables),
+                [candle_ids, k],
+            )
+
+
+def record_paid_orders(order_ids, k=TOP_K):
+    """
+    Add newly paid orders to the pair matrix and refresh the affected top-K lists.
+    Call once per order, when it first becomes paid.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+
+    tables = _tables()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _PAIRS_SQL.format(where="a.order_id = ANY(%s)", **tables),
+                [order_ids],
+            )
+        candle_ids = set(
+            OrderItem.objects.filter(order_id__in=order_ids).values_list("candle_id", flat=True)
+        )
+        refresh_top_k(candle_ids, k=k)
+
+
+def rebuild(batch_size=50_000, k=TOP_K, progress=None):
+    """
+    Recompute the whole matrix from order history, `batch_size` orders at a time.
+    Each batch is one INSERT ... SELECT, so memory stays bounded on both sides.
+    """
+    tables = _tables()
+    bounds = Order.objects.filter(status__in=Order.PAID_STATUSES).aggregate(first=Min("id"), last=Max("id"))
+    first, last = bounds["first"], bounds["last"]
+
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {pairs}".format(**tables))
+
+    if first is not None:
+        where = (
+            "a.order_id BETWEEN %s AND %s AND a.order_id IN "
+            "(SELECT id FROM {orders} WHERE status = ANY(%s) AND id BETWEEN %s AND %s)"
+        ).format(**tables)
+        sql = _PAIRS_SQL.format(where=where, **tables)
+        statuses = [str(s) for s in Order.PAID_STATUSES]
+
+        for low in range(first, last + 1, batch_size):
+            high = min(low + batch_size - 1, last)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [low, high, statuses, low, high])
+            if progress:
+                progress(low, high, last)
+
+    refresh_top_k(k=k)
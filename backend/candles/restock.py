@@ -0,0 +1,117 @@
+# backend/candles/restock.py
+"""
+Back-in-stock notifications.
+
+Candle.save (and record_restocks() for bulk paths) only writes a RestockEvent,
+so a restock never waits on email. dispatch() drains those events:
+
+- watchers are read in id order, `batch_size` at a time;
+- each batch goes out over one reused mail connection;
+- the batch is marked notified_at in a single UPDATE right after sending,
+  so an interrupted run resumes where it stopped instead of re-emailing;
+- `rate` caps messages per second: batches are cut to at most one second's
+  worth of messages and each is held back until the run is on pace, so no
+  burst is larger than the rate allows.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import BackInStockSubscription, RestockEvent
+
+TEMPLATE = "emails/orders/back_in_stock.txt"
+
+
+def render_message(candle, subscription):
+    site_url = settings.FRONTEND_URL
+    text = render_to_string(
+        TEMPLATE,
+        {
+            "product_name": candle.name,
+            "first_name": subscription.user.first_name if subscription.user else "",
+            "product_url": f"{site_url}/product/{candle.slug}",
+            "site_url": site_url,
+        },
+    )
+    subject, _, body = text.partition("\n")
+    return EmailMessage(
+        subject=subject.strip(),
+        body=body.lstrip("\n"),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[subscription.email],
+    )
+
+
+def _pending(event):
+    return BackInStockSubscription.objects.filter(
+        candle_id=event.candle_id,
+        notified_at__isnull=True,
+        created_at__lte=event.created_at,
+    )
+
+
+def dispatch_event(event, connection, batch_size=500, rate=None):
+    """Email every watcher of one restocked candle. Returns the number of messages sent."""
+    candle = event.candle
+    sent = 0
+    last_id = 0
+    started = time.monotonic()
+    if rate:
+        batch_size = min(batch_size, math.ceil(rate))
+
+    while True:
+        batch = list(
+            _pending(event)
+            .filter(id__gt=last_id)
+            .select_related("user")
+            .order_by("id")[:batch_size]
+        )
+        if not batch:
+            break
+
+        if rate:
+            ahead = sent / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+        # A later sale can empty the shelf again mid-run; stop and keep the rest pending.
+        if not type(candle).objects.filter(pk=candle.pk, stock_qty__gt=0).exists():
+            return sent
+
+        sent += connection.send_messages([render_message(candle, sub) for sub in batch]) or 0
+        BackInStockSubscription.objects.filter(id__in=[sub.id for sub in batch]).update(
+            notified_at=timezone.now()
+        )
+        last_id = batch[-1].id
+
+    RestockEvent.objects.filter(pk=event.pk).update(processed_at=timezone.now())
+    return sent
+
+
+def dispatch(batch_size=500, rate=None, progress=None):
+    """Process every unprocessed restock event. Returns the total number of messages sent."""
+    total = 0
+    connection = get_connection()
+    connection.open()
+    try:
+        events = (
+            RestockEvent.objects.filter(processed_at__isnull=True)
+            .select_related("candle")
+            .order_by("id")
+        )
+        for event in events:
+            if event.candle.stock_qty <= 0:
+                # Sold out again before we got to it; the next restock writes a new event.
+                RestockEvent.objects.filter(pk=event.pk).update(processed_at=timezone.now())
+                continue
+            sent = dispatch_event(event, connection, batch_size=batch_size, rate=rate)
+            total += sent
+            if progress:
+                progress(event, sent)
+    finally:
+        connection.close()
+    return total
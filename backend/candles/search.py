@@ -0,0 +1,55 @@
+# backend/candles/search.py
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from rest_framework import filters
+
+from .models import SEARCH_CONFIG
+
+
+class CandleSearchFilter(filters.SearchFilter):
+    """
+    Full-text search over Candle.search_vector (GIN index), ranked by relevance.
+
+    When the text query matches nothing (typos, partial words) it falls back to
+    pg_trgm word similarity on `name`, served by the trigram GIN index.
+
+    Results are ordered by relevance unless the client passes `?ordering=`,
+    so this backend must run after OrderingFilter. The rank is cast to
+    double precision so cursor pages can seek on it exactly
+    (see CandleKeysetPagination.rank_field).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        text = " ".join(terms)
+        matches = self.full_text_matches(queryset, text)
+        if not matches.exists():
+            matches = self.trigram_matches(queryset, text)
+
+        if self._has_explicit_ordering(request, view):
+            return matches
+        return matches.order_by("-rank", "-id")
+
+    @staticmethod
+    def full_text_matches(queryset, text):
+        query = SearchQuery(text, search_type="websearch", config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+
+    @staticmethod
+    def trigram_matches(queryset, text):
+        return queryset.filter(name__trigram_word_similar=text).annotate(
+            rank=Cast(TrigramWordSimilarity(text, "name"), FloatField())
+        )
+
+    def _has_explicit_ordering(self, request, view):
+        for backend in getattr(view, "filter_backends", []):
+            param = getattr(backend, "ordering_param", None)
+            if param and request.query_params.get(param):
+                return True
+        return False
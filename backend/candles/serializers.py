@@ -9,7 +9,19 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ["id", "name", "slug"]
 
 
-class CandleSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Accepts a `fields=` kwarg and drops every other field from `self.fields`.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class CandleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
@@ -42,4 +54,43 @@ class CandleSerializer(serializers.ModelSerializer):
     def validate_stock_qty(self, value):
         if value < 0:
             raise serializers.ValidationError("stock_qty cannot be negative.")
-        return value
\ No newline at end of file
+        return value
+
+
+class CandleCardSerializer(serializers.BaseSerializer):
+    """
+    Read-only grid card. Builds the dict directly instead of going through
+    per-field serializer machinery, and only needs the columns in `model_fields`.
+    """
+
+    model_fields = ("id", "name", "slug", "price", "in_stock", "image")
+    thumbnail_size = 400
+
+    def to_representation(self, instance):
+        image = instance.image
+        return {
+            "id": instance.id,
+            "name": instance.name,
+            "slug": instance.slug,
+            "price": str(instance.price),
+            "in_stock": instance.in_stock,
+            "thumbnail": image.build_url(
+                width=self.thumbnail_size,
+                height=self.thumbnail_size,
+                crop="fill",
+                secure=True,
+            ) if image else None,
+        }
+
+
+class BackInStockSubscriptionSerializer(serializers.Serializer):
+    email = serializers.EmailField(required=False)
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+        if not attrs.get("email"):
+            if not user.is_authenticated:
+                raise serializers.ValidationError({"email": "This field is required."})
+            attrs["email"] = user.email
+        attrs["email"] = attrs["email"].strip().lower()
+        return attrs
@@ -1,3 +1,615 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order, OrderItem
+from . import ranking, recommendations, restock
+from .cache import get_catalog_version
+from .models import (
+    BackInStockSubscription,
+    Candle,
+    CandleCoPurchase,
+    CandleRecommendation,
+    CandleSalesRank,
+    Category,
+    RestockEvent,
+    refresh_search_vectors,
+)
+
+User = get_user_model()
+
+LIST_URL = "/api/candles/candles/"
+STATS_URL = "/api/candles/cache-stats/"
+FACETS_URL = "/api/candles/facets/"
+BESTSELLERS_URL = "/api/candles/bestsellers/"
+
+
+class CatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Soy")
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def make_candles(cls, count, **fields):
+        candles = [
+            Candle.objects.create(category=cls.category, name=f"Candle {i}", price=10 + i, stock_qty=5, **fields)
+            for i in range(count)
+        ]
+        return candles
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        candles = cls.make_candles(25)
+        # Shared timestamps so pages have to break ties on id.
+        now = timezone.now()
+        for i, candle in enumerate(candles):
+            Candle.objects.filter(pk=candle.pk).update(created_at=now - timedelta(minutes=i // 4))
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.data["results"]]
+            pages.append([q["sql"] for q in queries.captured_queries])
+            url = response.data["next"]
+        return ids, pages
+
+    def test_pages_cover_the_list_once_in_order(self):
+        ids, pages = self.walk(f"{LIST_URL}?page_size=4")
+
+        expected = list(Candle.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 7)
+
+    def test_deep_pages_seek_instead_of_offset(self):
+        _, pages = self.walk(f"{LIST_URL}?page_size=4&ordering=price")
+
+        self.assertEqual({len(sqls) for sqls in pages}, {len(pages[0])})
+        for sqls in pages:
+            for sql in sqls:
+                self.assertNotIn("OFFSET", sql)
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get(f"{LIST_URL}?page_size=4").data
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+
+        self.assertEqual([r["id"] for r in back["results"]], [r["id"] for r in first["results"]])
+
+    def test_unpaginated_list_is_a_plain_list(self):
+        response = self.client.get(LIST_URL)
+
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 25)
+
+
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        names = [
+            ("Lavender Fields", "Lavender and lavender buds."),
+            ("Lavender Dream", "Lavender."),
+            ("Calm Evening", "A hint of lavender."),
+            ("Morning Lavender", ""),
+            ("Cedar Smoke", "Smoky cedar wood."),
+        ]
+        for name, description in names:
+            Candle.objects.create(category=cls.category, name=name, description=description, price=20, stock_qty=3)
+
+    def test_cursor_pages_keep_relevance_order(self):
+        ranked = [row["id"] for row in self.client.get(f"{LIST_URL}?search=lavender").data]
+
+        ids, url = [], f"{LIST_URL}?search=lavender&page_size=1"
+        while url:
+            data = self.client.get(url).data
+            ids += [row["id"] for row in data["results"]]
+            url = data["next"]
+
+        self.assertEqual(len(ranked), 4)
+        self.assertEqual(ids, ranked)
+
+    def test_explicit_ordering_overrides_relevance(self):
+        data = self.client.get(f"{LIST_URL}?search=lavender&ordering=name&page_size=10").data
+
+        names = [row["name"] for row in data["results"]]
+        self.assertEqual(names, sorted(names))
+
+    def test_typo_falls_back_to_trigram_similarity(self):
+        response = self.client.get(f"{LIST_URL}?search=lavendr")
+
+        self.assertEqual(response.status_code, 200)
+        names = {row["name"] for row in response.data}
+        self.assertIn("Lavender Dream", names)
+        self.assertNotIn("Cedar Smoke", names)
+
+
+class SparseFieldsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.make_candles(5, description="Long description " * 50)
+
+    def get_list(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{LIST_URL}?{query}")
+        self.assertEqual(response.status_code, 200)
+        sqls = [q["sql"] for q in queries.captured_queries if "candles_candle" in q["sql"]]
+        self.assertEqual(len(sqls), 1)
+        return response.data, sqls[0]
+
+    def test_fields_loads_only_the_selected_columns(self):
+        data, sql = self.get_list("fields=id,name,price")
+
+        self.assertEqual(set(data[0]), {"id", "name", "price"})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn("candles_category", sql)
+
+    def test_omit_drops_fields(self):
+        data, sql = self.get_list("omit=description,category")
+
+        self.assertNotIn("description", data[0])
+        self.assertNotIn("category", data[0])
+        self.assertNotIn('"description"', sql)
+
+    def test_card_view(self):
+        data, sql = self.get_list("view=card")
+
+        self.assertEqual(set(data[0]), {"id", "name", "slug", "price", "in_stock", "thumbnail"})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"search_vector"', sql)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(f"{LIST_URL}?fields=id,secret")
+
+        self.assertEqual(response.status_code, 400)
+
+
+class FacetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.beeswax = Category.objects.create(name="Beeswax")
+        rows = [
+            (cls.category, "Lavender Calm", 12, 3),
+            (cls.category, "Cedar Smoke", 25, 0),
+            (cls.category, "Fig Leaf", 45, 1),
+            (cls.beeswax, "Honey Glow", 38, 2),
+            (cls.beeswax, "Lavender Honey", 75, 0),
+        ]
+        for category, name, price, stock in rows:
+            Candle.objects.create(category=category, name=name, price=price, stock_qty=stock)
+
+    def get_facets(self, query=""):
+        # Catalog version + one grouped query.
+        with self.assertNumQueries(2):
+            response = self.client.get(f"{FACETS_URL}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_counts_every_facet_in_one_query(self):
+        data = self.get_facets()
+
+        self.assertEqual(data["total"], 5)
+        self.assertEqual([(c["name"], c["count"]) for c in data["categories"]], [("Beeswax", 2), ("Soy", 3)])
+        self.assertEqual(data["availability"], {"in_stock": 3, "out_of_stock": 2})
+        self.assertEqual([b["count"] for b in data["price_buckets"]], [1, 2, 1, 1])
+        self.assertEqual(data["price"], {"min": "12.00", "max": "75.00"})
+
+    def test_facets_follow_list_filters(self):
+        data = self.get_facets("in_stock=true&price__lte=40")
+
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(data["availability"], {"in_stock": 2, "out_of_stock": 0})
+        self.assertEqual([b["count"] for b in data["price_buckets"]], [1, 1, 0, 0])
+
+    def test_facets_follow_search(self):
+        data = self.client.get(f"{FACETS_URL}?search=lavender").data
+
+        self.assertEqual(data["total"], 2)
+        self.assertEqual([(c["slug"], c["count"]) for c in data["categories"]], [("beeswax", 1), ("soy", 1)])
+
+    def test_empty_result(self):
+        data = self.get_facets("price__gte=1000")
+
+        self.assertEqual(data["total"], 0)
+        self.assertEqual(data["categories"], [])
+        self.assertEqual(data["price"], {"min": None, "max": None})
+
+
+class QueryPlanTests(CatalogTestCase):
+    """
+    Plans for the catalog list as the API actually issues it. A few thousand
+    analyzed rows are enough for Postgres to pick the same indexes it uses in
+    production for ordered pages; searches are checked with seq scans off,
+    since at this size scanning the table is cheaper than the GIN index.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        categories = [cls.category] + [Category.objects.create(name=f"Category {i}") for i in range(7)]
+        Candle.objects.bulk_create([
+            Candle(
+                category=categories[i % 8],
+                name=f"{'Lavender' if i % 50 == 1 else 'Cedar'} {i}",
+                slug=f"candle-{i}",
+                price=5 + (i * 37) % 95,
+                stock_qty=i % 10,
+                in_stock=i % 10 > 0,
+            )
+            for i in range(4000)
+        ])
+        refresh_search_vectors(Candle.objects.all())
+        ranking.ensure_rank_rows()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE candles_candle")
+            cursor.execute("ANALYZE candles_category")
+            cursor.execute("ANALYZE candles_candlesalesrank")
+
+    def get_plans(self, query, num_queries):
+        with CaptureQueriesContext(connection) as queries, self.assertNumQueries(num_queries):
+            response = self.client.get(f"{LIST_URL}?{query}")
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for captured in queries.captured_queries:
+                if captured["sql"].startswith("SELECT") and "candles_candle" in captured["sql"]:
+                    cursor.execute("EXPLAIN " + captured["sql"])
+                    plans.append("\n".join(row[0] for row in cursor.fetchall()))
+        return response, plans
+
+    def disable_seqscan(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def test_orderings_walk_their_index(self):
+        cases = {
+            "page_size=5": "Index Scan Backward using candle_created_id_idx",
+            "ordering=price&page_size=5": "Index Scan using candle_price_id_idx",
+            "ordering=-name&page_size=5": "Index Scan Backward using candle_name_id_idx",
+            "ordering=-popularity&page_size=5": "Index Only Scan Backward using candle_rank_30d_idx",
+            "price__gte=20&price__lte=40&ordering=price&page_size=5": "Index Scan using candle_price_id_idx",
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                # Catalog version + the page.
+                _, plans = self.get_plans(query, 2)
+                self.assertEqual(len(plans), 1)
+                self.assertIn(expected, plans[0])
+                self.assertNotIn("Sort", plans[0])
+
+    def test_cursor_page_seeks_the_price_range_on_the_index(self):
+        first = self.client.get(f"{LIST_URL}?price__gte=20&price__lte=40&ordering=price&page_size=5").data
+        _, plans = self.get_plans(first["next"].split("?", 1)[1], 2)
+
+        self.assertIn("Index Scan using candle_price_id_idx", plans[0])
+        self.assertIn("Index Cond: ((price >= '20'::numeric) AND (price <= '40'::numeric) AND (price >=", plans[0])
+
+    def test_search_uses_the_gin_index(self):
+        self.disable_seqscan()
+        queries = ["search=lavender", "search=lavender&price__gte=20&price__lte=40", "search=lavender&in_stock=true"]
+        for query in queries:
+            with self.subTest(query=query):
+                # Catalog version, the full-text existence check and the page.
+                response, plans = self.get_plans(f"{query}&page_size=5", 3)
+                self.assertTrue(response.data["results"])
+                self.assertEqual(len(plans), 2)
+                for plan in plans:
+                    self.assertNotIn("Seq Scan on candles_candle", plan)
+                if query == "search=lavender":
+                    self.assertIn("Bitmap Index Scan on candle_search_vector_gin", plans[1])
+
+    def test_cached_page_costs_one_query(self):
+        self.client.get(f"{LIST_URL}?search=lavender&ordering=price&page_size=5")
+
+        with self.assertNumQueries(1):
+            self.client.get(f"{LIST_URL}?search=lavender&ordering=price&page_size=5")
+
+    def test_check_query_plans_command_covers_search_and_price_ranges(self):
+        self.disable_seqscan()
+        out = StringIO()
+        call_command("check_query_plans", "--verbose-plans", stdout=out, stderr=StringIO())
+
+        output = out.getvalue()
+        self.assertIn("plans OK", output)
+        self.assertIn("filters=['price_range'] search=search ordering=-rank cursor page", output)
+        self.assertIn("filters=['category', 'in_stock', 'price_range'] search=- ordering=price", output)
+
+
+class CatalogCacheTests(CatalogTestCase):
+    def test_version_moves_after_commit(self):
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_candles(1)
+
+        self.assertGreater(get_catalog_version(), before)
+
+    def test_matching_etag_gets_304_until_the_catalog_changes(self):
+        etag = self.client.get(LIST_URL)["ETag"]
+
+        self.assertEqual(self.client.get(LIST_URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_candles(1)
+        response = self.client.get(LIST_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+    def test_stats_name_the_process_holding_local_counters(self):
+        self.client.get(LIST_URL)
+        self.client.get(LIST_URL)
+        admin = User.objects.create_user(email="admin@example.com", password="x", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        data = client.get(STATS_URL).data
+
+        self.assertEqual((data["hits"], data["misses"]), (1, 1))
+        self.assertEqual(data["counters"], f"process {os.getpid()}")
+
+
+class OrderHistoryTestCase(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.buyer = User.objects.create_user(email="buyer@example.com", password="x")
+
+    def order(self, *lines, status=Order.Status.PAID):
+        """lines: candles, or (candle, quantity) pairs."""
+        order = Order.objects.create(user=self.buyer, status=status)
+        for line in lines:
+            candle, quantity = line if isinstance(line, tuple) else (line, 1)
+            OrderItem.objects.create(
+                order=order, candle=candle, product_name=candle.name, unit_price=candle.price, quantity=quantity
+            )
+        return order
+
+
+class RecommendationTests(OrderHistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d = self.make_candles(4)
+
+    def recommended(self, candle):
+        response = self.client.get(f"{LIST_URL}{candle.slug}/recommendations/")
+        self.assertEqual(response.status_code, 200)
+        return [(row["id"], row["score"]) for row in response.data]
+
+    def test_paid_orders_rank_co_purchases(self):
+        orders = [
+            self.order(self.a, self.b, self.c),
+            self.order(self.a, (self.b, 3)),
+            self.order(self.a, self.d),
+        ]
+        Order.record_paid([o.pk for o in orders])
+
+        self.assertEqual(self.recommended(self.a), [(self.b.pk, 2), (self.c.pk, 1), (self.d.pk, 1)])
+        self.assertEqual(self.recommended(self.d), [(self.a.pk, 1)])
+
+    def test_rebuild_matches_incremental_updates_and_skips_unpaid_orders(self):
+        paid = [
+            self.order(self.a, self.b),
+            self.order(self.b, self.c, status=Order.Status.SHIPPED),
+            self.order(self.a, self.b, self.c),
+        ]
+        self.order(self.a, self.d, status=Order.Status.PENDING)
+        self.order(self.c, self.d, status=Order.Status.CANCELED)
+        Order.record_paid([o.pk for o in paid])
+
+        def snapshot():
+            pairs = set(CandleCoPurchase.objects.values_list("candle_id", "other_id", "orders"))
+            recs = list(CandleRecommendation.objects.order_by("candle_id", "rank").values_list(
+                "candle_id", "recommended_id", "score", "rank"
+            ))
+            return pairs, recs
+
+        incremental = snapshot()
+        recommendations.rebuild(batch_size=1, k=2)
+        pairs, recs = snapshot()
+
+        self.assertEqual(pairs, incremental[0])
+        self.assertIn((self.a.pk, self.b.pk, 2), pairs)
+        self.assertFalse({self.d.pk} & {p[0] for p in pairs})
+        self.assertEqual(
+            [r for r in recs if r[0] == self.b.pk],
+            [(self.b.pk, self.a.pk, 2, 1), (self.b.pk, self.c.pk, 2, 2)],
+        )
+        self.assertEqual(recs, [r for r in incremental[1] if r[3] <= 2])
+
+
+class SalesRankTests(OrderHistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = self.make_candles(3)
+
+    def ranks(self):
+        return {
+            row[0]: row[1:]
+            for row in CandleSalesRank.objects.values_list("candle_id", "units_7d", "units_30d", "units_total")
+        }
+
+    def bestsellers(self, query=""):
+        response = self.client.get(f"{BESTSELLERS_URL}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [(row["id"], row["units_sold"]) for row in response.data]
+
+    def age(self, order, days):
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days))
+
+    def test_paid_orders_count_in_every_window(self):
+        orders = [self.order((self.a, 2), self.b), self.order((self.b, 4))]
+        Order.record_paid([o.pk for o in orders])
+
+        self.assertEqual(self.ranks()[self.b.pk], (5, 5, 5))
+        self.assertEqual(self.bestsellers(), [(self.b.pk, 5), (self.a.pk, 2)])
+        self.assertEqual(self.bestsellers("window=all&limit=1"), [(self.b.pk, 5)])
+
+    def test_refresh_ages_out_old_sales(self):
+        recent = self.order((self.a, 1))
+        last_month = self.order((self.b, 2))
+        last_year = self.order((self.c, 3))
+        self.order((self.a, 9), status=Order.Status.CANCELED)
+        Order.record_paid([recent.pk, last_month.pk, last_year.pk])
+        self.age(last_month, 10)
+        self.age(last_year, 365)
+
+        changed = ranking.refresh()
+
+        self.assertEqual(changed, 2)
+        ranks = self.ranks()
+        self.assertEqual(ranks[self.a.pk], (1, 1, 1))
+        self.assertEqual(ranks[self.b.pk], (0, 2, 2))
+        self.assertEqual(ranks[self.c.pk], (0, 0, 3))
+        self.assertEqual(self.bestsellers("window=7d"), [(self.a.pk, 1)])
+        self.assertEqual(self.bestsellers("window=all"), [(self.c.pk, 3), (self.b.pk, 2), (self.a.pk, 1)])
+
+    def test_full_refresh_recounts_totals_from_paid_orders(self):
+        self.order((self.a, 3), status=Order.Status.COMPLETED)
+        CandleSalesRank.objects.filter(candle=self.b).update(units_total=7)
+
+        ranking.refresh(full=True)
+
+        ranks = self.ranks()
+        self.assertEqual(ranks[self.a.pk], (3, 3, 3))
+        self.assertEqual(ranks[self.b.pk], (0, 0, 0))
+
+    def test_popularity_ordering_follows_the_30_day_window(self):
+        Order.record_paid([self.order((self.c, 5), self.a).pk])
+
+        ids = [row["id"] for row in self.client.get(f"{LIST_URL}?ordering=-popularity").data]
+
+        self.assertEqual(ids, [self.c.pk, self.a.pk, self.b.pk])
+
+    def test_unknown_window_is_rejected(self):
+        self.assertEqual(self.client.get(f"{BESTSELLERS_URL}?window=1y").status_code, 400)
+
+
+class BackInStockTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.candle = Candle.objects.create(category=self.category, name="Fig Leaf", price=20, stock_qty=0)
+        for i in range(5):
+            BackInStockSubscription.objects.create(candle=self.candle, email=f"watcher{i}@example.com")
+        self.candle.stock_qty = 3
+        self.candle.save()
+
+    def dispatch(self, **kwargs):
+        with mock.patch("candles.restock.time") as clock:
+            clock.monotonic.return_value = 0.0
+            sent = restock.dispatch(**kwargs)
+        return sent, [c.args[0] for c in clock.sleep.call_args_list]
+
+    def test_restock_emails_every_watcher_once(self):
+        sent, _ = self.dispatch(batch_size=2)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f"watcher{i}@example.com" for i in range(5)])
+        self.assertFalse(BackInStockSubscription.objects.filter(notified_at__isnull=True).exists())
+        self.assertFalse(RestockEvent.objects.filter(processed_at__isnull=True).exists())
+
+        self.assertEqual(self.dispatch()[0], 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_rate_caps_each_batch_and_paces_them(self):
+        with mock.patch.object(mail.get_connection().__class__, "send_messages", autospec=True) as send:
+            send.side_effect = lambda connection, messages: len(messages)
+            sent, sleeps = self.dispatch(batch_size=500, rate=2)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual([len(c.args[1]) for c in send.call_args_list], [2, 2, 1])
+        self.assertEqual(sleeps, [1.0, 2.0])
+
+    def test_selling_out_mid_run_keeps_the_rest_pending(self):
+        with mock.patch("candles.restock.time") as clock:
+            clock.monotonic.return_value = 0.0
+            clock.sleep.side_effect = lambda _: Candle.objects.filter(pk=self.candle.pk).update(stock_qty=0)
+            sent = restock.dispatch(rate=2)
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(BackInStockSubscription.objects.filter(notified_at__isnull=True).count(), 3)
+        self.assertTrue(RestockEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+class CatalogImportTests(TestCase):
+    def import_lines(self, *lines):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            out, err = StringIO(), StringIO()
+            call_command("catalog_import", f.name, stdout=out, stderr=err)
+        return err.getvalue()
+
+    def test_bad_lines_are_skipped(self):
+        errors = self.import_lines(
+            '{"name": "Amber", "price": "12.50", "category": "Soy", "stock_qty": 4}',
+            '{"name": "Broken", ',
+            '["not", "an", "object"]',
+            '{"name": "Nan", "price": "NaN", "category": "Soy"}',
+            '{"name": "Inf", "price": "Infinity", "category": "Soy"}',
+            '{"name": "Huge", "price": "1e12", "category": "Soy"}',
+            '{"name": "Odd", "price": 3, "category": ["Soy"]}',
+            '{"name": "Odder", "price": 3, "category": "Soy", "stock_qty": [1]}',
+            "",
+            '{"name": "Birch", "price": 9, "category": "soy"}',
+        )
+
+        self.assertEqual(sorted(Candle.objects.values_list("name", flat=True)), ["Amber", "Birch"])
+        self.assertEqual(len(errors.splitlines()), 7)
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertIn("row 2: invalid JSON", errors)
+        self.assertIn("row 3: expected a JSON object", errors)
+
+    def test_rows_that_do_not_fit_the_columns_are_skipped(self):
+        long_name = "x" * 201
+        errors = self.import_lines(
+            f'{{"name": "{long_name}", "price": 5, "category": "Soy"}}',
+            f'{{"name": "Long slug", "slug": "{"s" * 221}", "price": 5, "category": "Soy"}}',
+            '{"name": "Bad slug", "slug": "no spaces allowed", "price": 5, "category": "Soy"}',
+            '{"name": "Too many", "price": 5, "category": "Soy", "stock_qty": 2147483648}',
+            '{"name": "Half", "price": 5, "category": "Soy", "stock_qty": 1.5}',
+            '{"name": "Negative", "price": 5, "category": "Soy", "stock_qty": "-1"}',
+            f'{{"name": "Long category", "price": 5, "category": "{"c" * 121}"}}',
+            '{"name": "Whole", "price": 5, "category": "Soy", "stock_qty": "3.0"}',
+        )
+
+        self.assertEqual(list(Candle.objects.values_list("name", "stock_qty")), [("Whole", 3)])
+        self.assertEqual(len(errors.splitlines()), 7)
+        self.assertIn("row 1: name is longer than 200 characters", errors)
+        self.assertIn("row 3: invalid slug", errors)
+        self.assertIn("row 5: stock_qty 1.5 is not a whole number", errors)
+
+    def test_export_round_trips_through_import(self):
+        category = Category.objects.create(name="Soy")
+        Candle.objects.create(category=category, name="Amber", slug="amber", price="12.50", stock_qty=4)
+        Candle.objects.create(category=category, name="Birch", slug="birch", price="9.00", stock_qty=0)
+
+        with tempfile.NamedTemporaryFile("r", suffix=".jsonl") as f:
+            call_command("catalog_export", f.name, "--batch-size", "1", stderr=StringIO())
+            Candle.objects.update(stock_qty=99)
+            call_command("catalog_import", f.name, stdout=StringIO(), stderr=StringIO())
 
-# Create your tests here.
+        self.assertEqual(
+            list(Candle.objects.order_by("slug").values_list("slug", "stock_qty")),
+            [("amber", 4), ("birch", 0)],
+        )
@@ -1,11 +1,20 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import CategoryViewSet, CandleViewSet
+from .views import (
+    BestsellersAPIView,
+    CandleFacetsAPIView,
+    CandleViewSet,
+    CatalogCacheStatsAPIView,
+    CategoryViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"categories", CategoryViewSet, basename="category")
 router.register(r"candles", CandleViewSet, basename="candle")
 
 urlpatterns = router.urls + [
+    path("facets/", CandleFacetsAPIView.as_view(), name="candle-facets"),
+    path("bestsellers/", BestsellersAPIView.as_view(), name="candle-bestsellers"),
+    path("cache-stats/", CatalogCacheStatsAPIView.as_view(), name="catalog-cache-stats"),
 ]
\ No newline at end of file
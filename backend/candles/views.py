@@ -1,12 +1,29 @@
-from rest_framework import viewsets, filters
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Q
+from rest_framework import generics, status, viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Category, Candle
-from .serializers import CategorySerializer, CandleSerializer
+from .models import BackInStockSubscription, Category, Candle, CandleRecommendation, CandleSalesRank
+from .serializers import (
+    BackInStockSubscriptionSerializer,
+    CategorySerializer,
+    CandleSerializer,
+    CandleCardSerializer,
+)
 from .permissions import IsStaffOrReadOnly
+from .cache import CatalogCacheMixin, get_cache_stats
+from .pagination import CandleKeysetPagination
+from .ranking import WINDOWS, annotate_popularity
+from .search import CandleSearchFilter
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     search_fields = ["name", "slug"]
@@ -14,18 +31,274 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsStaffOrReadOnly]
 
 
-class CandleViewSet(viewsets.ModelViewSet):
+class CandleViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Candle.objects.select_related("category").all()
     serializer_class = CandleSerializer
     lookup_field = "slug"
     permission_classes = [IsStaffOrReadOnly]
+    pagination_class = CandleKeysetPagination
 
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
         filters.OrderingFilter,
+        CandleSearchFilter,
+    ]
+    filterset_fields = {
+        "category": ["exact"],
+        "in_stock": ["exact"],
+        "price": ["gte", "lte"],
+    }
+    ordering_fields = ["price", "created_at", "name", "popularity"]
+    ordering = ["-created_at"]
+
+    # Serializer field -> columns to load for it.
+    sparse_columns = {"category": ("category__id", "category__name", "category__slug")}
+
+    def _split_param(self, name):
+        raw = self.request.query_params.get(name)
+        if raw is None:
+            return None
+        return [f.strip() for f in raw.split(",") if f.strip()]
+
+    def _is_card_view(self):
+        return self.action == "list" and self.request.query_params.get("view") == "card"
+
+    def get_sparse_fields(self):
+        """
+        Serializer fields selected by ?fields= / ?omit=, or None when the full
+        representation is wanted. Only applies to reads.
+        """
+        if self.request.method not in SAFE_METHODS or self._is_card_view():
+            return None
+
+        fields = self._split_param("fields")
+        omit = self._split_param("omit")
+        if fields is None and omit is None:
+            return None
+
+        readable = [name for name, f in CandleSerializer().fields.items() if not f.write_only]
+        unknown = sorted((set(fields or ()) | set(omit or ())) - set(readable))
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {unknown}"})
+
+        return [name for name in (fields or readable) if name not in set(omit or ())]
+
+    def _read_columns(self):
+        if self._is_card_view():
+            return list(CandleCardSerializer.model_fields)
+
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return None
+
+        columns = []
+        for name in fields:
+            columns.extend(self.sparse_columns.get(name, (name,)))
+        return columns
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        ordering = [o.lstrip("-") for o in filters.OrderingFilter().get_ordering(self.request, queryset, self) or []]
+        if "popularity" in ordering:
+            queryset = annotate_popularity(queryset)
+
+        columns = self._read_columns()
+        if columns is None:
+            return queryset
+
+        # Always load the pk and whatever the list is ordered/paged by, otherwise
+        # every row would trigger a deferred-field query. Annotations are not columns.
+        concrete = {f.name for f in Candle._meta.concrete_fields}
+        columns = {"id", *columns, *(o for o in ordering if o in concrete)}
+
+        if not any(c.startswith("category__") for c in columns):
+            queryset = queryset.select_related(None)
+        return queryset.only(*columns)
+
+    def get_serializer_class(self):
+        if self._is_card_view():
+            return CandleCardSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs["fields"] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=True, methods=["get"])
+    def recommendations(self, request, slug=None):
+        """
+        GET /api/candles/candles/<slug>/recommendations/
+        "Customers also bought", served from the precomputed top-K table.
+        """
+        rows = (
+            CandleRecommendation.objects
+            .filter(candle__slug=slug)
+            .select_related("recommended")
+            .order_by("rank")
+        )
+        card = CandleCardSerializer()
+        return Response([
+            {**card.to_representation(row.recommended), "score": row.score}
+            for row in rows
+        ])
+
+    @action(
+        detail=True,
+        methods=["post"],
+        url_path="notify-me",
+        permission_classes=[AllowAny],
+        serializer_class=BackInStockSubscriptionSerializer,
+    )
+    def notify_me(self, request, slug=None):
+        """
+        POST /api/candles/candles/<slug>/notify-me/  {"email": "..."}
+        Email the caller once this candle is back in stock. Signed-in users may omit email.
+        """
+        candle = generics.get_object_or_404(Candle.objects.only("id", "stock_qty"), slug=slug)
+        if candle.stock_qty > 0:
+            raise ValidationError({"detail": "This candle is in stock."})
+
+        serializer = BackInStockSubscriptionSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        user = request.user if request.user.is_authenticated else None
+
+        _, created = BackInStockSubscription.objects.get_or_create(
+            candle=candle,
+            email=serializer.validated_data["email"],
+            notified_at=None,
+            defaults={"user": user},
+        )
+        return Response(
+            {"subscribed": True},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+class CandleFacetsAPIView(CatalogCacheMixin, generics.GenericAPIView):
+    """
+    GET /api/candles/facets/
+
+    Accepts the same filter/search params as the candle list and returns
+    counts per category, availability, price bucket and the min/max price,
+    computed in a single grouped query.
+    """
+    queryset = Candle.objects.all()
+    permission_classes = [IsStaffOrReadOnly]
+    pagination_class = None
+
+    filter_backends = [DjangoFilterBackend, CandleSearchFilter]
+    filterset_fields = CandleViewSet.filterset_fields
+
+    # (lower bound inclusive, upper bound exclusive); None means open-ended.
+    price_buckets = [
+        (None, Decimal("20")),
+        (Decimal("20"), Decimal("40")),
+        (Decimal("40"), Decimal("60")),
+        (Decimal("60"), None),
     ]
-    filterset_fields = ["category", "in_stock"]
-    search_fields = ["name", "description", "slug", "category__name"]
-    ordering_fields = ["price", "created_at", "name"]
-    ordering = ["-created_at"]
\ No newline at end of file
+
+    def get(self, request, *args, **kwargs):
+        return self._cached_response(request, self.facets, *args, **kwargs)
+
+    def _bucket_filter(self, low, high):
+        q = Q()
+        if low is not None:
+            q &= Q(price__gte=low)
+        if high is not None:
+            q &= Q(price__lt=high)
+        return q
+
+    def facets(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        bucket_aggregates = {
+            f"bucket_{i}": Count("id", filter=self._bucket_filter(low, high))
+            for i, (low, high) in enumerate(self.price_buckets)
+        }
+        rows = list(
+            queryset.order_by()
+            .values("category_id", "category__name", "category__slug")
+            .annotate(
+                count=Count("id"),
+                in_stock=Count("id", filter=Q(in_stock=True)),
+                min_price=Min("price"),
+                max_price=Max("price"),
+                **bucket_aggregates,
+            )
+            .order_by("category__name")
+        )
+
+        total = sum(r["count"] for r in rows)
+        in_stock = sum(r["in_stock"] for r in rows)
+        min_prices = [r["min_price"] for r in rows]
+        max_prices = [r["max_price"] for r in rows]
+
+        return Response({
+            "total": total,
+            "categories": [
+                {
+                    "id": r["category_id"],
+                    "name": r["category__name"],
+                    "slug": r["category__slug"],
+                    "count": r["count"],
+                }
+                for r in rows
+            ],
+            "availability": {"in_stock": in_stock, "out_of_stock": total - in_stock},
+            "price_buckets": [
+                {
+                    "min": str(low) if low is not None else None,
+                    "max": str(high) if high is not None else None,
+                    "count": sum(r[f"bucket_{i}"] for r in rows),
+                }
+                for i, (low, high) in enumerate(self.price_buckets)
+            ],
+            "price": {
+                "min": str(min(min_prices)) if min_prices else None,
+                "max": str(max(max_prices)) if max_prices else None,
+            },
+        })
+
+
+class BestsellersAPIView(APIView):
+    """
+    GET /api/candles/bestsellers/?window=7d|30d|all&limit=12
+
+    Top sellers straight from the CandleSalesRank index.
+    """
+    permission_classes = [IsStaffOrReadOnly]
+    default_limit = 12
+    max_limit = 50
+
+    def get(self, request):
+        window = request.query_params.get("window", "30d")
+        if window not in WINDOWS:
+            raise ValidationError({"window": f"Must be one of: {', '.join(WINDOWS)}."})
+        column = WINDOWS[window]
+
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+        limit = max(1, min(limit, self.max_limit))
+
+        rows = (
+            CandleSalesRank.objects
+            .filter(**{f"{column}__gt": 0})
+            .select_related("candle")
+            .order_by(f"-{column}", "-candle_id")[:limit]
+        )
+        card = CandleCardSerializer()
+        return Response([
+            {**card.to_representation(row.candle), "units_sold": getattr(row, column)}
+            for row in rows
+        ])
+
+
+class CatalogCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_cache_stats())
@@ -0,0 +1,130 @@
+# backend/cart/guest.py
+"""
+Server-side carts for anonymous visitors.
+
+A guest cart lives only in the "carts" cache (see settings.CACHES), keyed by
+a random id that the client holds as a signed token in the X-Cart-Token
+header. The store must be shared by every worker: the default is a
+directory on the host (cart.store), Redis suits several hosts. Entries
+expire after GUEST_CART_TTL of inactivity.
+
+apply_operations() is a read-modify-write of the whole entry, so it holds a
+per-cart lock entry (an atomic cache.add()) for its duration; concurrent
+batches for one cart apply one after the other instead of overwriting each
+other, and a request that cannot get the lock within LOCK_WAIT raises
+CartBusy.
+
+On login the client passes the token to /api/cart/merge/, which folds the
+guest lines into cart.Cart with the same single upsert as the rest of the
+merge and then discards the guest cart. Candle ids are not validated while
+browsing (that would need the database); the merge skips ids that no longer
+exist or are out of stock.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core import signing
+from django.core.cache import caches
+
+from . import repository
+
+HEADER = "X-Cart-Token"
+SALT = "cart.guest"
+MAX_LINES = 100
+# Seconds a lock outlives a writer that died holding it, and how long others wait for it.
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 1.0
+
+
+class CartBusy(Exception):
+    """Another request held the guest cart's lock for longer than LOCK_WAIT."""
+
+
+def _store():
+    return caches["carts"]
+
+
+def _key(cart_key):
+    return f"guest-cart:{cart_key}"
+
+
+def issue_token():
+    return signing.Signer(salt=SALT).sign(uuid.uuid4().hex)
+
+
+def read_token(token):
+    """Return the cart key for a token, or None if it is missing or was tampered with."""
+    if not token:
+        return None
+    try:
+        return signing.Signer(salt=SALT).unsign(token)
+    except signing.BadSignature:
+        return None
+
+
+def token_from_request(request):
+    return request.headers.get(HEADER) or request.data.get("cart_token")
+
+
+def load(cart_key):
+    if cart_key is None:
+        return {"items": {}, "version": 0}
+    return _store().get(_key(cart_key)) or {"items": {}, "version": 0}
+
+
+def save(cart_key, data):
+    # set() restarts the TTL, so active carts never expire mid-session.
+    _store().set(_key(cart_key), data)
+
+
+@contextmanager
+def _locked(cart_key):
+    store, key, owner = _store(), f"{_key(cart_key)}:lock", uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not store.add(key, owner, timeout=LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise CartBusy("The cart is being updated by another request; try again.")
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        if store.get(key) == owner:
+            store.delete(key)
+
+
+def apply_operations(cart_key, operations):
+    """Apply add/set/remove operations (same format as the batch endpoint) under the cart's lock."""
+    with _locked(cart_key):
+        return _apply_operations(cart_key, operations)
+
+
+def _apply_operations(cart_key, operations):
+    data = load(cart_key)
+    items = dict(data["items"])
+    deltas, sets, removals = repository.fold_operations(operations)
+
+    for cid in removals:
+        items.pop(cid, None)
+    items.update(sets)
+    for cid, qty in deltas.items():
+        items[cid] = items.get(cid, 0) + qty
+
+    if len(items) > MAX_LINES:
+        raise ValueError(f"A cart can hold at most {MAX_LINES} different candles.")
+
+    data = {"items": items, "version": data["version"] + 1}
+    save(cart_key, data)
+    return data
+
+
+def representation(token, data):
+    return {
+        "cart_token": token,
+        "items": [{"candle_id": cid, "quantity": qty} for cid, qty in data["items"].items()],
+        "version": data["version"],
+    }
+
+
+def discard(cart_key):
+    _store().delete(_key(cart_key))
@@ -13,6 +13,13 @@ class Cart(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every mutation so clients can drop responses older than one they already applied.
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["updated_at"], name="cart_updated_at_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Cart #{self.id} ({self.user})"
@@ -0,0 +1,191 @@
+# backend/cart/repository.py
+"""
+Cart reads and writes, one statement each.
+
+Views go through this module instead of loading a Cart and walking its
+related managers:
+
+- touch_cart() creates the cart or bumps updated_at and version in a single
+  upsert and returns its id, so mutations never need to load the cart row first;
+- the item helpers are single UPDATE/INSERT/DELETE statements, and adds are
+  upserts that increment quantity in SQL;
+- snapshot() reads the cart, its items and their candles back with one
+  LEFT JOIN query *after* the write, so a response can never be built from
+  a stale prefetch cache.
+"""
+from django.db import connection
+from rest_framework import serializers
+
+from . import summary
+from .models import Cart, CartItem
+
+_SNAPSHOT_FIELDS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "version",
+    "items__id",
+    "items__quantity",
+    "items__candle__id",
+    "items__candle__name",
+    "items__candle__price",
+    "items__candle__slug",
+    "items__candle__in_stock",
+)
+
+_datetime = serializers.DateTimeField()
+
+
+def touch_cart(user) -> int:
+    """Return the user's cart id, creating the cart or marking it as just modified (new version)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {carts} (user_id, created_at, updated_at, version)
+            VALUES (%s, NOW(), NOW(), 1)
+            ON CONFLICT (user_id) DO UPDATE
+            SET updated_at = EXCLUDED.updated_at, version = {carts}.version + 1
+            RETURNING id, version
+            """.format(carts=Cart._meta.db_table),
+            [user.pk],
+        )
+        cart_id, version = cursor.fetchone()
+    summary.invalidate(user.pk, version)
+    return cart_id
+
+
+def snapshot(user):
+    """
+    The cart in CartSerializer's shape, read with one query.
+    Returns None if the user has no cart yet.
+    """
+    rows = list(
+        Cart.objects.filter(user=user)
+        .order_by("items__id")
+        .values_list(*_SNAPSHOT_FIELDS)
+    )
+    if not rows:
+        return None
+
+    cart_id, created_at, updated_at, version = rows[0][:4]
+    items = [
+        {
+            "id": item_id,
+            "candle": {
+                "id": candle_id,
+                "name": name,
+                "price": str(price),
+                "slug": slug,
+                "in_stock": in_stock,
+            },
+            "quantity": quantity,
+        }
+        for _, _, _, _, item_id, quantity, candle_id, name, price, slug, in_stock in rows
+        if item_id is not None
+    ]
+    return {
+        "id": cart_id,
+        "items": items,
+        "version": version,
+        "created_at": _datetime.to_representation(created_at),
+        "updated_at": _datetime.to_representation(updated_at),
+    }
+
+
+def get_snapshot(user):
+    """snapshot(), creating an empty cart on the user's first visit."""
+    data = snapshot(user)
+    if data is None:
+        touch_cart(user)
+        data = snapshot(user)
+    return data
+
+
+def add_items(cart_id, quantities):
+    """
+    Add {candle_id: quantity} to the cart in one INSERT ... ON CONFLICT.
+    Existing lines are incremented in the database, so concurrent adds of the
+    same candle never overwrite each other.
+    """
+    if not quantities:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {items} (cart_id, candle_id, quantity)
+            SELECT %s, candle_id, quantity
+            FROM unnest(%s::bigint[], %s::integer[]) AS payload(candle_id, quantity)
+            ON CONFLICT (cart_id, candle_id)
+            DO UPDATE SET quantity = {items}.quantity + EXCLUDED.quantity
+            """.format(items=CartItem._meta.db_table),
+            [cart_id, list(quantities), list(quantities.values())],
+        )
+
+
+def add_item(cart_id, candle_id, quantity):
+    add_items(cart_id, {candle_id: quantity})
+
+
+def set_quantity(user, item_id, quantity) -> bool:
+    """
+    Set an item's quantity (<= 0 removes it). Returns False if the item is not
+    in the user's cart; callers touch_cart() only after a True.
+    """
+    items = CartItem.objects.filter(id=item_id, cart__user_id=user.pk)
+    if quantity <= 0:
+        return items.delete()[0] > 0
+    return items.update(quantity=quantity) > 0
+
+
+def remove_item(user, item_id) -> bool:
+    """Delete an item from the user's cart. Returns False if it was not there."""
+    return CartItem.objects.filter(id=item_id, cart__user_id=user.pk).delete()[0] > 0
+
+
+def set_quantities(cart_id, quantities):
+    """Set {candle_id: quantity} absolutely in one upsert (zero quantities are not allowed here)."""
+    if not quantities:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {items} (cart_id, candle_id, quantity)
+            SELECT %s, candle_id, quantity
+            FROM unnest(%s::bigint[], %s::integer[]) AS payload(candle_id, quantity)
+            ON CONFLICT (cart_id, candle_id) DO UPDATE SET quantity = EXCLUDED.quantity
+            """.format(items=CartItem._meta.db_table),
+            [cart_id, list(quantities), list(quantities.values())],
+        )
+
+
+def fold_operations(operations):
+    """
+    Collapse an ordered list of add/set/remove operations into per-candle results:
+    (increments, absolute quantities, candle ids to delete). Later operations on
+    the same candle win, and an add after a set/remove builds on that value.
+    """
+    deltas, absolute = {}, {}
+    for op in operations:
+        cid, qty = op["candle_id"], op.get("quantity")
+        if op["op"] == "add":
+            if cid in absolute:
+                absolute[cid] += qty
+            else:
+                deltas[cid] = deltas.get(cid, 0) + qty
+        else:
+            deltas.pop(cid, None)
+            absolute[cid] = 0 if op["op"] == "remove" else qty
+
+    sets = {cid: qty for cid, qty in absolute.items() if qty > 0}
+    removals = [cid for cid, qty in absolute.items() if qty <= 0]
+    return deltas, sets, removals
+
+
+def apply_operations(cart_id, operations):
+    """Apply a batch of cart operations with at most three set-based statements."""
+    deltas, sets, removals = fold_operations(operations)
+    if removals:
+        CartItem.objects.filter(cart_id=cart_id, candle_id__in=removals).delete()
+    set_quantities(cart_id, sets)
+    add_items(cart_id, deltas)
+
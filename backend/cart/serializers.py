@@ -37,17 +37,48 @@ class CartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cart
-        fields = ("id", "items", "created_at", "updated_at")
-        read_only_fields = ("id", "items", "created_at", "updated_at")
+        fields = ("id", "items", "version", "created_at", "updated_at")
+        read_only_fields = ("id", "items", "version", "created_at", "updated_at")
 
 class MergeCartItemInputSerializer(serializers.Serializer):
     candle_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1, max_value=999)        
 
 class MergeCartSerializer(serializers.Serializer):
-    items = MergeCartItemInputSerializer(many=True)
+    items = MergeCartItemInputSerializer(many=True, required=False)
+    cart_token = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get("items") and not attrs.get("cart_token"):
+            raise serializers.ValidationError({"items": "items must not be empty."})
+        return attrs
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=("add", "set", "remove"))
+    candle_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, min_value=0, max_value=999)
+
+    def validate(self, attrs):
+        op = attrs["op"]
+        qty = attrs.get("quantity")
+        if op == "add":
+            if qty is None:
+                attrs["quantity"] = 1
+            elif qty < 1:
+                raise serializers.ValidationError({"quantity": "Quantity must be >= 1."})
+        elif op == "set" and qty is None:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True)
+
+    def validate_operations(self, operations):
+        if not operations:
+            raise serializers.ValidationError("operations must not be empty.")
+        if len(operations) > 100:
+            raise serializers.ValidationError("At most 100 operations per request.")
+        return operations
 
-    def validate_items(self, items):
-        if not items:
-            raise serializers.ValidationError("items must not be empty.")
-        return items       
\ No newline at end of file
@@ -0,0 +1,84 @@
+# backend/cart/store.py
+"""
+Default store for guest carts: a directory of files shared by every worker
+on the host, so it needs no database table and no extra service.
+
+Django's FileBasedCache is close, but two things matter for carts:
+
+- add() must be atomic, because cart.guest uses it as a lock. The stock
+  add() is has_key() then set(), so two workers could both "win". Here the
+  entry is written to a temp file and hard-linked into place, which fails if
+  the name already exists.
+- culling should drop the carts nobody is using. The stock cull lists the
+  whole directory on every set() and deletes a random sample. Here a read
+  touches the file, so mtime is the last use; the cull runs at most once per
+  CULL_INTERVAL per process and removes the least recently used entries.
+
+For several hosts, point GUEST_CART_CACHE_BACKEND at Redis instead (see
+settings.CACHES).
+"""
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class GuestCartFileCache(FileBasedCache):
+    # Seconds between directory scans for culling, per process.
+    CULL_INTERVAL = 60
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._last_cull = None
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, "wb") as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    # has_key() deletes the entry if it has expired; then try once more.
+                    if self.has_key(key, version):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, default, version)
+        if value is not default:
+            try:
+                os.utime(self._key_to_file(key, version))
+            except FileNotFoundError:
+                pass
+        return value
+
+    def _cull(self):
+        now = time.monotonic()
+        if self._last_cull is not None and now - self._last_cull < self.CULL_INTERVAL:
+            return
+        self._last_cull = now
+
+        entries = []
+        for fname in self._list_cache_files():
+            try:
+                entries.append((os.stat(fname).st_mtime, fname))
+            except FileNotFoundError:
+                pass
+        if len(entries) < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        entries.sort()
+        keep = self._max_entries - self._max_entries // self._cull_frequency
+        for _, fname in entries[: len(entries) - keep]:
+            self._delete(fname)
@@ -0,0 +1,94 @@
+# backend/cart/summary.py
+"""
+Header-badge cart summary: item count and subtotal.
+
+Computed with one aggregate query and kept in the shared "carts" store, so
+every worker sees the same entries. Entries are keyed by the cart version
+and the catalog version they were computed under:
+
+- repository.touch_cart() (every cart mutation) publishes the cart's new
+  version after commit; readers look that pointer up and miss until a
+  summary for the new version exists. A reader that computed from an older
+  snapshot writes under the older key, so it can never hide a newer cart;
+- the catalog version (Postgres) is copied into the store for
+  CART_SUMMARY_CATALOG_CHECK seconds, so a price change shows up within
+  that window while a cached read costs no database query at all.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+from candles.cache import get_catalog_version
+from .models import Cart
+
+CATALOG_VERSION_KEY = "cart:summary:catalog-version"
+
+
+def _store():
+    return caches["carts"]
+
+
+def _pointer(user_id):
+    return f"cart:summary:{user_id}:version"
+
+
+def _key(user_id, cart_version, catalog_version):
+    return f"cart:summary:{user_id}:{cart_version}:{catalog_version}"
+
+
+def invalidate(user_id, cart_version):
+    """Point readers at `cart_version` once the mutation that produced it commits."""
+    transaction.on_commit(
+        lambda: _store().set(_pointer(user_id), cart_version, timeout=settings.CART_SUMMARY_TIMEOUT)
+    )
+
+
+def compute(user):
+    rows = (
+        Cart.objects.filter(user=user)
+        .values("id", "version")
+        .annotate(
+            count=Coalesce(Sum("items__quantity"), 0),
+            subtotal=Coalesce(
+                Sum(F("items__quantity") * F("items__candle__price"), output_field=DecimalField()),
+                Decimal("0"),
+                output_field=DecimalField(),
+            ),
+        )
+        .order_by()
+    )
+    row = next(iter(rows), None)
+    if row is None:
+        return {"version": 0, "count": 0, "subtotal": "0.00"}
+    return {
+        "version": row["version"],
+        "count": row["count"],
+        "subtotal": str(row["subtotal"].quantize(Decimal("0.01"))),
+    }
+
+
+def get_summary(user):
+    store = _store()
+    found = store.get_many([_pointer(user.pk), CATALOG_VERSION_KEY])
+
+    catalog_version = found.get(CATALOG_VERSION_KEY)
+    if catalog_version is None:
+        catalog_version = get_catalog_version()
+        store.set(CATALOG_VERSION_KEY, catalog_version, timeout=settings.CART_SUMMARY_CATALOG_CHECK)
+
+    cart_version = found.get(_pointer(user.pk))
+    if cart_version is not None:
+        data = store.get(_key(user.pk, cart_version, catalog_version))
+        if data is not None:
+            return data
+
+    data = compute(user)
+    store.set(_key(user.pk, data["version"], catalog_version), data, timeout=settings.CART_SUMMARY_TIMEOUT)
+    if cart_version is None:
+        # add(), not set(): a mutation that committed meanwhile has already published a newer version.
+        store.add(_pointer(user.pk), data["version"], timeout=settings.CART_SUMMARY_TIMEOUT)
+    return data
@@ -1,3 +1,319 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from candles.models import Candle, Category
+
+from . import guest, repository, summary
+from .models import Cart, CartItem
+from .store import GuestCartFileCache
+
+
+class CartTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="cart@example.com", password="x")
+        category = Category.objects.create(name="Soy")
+        cls.candles = [
+            Candle.objects.create(category=category, name=f"Candle {i}", price=10 + i, stock_qty=20)
+            for i in range(8)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, lines):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, candle=candle, quantity=1) for candle in self.candles[:lines]]
+        )
+        return cart
+
+
+class CartQueryCountTests(CartTestCase):
+    """Cart endpoints run a fixed number of queries however many lines the cart holds."""
+
+    def test_get(self):
+        self.fill_cart(6)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/cart/my/")
+
+        self.assertEqual(len(response.data["items"]), 6)
+
+    def test_add(self):
+        self.fill_cart(6)
+
+        # Savepoint, candle lookup, cart upsert, item upsert, snapshot, release.
+        with self.assertNumQueries(6):
+            response = self.client.post("/api/cart/items/add/", {"candle_id": self.candles[7].pk, "quantity": 2})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["items"]), 7)
+
+    def test_update(self):
+        cart = self.fill_cart(6)
+        item = cart.items.first()
+
+        # Savepoint, item update, cart upsert, snapshot, release.
+        with self.assertNumQueries(5):
+            response = self.client.patch(f"/api/cart/items/{item.pk}/", {"quantity": 4})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["items"]), 6)
+
+    def test_update_of_a_missing_item_leaves_the_cart_alone(self):
+        cart = self.fill_cart(2)
+        other = Cart.objects.create(user=get_user_model().objects.create_user(email="other@example.com"))
+        foreign = CartItem.objects.create(cart=other, candle=self.candles[0], quantity=1)
+
+        for item_id in (999999, foreign.pk):
+            response = self.client.patch(f"/api/cart/items/{item_id}/", {"quantity": 4})
+            self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(Cart.objects.get(pk=cart.pk).version, cart.version)
+        self.assertEqual(CartItem.objects.get(pk=foreign.pk).quantity, 1)
+
+    def test_remove(self):
+        cart = self.fill_cart(3)
+        item = cart.items.first()
+
+        # Savepoint, item delete, cart upsert, snapshot, release.
+        with self.assertNumQueries(5):
+            response = self.client.delete(f"/api/cart/items/{item.pk}/delete/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["items"]), 2)
+        self.assertGreater(response.data["version"], cart.version)
+
+    def test_remove_of_a_missing_item_leaves_the_cart_alone(self):
+        cart = self.fill_cart(2)
+        other = Cart.objects.create(user=get_user_model().objects.create_user(email="other@example.com"))
+        foreign = CartItem.objects.create(cart=other, candle=self.candles[0], quantity=1)
+
+        for item_id in (999999, foreign.pk):
+            response = self.client.delete(f"/api/cart/items/{item_id}/delete/")
+            self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(Cart.objects.get(pk=cart.pk).version, cart.version)
+        self.assertTrue(CartItem.objects.filter(pk=foreign.pk).exists())
+
+
+class FoldOperationsTests(SimpleTestCase):
+    def fold(self, *ops):
+        return repository.fold_operations(
+            [{"op": op, "candle_id": cid, "quantity": qty} for op, cid, qty in ops]
+        )
+
+    def test_adds_to_the_same_candle_sum(self):
+        self.assertEqual(self.fold(("add", 1, 2), ("add", 1, 3), ("add", 2, 1)), ({1: 5, 2: 1}, {}, []))
+
+    def test_add_after_set_builds_on_the_set(self):
+        self.assertEqual(self.fold(("add", 1, 4), ("set", 1, 2), ("add", 1, 3)), ({}, {1: 5}, []))
+
+    def test_remove_drops_earlier_operations(self):
+        self.assertEqual(self.fold(("set", 1, 2), ("add", 2, 1), ("remove", 1, None)), ({2: 1}, {}, [1]))
+
+    def test_add_after_remove_sets_the_added_quantity(self):
+        self.assertEqual(self.fold(("remove", 1, None), ("add", 1, 2)), ({}, {1: 2}, []))
+
+    def test_set_to_zero_removes(self):
+        self.assertEqual(self.fold(("add", 1, 1), ("set", 1, 0)), ({}, {}, [1]))
+
+
+class CartBatchTests(CartTestCase):
+    def batch(self, *ops):
+        operations = []
+        for op, index, quantity in ops:
+            operation = {"op": op, "candle_id": self.candles[index].pk}
+            if quantity is not None:
+                operation["quantity"] = quantity
+            operations.append(operation)
+        return self.client.post("/api/cart/batch/", {"operations": operations}, format="json")
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list("candle_id", "quantity"))
+
+    def test_batch_applies_every_operation_in_a_fixed_number_of_queries(self):
+        cart = self.fill_cart(3)
+
+        # Savepoint, candle check, cart upsert, delete, set upsert, add upsert, snapshot, release.
+        with self.assertNumQueries(8):
+            response = self.batch(
+                ("add", 0, 2), ("set", 1, 5), ("remove", 2, None), ("add", 4, 1), ("add", 4, 1), ("set", 5, 3)
+            )
+
+        self.assertEqual(response.status_code, 200)
+        c = [candle.pk for candle in self.candles]
+        self.assertEqual(self.quantities(), {c[0]: 3, c[1]: 5, c[4]: 2, c[5]: 3})
+        self.assertEqual(response.data["version"], Cart.objects.get(pk=cart.pk).version)
+        self.assertGreater(response.data["version"], cart.version)
+
+    def test_unknown_candle_rejects_the_whole_batch(self):
+        cart = self.fill_cart(1)
+
+        response = self.client.post(
+            "/api/cart/batch/",
+            {"operations": [{"op": "add", "candle_id": self.candles[1].pk}, {"op": "add", "candle_id": 999999}]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.candles[0].pk: 1})
+        self.assertEqual(Cart.objects.get(pk=cart.pk).version, cart.version)
+
+
+class CartStoreMixin:
+    """Runs against the default carts backend in a throwaway directory."""
+
+    store_options = {}
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        carts = {"BACKEND": "cart.store.GuestCartFileCache", "LOCATION": directory.name, "OPTIONS": self.store_options}
+        override = override_settings(CACHES={**settings.CACHES, "carts": carts})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.store = caches["carts"]
+
+
+class CartStoreTestCase(CartStoreMixin, SimpleTestCase):
+    pass
+
+
+class GuestCartFileCacheTests(CartStoreTestCase):
+    store_options = {"MAX_ENTRIES": 4, "CULL_FREQUENCY": 2}
+
+    def test_add_is_exclusive_until_the_entry_expires(self):
+        self.assertIsInstance(self.store, GuestCartFileCache)
+        self.assertTrue(self.store.add("lock", "a"))
+        self.assertFalse(self.store.add("lock", "b"))
+        self.assertEqual(self.store.get("lock"), "a")
+
+        self.store.set("lock", "a", timeout=0)
+        self.assertTrue(self.store.add("lock", "b"))
+        self.assertEqual(self.store.get("lock"), "b")
+
+    def test_concurrent_adds_have_one_winner(self):
+        barrier = threading.Barrier(16)
+
+        def add(owner):
+            barrier.wait()
+            return self.store.add("lock", owner)
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(add, range(16)))
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(self.store.get("lock"), results.index(True))
+
+    @mock.patch.object(GuestCartFileCache, "CULL_INTERVAL", 0)
+    def test_cull_drops_the_least_recently_used_entries(self):
+        now = time.time()
+        for i in range(4):
+            self.store.set(f"cart{i}", i)
+            stamp = now - 1000 + i
+            os.utime(self.store._key_to_file(f"cart{i}"), (stamp, stamp))
+        self.store.get("cart0")
+
+        self.store.set("cart4", 4)
+
+        kept = [key for key in ("cart0", "cart1", "cart2", "cart3", "cart4") if self.store.has_key(key)]
+        self.assertEqual(kept, ["cart0", "cart3", "cart4"])
+
+
+class GuestCartTests(CartStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cart_key = guest.read_token(guest.issue_token())
+
+    def test_concurrent_batches_are_not_lost(self):
+        add = [{"op": "add", "candle_id": 1, "quantity": 1}]
+        save = guest.save
+
+        def slow_save(*args):
+            # Widen the read-modify-write window so unlocked writers would interleave.
+            time.sleep(0.002)
+            save(*args)
+
+        with mock.patch.object(guest, "save", slow_save), ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: guest.apply_operations(self.cart_key, add), range(80)))
+
+        data = guest.load(self.cart_key)
+        self.assertEqual(data["items"], {1: 80})
+        self.assertEqual(data["version"], 80)
+
+    def test_locked_cart_is_busy(self):
+        with guest._locked(self.cart_key), mock.patch.object(guest, "LOCK_WAIT", 0.05):
+            with self.assertRaises(guest.CartBusy):
+                guest.apply_operations(self.cart_key, [{"op": "add", "candle_id": 1, "quantity": 1}])
+
+        guest.apply_operations(self.cart_key, [{"op": "add", "candle_id": 1, "quantity": 1}])
+        self.assertEqual(guest.load(self.cart_key)["items"], {1: 1})
+
+
+class CartSummaryTests(CartStoreMixin, CartTestCase):
+    def get_summary(self, **headers):
+        return self.client.get("/api/cart/summary/", headers=headers)
+
+    def add(self, candle):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/cart/items/add/", {"candle_id": candle.pk, "quantity": 1})
+        self.assertEqual(response.status_code, 201)
+
+    def test_cached_summary_costs_no_queries(self):
+        self.fill_cart(3)
+        first = self.get_summary()
+
+        with self.assertNumQueries(0):
+            second = self.get_summary()
+
+        self.assertEqual(first.data, {"version": 0, "count": 3, "subtotal": "33.00"})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_etag_gets_304_until_the_cart_changes(self):
+        self.fill_cart(1)
+        etag = self.get_summary()["ETag"]
+
+        self.assertEqual(self.get_summary(if_none_match=etag).status_code, 304)
+
+        self.add(self.candles[1])
+        response = self.get_summary(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["count"], response.data["subtotal"]), (2, "21.00"))
+
+    def test_a_change_made_by_another_worker_is_seen(self):
+        self.fill_cart(1)
+        self.get_summary()
+
+        other_worker = caches.create_connection("carts")
+        with mock.patch.object(summary, "_store", return_value=other_worker):
+            self.add(self.candles[1])
+
+        self.assertEqual(self.get_summary().data["count"], 2)
+
+    @override_settings(CART_SUMMARY_CATALOG_CHECK=0)
+    def test_price_changes_are_picked_up(self):
+        self.fill_cart(1)
+        self.get_summary()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            candle = Candle.objects.get(pk=self.candles[0].pk)
+            candle.price = 99
+            candle.save()
+
+        self.assertEqual(self.get_summary().data["subtotal"], "99.00")
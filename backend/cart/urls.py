@@ -2,16 +2,24 @@ from django.urls import path
 
 from .views import (
     MyCartAPIView,
+    CartSummaryAPIView,
     AddCartItemAPIView,
     UpdateCartItemAPIView,
     RemoveCartItemAPIView,
     MergeCartAPIView,
+    CartBatchAPIView,
+    GuestCartAPIView,
+    GuestCartBatchAPIView,
 )
 
 urlpatterns = [
     path("my/", MyCartAPIView.as_view(), name="cart-my"),
+    path("summary/", CartSummaryAPIView.as_view(), name="cart-summary"),
     path("items/add/", AddCartItemAPIView.as_view(), name="cart-item-add"),
     path("items/<int:item_id>/", UpdateCartItemAPIView.as_view(), name="cart-item-update"),
     path("items/<int:item_id>/delete/", RemoveCartItemAPIView.as_view(), name="cart-item-delete"),
     path("merge/", MergeCartAPIView.as_view(), name="cart-merge"),
+    path("batch/", CartBatchAPIView.as_view(), name="cart-batch"),
+    path("guest/", GuestCartAPIView.as_view(), name="cart-guest"),
+    path("guest/batch/", GuestCartBatchAPIView.as_view(), name="cart-guest-batch"),
 ]
\ No newline at end of file
@@ -1,39 +1,53 @@
+import hashlib
+
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 
 from django.db import transaction
+from django.utils.http import parse_etags
 
-from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer, MergeCartSerializer
+from .serializers import CartBatchSerializer, CartSerializer, CartItemSerializer, MergeCartSerializer
+from . import guest, repository, summary
 
 from candles.models import Candle
 
 
-def _get_or_create_cart(user):
-    cart, _ = Cart.objects.get_or_create(user=user)
-    return (
-        Cart.objects
-        .prefetch_related("items__candle")
-        .get(pk=cart.pk)
-    )
-
-
 class MyCartAPIView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CartSerializer
 
-    def get_object(self):
-        return _get_or_create_cart(self.request.user)
+    def retrieve(self, request, *args, **kwargs):
+        return Response(repository.get_snapshot(request.user))
+
+
+class CartSummaryAPIView(generics.GenericAPIView):
+    """
+    GET /api/cart/summary/  ->  {"version": 7, "count": 3, "subtotal": "37.50"}
+
+    For the header badge. Served from the shared carts store, keyed by cart
+    and catalog version (see cart.summary); send If-None-Match to get 304
+    when nothing changed.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        data = summary.get_summary(request.user)
+        raw = f"{request.user.pk}:{data['version']}:{data['count']}:{data['subtotal']}"
+        etag = '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
 
 
 class AddCartItemAPIView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CartItemSerializer
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        cart = _get_or_create_cart(request.user)
-
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -42,31 +56,20 @@ class AddCartItemAPIView(generics.CreateAPIView):
         if qty <= 0:
             raise ValidationError({"quantity": "Quantity must be >= 1."})
 
-        item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            candle=candle,
-            defaults={"quantity": qty},
-        )
-        if not created:
-            item.quantity += qty
-            item.save(update_fields=["quantity"])
+        cart_id = repository.touch_cart(request.user)
+        repository.add_item(cart_id, candle.pk, qty)
 
-        return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
+        return Response(repository.snapshot(request.user), status=status.HTTP_201_CREATED)
 
 
 class UpdateCartItemAPIView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CartItemSerializer
 
+    @transaction.atomic
     def patch(self, request, *args, **kwargs):
-        cart = _get_or_create_cart(request.user)
         item_id = kwargs.get("item_id")
 
-        try:
-            item = CartItem.objects.get(id=item_id, cart=cart)
-        except CartItem.DoesNotExist:
-            return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
-
         qty = request.data.get("quantity")
         if qty is None:
             raise ValidationError({"quantity": "This field is required."})
@@ -76,24 +79,23 @@ class UpdateCartItemAPIView(generics.UpdateAPIView):
         except ValueError:
             raise ValidationError({"quantity": "Quantity must be an integer."})
 
-        if qty <= 0:
-            item.delete()
-            return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+        if not repository.set_quantity(request.user, item_id, qty):
+            return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
+        repository.touch_cart(request.user)
 
-        item.quantity = qty
-        item.save(update_fields=["quantity"])
-        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+        return Response(repository.snapshot(request.user), status=status.HTTP_200_OK)
 
 
 class RemoveCartItemAPIView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
-        cart = _get_or_create_cart(request.user)
-        item_id = kwargs.get("item_id")
+        if not repository.remove_item(request.user, kwargs.get("item_id")):
+            return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
+        repository.touch_cart(request.user)
 
-        CartItem.objects.filter(id=item_id, cart=cart).delete()
-        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+        return Response(repository.snapshot(request.user), status=status.HTTP_200_OK)
 
 class MergeCartAPIView(generics.GenericAPIView):
     """
@@ -107,17 +109,21 @@ class MergeCartAPIView(generics.GenericAPIView):
     }
 
     Merges guest cart into server cart for authenticated user.
+    A server-side guest cart can be promoted by sending its token as
+    "cart_token" (or the X-Cart-Token header) instead of, or with, "items".
     """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = MergeCartSerializer
 
     @transaction.atomic
     def post(self, request, *args, **kwargs):
-        cart = _get_or_create_cart(request.user)
+        cart_id = repository.touch_cart(request.user)
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        items = serializer.validated_data["items"]
+        items = serializer.validated_data.get("items", [])
+        guest_key = guest.read_token(guest.token_from_request(request))
+        guest_items = guest.load(guest_key)["items"]
 
         # 1) Sum duplicates in payload
         merged = {}
@@ -128,16 +134,15 @@ class MergeCartAPIView(generics.GenericAPIView):
 
         candle_ids = list(merged.keys())
 
-        # 2) Fetch candles (and lock if you later add stock_qty)
-        candles = Candle.objects.select_for_update().filter(id__in=candle_ids)
+        # 2) Validate candles (payload and guest cart) in one query
+        candles = Candle.objects.filter(id__in=set(candle_ids) | set(guest_items)).only("id", "name", "in_stock")
         candle_map = {c.id: c for c in candles}
 
-        if len(candle_map) != len(candle_ids):
-            missing = sorted(set(candle_ids) - set(candle_map.keys()))
+        missing = sorted(set(candle_ids) - set(candle_map.keys()))
+        if missing:
             raise ValidationError({"items": f"Some candle_id do not exist: {missing}"})
 
-        # 3) Apply merge
-        for cid, qty in merged.items():
+        for cid in candle_ids:
             candle = candle_map[cid]
 
             # minimal availability check
@@ -146,13 +151,99 @@ class MergeCartAPIView(generics.GenericAPIView):
                 # I suggest: raise error to be strict and predictable.
                 raise ValidationError({"items": f"Item is out of stock: {candle.name} (id={cid})"})
 
-            item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                candle=candle,
-                defaults={"quantity": qty},
-            )
-            if not created:
-                item.quantity += qty
-                item.save(update_fields=["quantity"])
+        # Guest-cart lines were never validated, so stale ones are skipped rather than rejected.
+        for cid, qty in guest_items.items():
+            candle = candle_map.get(cid)
+            if candle is not None and candle.in_stock:
+                merged[cid] = merged.get(cid, 0) + qty
+
+        # 3) Apply merge: one upsert for the whole payload
+        repository.add_items(cart_id, merged)
+        if guest_key:
+            transaction.on_commit(lambda: guest.discard(guest_key))
+
+        return Response(repository.snapshot(request.user), status=status.HTTP_200_OK)
+
+
+class CartBatchAPIView(generics.GenericAPIView):
+    """
+    POST /api/cart/batch/
+    Body:
+    {
+      "operations": [
+        {"op": "add", "candle_id": 12, "quantity": 2},
+        {"op": "set", "candle_id": 5, "quantity": 3},
+        {"op": "remove", "candle_id": 7}
+      ]
+    }
+
+    Applies all operations in one transaction and returns a single cart
+    snapshot. `version` grows with every mutation; clients should ignore a
+    response whose version is lower than one they have already applied.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = CartBatchSerializer
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data["operations"]
+
+        candle_ids = {op["candle_id"] for op in operations if op["op"] != "remove"}
+        found = set(Candle.objects.filter(id__in=candle_ids).values_list("id", flat=True))
+        if found != candle_ids:
+            missing = sorted(candle_ids - found)
+            raise ValidationError({"operations": f"Some candle_id do not exist: {missing}"})
+
+        cart_id = repository.touch_cart(request.user)
+        repository.apply_operations(cart_id, operations)
+
+        return Response(repository.snapshot(request.user), status=status.HTTP_200_OK)
+
+
+class GuestCartAPIView(generics.GenericAPIView):
+    """
+    GET /api/cart/guest/   (X-Cart-Token: <token>)
+
+    Anonymous cart held in the cart cache store; never touches the database.
+    Unknown or expired tokens read as an empty cart.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        token = request.headers.get(guest.HEADER)
+        cart_key = guest.read_token(token)
+        data = guest.load(cart_key)
+        return Response(guest.representation(token if cart_key else None, data))
+
+
+class GuestCartBatchAPIView(generics.GenericAPIView):
+    """
+    POST /api/cart/guest/batch/   (X-Cart-Token: <token>, optional)
+
+    Same body as /api/cart/batch/. Issues a new token when none (or an invalid
+    one) is sent; clients should store the returned "cart_token".
+    """
+    permission_classes = [permissions.AllowAny]
+    serializer_class = CartBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        token = guest.token_from_request(request)
+        cart_key = guest.read_token(token)
+        if cart_key is None:
+            token = guest.issue_token()
+            cart_key = guest.read_token(token)
+
+        try:
+            data = guest.apply_operations(cart_key, serializer.validated_data["operations"])
+        except guest.CartBusy as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            raise ValidationError({"operations": str(e)})
+
+        return Response(guest.representation(token, data), status=status.HTTP_200_OK)
 
-        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -1,7 +1,10 @@
+import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
 import dj_database_url
+from corsheaders.defaults import default_headers
 from decouple import config
 
 # ------------------------------------------------------------
@@ -42,6 +45,10 @@ CORS_ALLOWED_ORIGIN_REGEXES = [
 
 CORS_ALLOW_CREDENTIALS = config("CORS_ALLOW_CREDENTIALS", default=False, cast=bool)
 
+# Guest carts are addressed by a signed token sent in X-Cart-Token;
+# order/payment POSTs accept Idempotency-Key for safe retries.
+CORS_ALLOW_HEADERS = (*default_headers, "x-cart-token", "idempotency-key")
+
 CSRF_TRUSTED_ORIGINS = [
     FRONTEND_URL,
     FRONTEND_URL.replace("://www.", "://"),
@@ -58,6 +65,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "django_filters",
     "rest_framework",
@@ -96,7 +104,7 @@ ROOT_URLCONF = "config.urls"
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
-        "DIRS": [BASE_DIR / "templates"],
+        "DIRS": [BASE_DIR / "templates", BASE_DIR / "tamplates"],
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -183,6 +191,54 @@ STORAGES = {
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 WHITENOISE_MANIFEST_STRICT = False
 
+# ------------------------------------------------------------
+# Cache
+# ------------------------------------------------------------
+# Local memory is per-process; point CACHE_BACKEND at a shared store
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.
+# The catalog version lives in Postgres either way, so catalog ETags agree
+# across workers; only the cached pages and hit counters are per process.
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="candles-default"),
+    },
+    # Guest carts. Every worker must see the same store, and it should drop the
+    # least recently used carts when full. The default is a directory shared by
+    # the workers on one host (cart.store, LRU cull). With several hosts use
+    # django.core.cache.backends.redis.RedisCache against a Redis with
+    # maxmemory-policy allkeys-lru. Not LocMemCache outside tests: it is per process.
+    "carts": {
+        "BACKEND": config("GUEST_CART_CACHE_BACKEND", default="cart.store.GuestCartFileCache"),
+        "LOCATION": config(
+            "GUEST_CART_CACHE_LOCATION", default=os.path.join(tempfile.gettempdir(), "candles-guest-carts")
+        ),
+        "TIMEOUT": config("GUEST_CART_TTL", default=60 * 60 * 24 * 7, cast=int),
+        "OPTIONS": {"MAX_ENTRIES": config("GUEST_CART_MAX_ENTRIES", default=100000, cast=int)},
+    },
+}
+
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", default=60, cast=int)
+CART_SUMMARY_TIMEOUT = config("CART_SUMMARY_TIMEOUT", default=300, cast=int)
+# Seconds the cart summary trusts its copy of the catalog version (price changes show up within this).
+CART_SUMMARY_CATALOG_CHECK = config("CART_SUMMARY_CATALOG_CHECK", default=5, cast=int)
+
+# ------------------------------------------------------------
+# Orders
+# ------------------------------------------------------------
+# "locking": SELECT ... FOR UPDATE on ordered candles for the whole checkout.
+# "conditional": no up-front locks; stock is taken with a guarded UPDATE at the end.
+INVENTORY_MODE = config("INVENTORY_MODE", default="locking")
+
+# Unpaid orders hold their stock this long; `manage.py release_reservations` cancels them after.
+STOCK_RESERVATION_MINUTES = config("STOCK_RESERVATION_MINUTES", default=30, cast=int)
+
+# How long a stored Idempotency-Key response is replayed to retries.
+IDEMPOTENCY_KEY_TTL_HOURS = config("IDEMPOTENCY_KEY_TTL_HOURS", default=24, cast=int)
+
+# Rows fetched per server-side cursor round trip by the staff order export.
+ORDER_EXPORT_CHUNK_SIZE = config("ORDER_EXPORT_CHUNK_SIZE", default=2000, cast=int)
+
 # ------------------------------------------------------------
 # DRF / Swagger
 # ------------------------------------------------------------
@@ -264,6 +320,23 @@ STRIPE_PUBLIC_KEY = config("STRIPE_PUBLIC_KEY", default="")
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY", default="")
 STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET", default="")
 
+# Payment gateway (orders.payments). "orders.payments.FakeGateway" runs without Stripe.
+PAYMENT_GATEWAY = config("PAYMENT_GATEWAY", default="orders.payments.StripeGateway")
+STRIPE_CONNECT_TIMEOUT = config("STRIPE_CONNECT_TIMEOUT", default=3.0, cast=float)
+STRIPE_READ_TIMEOUT = config("STRIPE_READ_TIMEOUT", default=10.0, cast=float)
+STRIPE_MAX_RETRIES = config("STRIPE_MAX_RETRIES", default=1, cast=int)
+STRIPE_POOL_SIZE = config("STRIPE_POOL_SIZE", default=10, cast=int)
+# Open the circuit after this many consecutive provider failures, for this many seconds.
+STRIPE_BREAKER_THRESHOLD = config("STRIPE_BREAKER_THRESHOLD", default=5, cast=int)
+STRIPE_BREAKER_RESET_SECONDS = config("STRIPE_BREAKER_RESET_SECONDS", default=30.0, cast=float)
+
+# Webhook inbox (orders.webhooks): failing events are retried this many times.
+WEBHOOK_MAX_ATTEMPTS = config("WEBHOOK_MAX_ATTEMPTS", default=5, cast=int)
+# Stored events are applied by a `manage.py drain_stripe_events --interval 1`
+# worker (the docker-compose "worker" service). Without one, set this to have
+# the webhook view apply up to that many pending events itself after storing one.
+WEBHOOK_INLINE_DRAIN_BATCH = config("WEBHOOK_INLINE_DRAIN_BATCH", default=0, cast=int)
+
 # ------------------------------------------------------------
 # Production security headers
 # ------------------------------------------------------------
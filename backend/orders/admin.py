@@ -1,11 +1,31 @@
-from django.contrib import admin
-from django.db.models import Count, DecimalField, F, Sum, Value
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import Count, DecimalField, Sum, Value
 from django.db.models.functions import Coalesce
-from django.db.models.expressions import ExpressionWrapper
 from django.http import HttpResponse
 from django.urls import path
+from django.utils.html import escape
 
-from .models import Order, OrderItem
+from . import rollup
+from .models import DailyOrderTotals, DailySales, Order, OrderItem
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+REPORT_PAGE_SIZE = 50
+REPORT_MAX_PAGE_SIZE = 500
+
+
+def _day(value):
+    try:
+        return rollup.parse_day(value)
+    except ValueError:
+        return None
+
+
+def _positive_int(value, default):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return default
 
 
 class OrderItemInline(admin.TabularInline):
@@ -23,14 +43,44 @@ class OrderItemInline(admin.TabularInline):
     line_total_display.short_description = "Line total"
 
 
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = "__all__"
+
+    def clean_status(self):
+        status = self.cleaned_data["status"]
+        order = self.instance
+        if order.pk and status != order.status and not order.can_transition(status):
+            raise forms.ValidationError(
+                f"An order cannot go from {order.get_status_display()} to {Order.Status(status).label}."
+            )
+        if order.pk and status != order.status and status == Order.Status.REFUNDED:
+            # The admin saves inside a transaction, so it cannot call the payment provider.
+            raise forms.ValidationError(
+                "Refund the order with PATCH /api/orders/<id>/status/, which returns the payment first."
+            )
+        return status
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ("id", "user", "status", "total_amount", "currency", "created_at")
-    list_filter = ("status", "currency", "created_at")
+    list_filter = ("status", "needs_refund", "currency", "created_at")
     search_fields = ("id", "user__email", "stripe_payment_intent_id")
     date_hierarchy = "created_at"
     ordering = ("-created_at",)
-    readonly_fields = ("total_amount", "stripe_payment_intent_id", "created_at", "updated_at")
+    readonly_fields = (
+        "total_amount",
+        "stripe_payment_intent_id",
+        "reserved_until",
+        "stock_released",
+        "reservation_expired",
+        "refund_requested_at",
+        "created_at",
+        "updated_at",
+    )
     inlines = (OrderItemInline,)
 
     def get_urls(self):
@@ -44,58 +94,95 @@ class OrderAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
-    def reports_view(self, request):
-        qs = Order.objects.all()
-
-        date_from = request.GET.get("from")
-        date_to = request.GET.get("to")
+    def save_model(self, request, obj, form, change):
+        if not (change and "status" in form.changed_data):
+            super().save_model(request, obj, form, change)
+            return
+        # Save only the other edited fields, so a status the order reached since
+        # the form was loaded is not written back, then go through transition_to()
+        # so the rollups, the paid hooks and the stock release run as for the API.
+        other_fields = [name for name in form.changed_data if name != "status"]
+        if other_fields:
+            obj.save(update_fields=other_fields + ["updated_at"])
+        try:
+            obj.transition_to(obj.status)
+        except ValueError as e:
+            self.message_user(request, f"Status not changed: {e}", messages.ERROR)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            # Items are inlines, so a new order only has its lines once they are saved.
+            rollup.record_new_orders([form.instance.pk])
+
+    def delete_model(self, request, obj):
+        rollup.record_removed_orders([obj.pk])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        rollup.record_removed_orders(queryset.values_list("id", flat=True))
+        super().delete_queryset(request, queryset)
 
+    def reports_view(self, request):
+        """
+        Totals and per-product revenue come from the daily rollups (orders.rollup),
+        so they cost the same whatever the size of the order history. The per-user
+        table is still a live query, bounded by a created_at range and a page.
+        """
+        date_from = _day(request.GET.get("from"))
+        date_to = _day(request.GET.get("to"))
+        status = request.GET.get("status")
+        if status not in Order.Status.values:
+            status = None
+        limit = min(_positive_int(request.GET.get("limit"), REPORT_PAGE_SIZE), REPORT_MAX_PAGE_SIZE)
+        page = _positive_int(request.GET.get("page"), 1)
+        offset = (page - 1) * limit
+
+        days = {}
         if date_from:
-            qs = qs.filter(created_at__date__gte=date_from)
+            days["day__gte"] = date_from
         if date_to:
-            qs = qs.filter(created_at__date__lte=date_to)
+            days["day__lte"] = date_to
+        if status:
+            days["status"] = status
 
-        totals = qs.aggregate(
-            orders_count=Count("id"),
-            revenue=Coalesce(
-                Sum("total_amount"),
-                Value(0, output_field=DecimalField(max_digits=12, decimal_places=2)),
-            ),
+        totals = DailyOrderTotals.objects.filter(**days).aggregate(
+            orders_count=Coalesce(Sum("orders"), Value(0)),
+            revenue=Coalesce(Sum("revenue"), Value(0, output_field=MONEY)),
         )
 
-        by_user = (
-            qs.values("user__id", "user__email")
-            .annotate(
-                orders=Count("id"),
-                revenue=Coalesce(
-                    Sum("total_amount"),
-                    Value(0, output_field=DecimalField(max_digits=12, decimal_places=2)),
-                ),
-            )
-            .order_by("-revenue")
+        by_product = (
+            DailySales.objects.filter(**days)
+            .exclude(orders=0)
+            .values("candle__id", "candle__name")
+            .annotate(qty=Sum("units"), revenue=Sum("revenue"))
+            .filter(qty__gt=0)
+            .order_by("-revenue", "candle__id")[offset:offset + limit]
         )
 
-        items_qs = OrderItem.objects.select_related("order", "candle").filter(order__in=qs)
+        start, end = rollup.day_bounds(date_from, date_to)
+        orders = Order.objects.all()
+        if start:
+            orders = orders.filter(created_at__gte=start)
+        if end:
+            orders = orders.filter(created_at__lt=end)
+        if status:
+            orders = orders.filter(status=status)
 
-        line_total_expr = ExpressionWrapper(
-            F("unit_price") * F("quantity"),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        )
-
-        by_product = (
-            items_qs.values("candle__id", "candle__name")
+        by_user = (
+            orders.values("user__id", "user__email")
             .annotate(
-                qty=Coalesce(Sum("quantity"), Value(0)),
-                revenue=Coalesce(
-                    Sum(line_total_expr),
-                    Value(0, output_field=DecimalField(max_digits=12, decimal_places=2)),
-                ),
+                orders=Count("id"),
+                revenue=Coalesce(Sum("total_amount"), Value(0, output_field=MONEY)),
             )
-            .order_by("-revenue")
+            .order_by("-revenue", "user__id")[offset:offset + limit]
         )
 
         html = ["<h1>Orders Reports</h1>"]
-        html.append("<p><b>Filter:</b> ?from=YYYY-MM-DD&to=YYYY-MM-DD</p>")
+        html.append(
+            "<p><b>Filter:</b> ?from=YYYY-MM-DD&amp;to=YYYY-MM-DD&amp;status=&lt;status&gt;"
+            "&amp;limit=N&amp;page=N</p>"
+        )
         html.append(f"<p><b>Orders:</b> {totals['orders_count']} &nbsp; <b>Revenue:</b> {totals['revenue']}</p>")
 
         html.append("<h2>Revenue by user</h2>")
@@ -103,7 +190,7 @@ class OrderAdmin(admin.ModelAdmin):
         html.append("<tr><th>User</th><th>Orders</th><th>Revenue</th></tr>")
         for row in by_user:
             html.append(
-                f"<tr><td>{row['user__email'] or row['user__id']}</td><td>{row['orders']}</td><td>{row['revenue']}</td></tr>"
+                f"<tr><td>{escape(row['user__email'] or row['user__id'])}</td><td>{row['orders']}</td><td>{row['revenue']}</td></tr>"
             )
         html.append("</table>")
 
@@ -112,10 +199,19 @@ class OrderAdmin(admin.ModelAdmin):
         html.append("<tr><th>Product</th><th>Qty sold</th><th>Revenue</th></tr>")
         for row in by_product:
             html.append(
-                f"<tr><td>{row['candle__name'] or row['candle__id']}</td><td>{row['qty']}</td><td>{row['revenue']}</td></tr>"
+                f"<tr><td>{escape(row['candle__name'] or row['candle__id'])}</td><td>{row['qty']}</td><td>{row['revenue']}</td></tr>"
             )
         html.append("</table>")
 
+        query = request.GET.copy()
+        links = []
+        if page > 1:
+            query["page"] = page - 1
+            links.append(f"<a href='?{escape(query.urlencode())}'>&larr; Previous</a>")
+        query["page"] = page + 1
+        links.append(f"<a href='?{escape(query.urlencode())}'>Next &rarr;</a>")
+        html.append(f"<p>Page {page} &nbsp; {' &nbsp; '.join(links)}</p>")
+
         return HttpResponse("".join(html))
 
 
@@ -0,0 +1,189 @@
+# backend/orders/idempotency.py
+"""
+Idempotency-Key support for non-idempotent POST endpoints.
+
+A client that may retry sends `Idempotency-Key: <unique value>`. The first
+request with a key inserts an IdempotencyKey row and runs the view in the
+same transaction; its response is stored on that row before commit.
+
+- A retry after that commit finds the row and gets the stored response
+  replayed (marked with `Idempotent-Replayed: true`) without touching
+  orders, stock or Stripe.
+- A duplicate arriving while the first is still running blocks on the
+  row's unique index until the first transaction ends, then replays.
+- If the first request fails (an exception or a 4xx/5xx response), its
+  transaction and the key row roll back, so the retry runs normally.
+- Reusing a key with a different payload is rejected with 422.
+
+Views that call an external service (the payment gateway) use
+`atomic=False` instead, so no transaction or row lock is held while the
+call is in flight. The key row is inserted and committed first, with no
+response, as an in-flight marker; the view then runs in autocommit mode:
+
+- a duplicate that finds the marker gets 409 with Retry-After rather than
+  blocking, and a marker older than IN_FLIGHT_TIMEOUT (the worker died)
+  is taken over by the next request;
+- on success the response is stored on the row; on a failure the row is
+  deleted so the retry runs normally. Such views must make the external
+  call itself idempotent (e.g. a gateway idempotency key), since a crash
+  after the call leaves it to be repeated.
+
+Keys are scoped per user by default (views that run before authentication
+pass their own `scope`) and expire after IDEMPOTENCY_KEY_TTL_HOURS;
+`manage.py purge_idempotency_keys` deletes expired rows.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# With atomic=False: age after which an unanswered key is treated as abandoned.
+IN_FLIGHT_TIMEOUT = timedelta(minutes=5)
+
+
+def _is_drf(request):
+    return hasattr(request, "data")
+
+
+def _reply(request, data, status, headers=None):
+    if _is_drf(request):
+        return Response(data, status=status, headers=headers)
+    response = JsonResponse(data, status=status, safe=False)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def user_scope(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return "anon"
+
+
+def _fingerprint(request):
+    if _is_drf(request):
+        payload = json.dumps(request.data, sort_keys=True, default=str)
+    else:
+        payload = request.body.decode("utf-8", "replace")
+    raw = f"{request.method}\n{request.path}\n{payload}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _response_body(response):
+    if hasattr(response, "data"):
+        return response.data
+    try:
+        return json.loads(response.content or b"null")
+    except ValueError:
+        return None
+
+
+def _replay(request, stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        return _reply(request, {"detail": f"{HEADER} was already used with a different request."}, 422)
+    return _reply(request, stored.response_body, stored.response_status, headers={"Idempotent-Replayed": "true"})
+
+
+def _claim(key_scope, key, fingerprint, now):
+    """Delete an expired row for the key and insert a fresh one; None if the key is taken."""
+    IdempotencyKey.objects.filter(scope=key_scope, key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                scope=key_scope,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+            )
+    except IntegrityError:
+        return None
+
+
+def _save_response(record, response):
+    record.response_status = response.status_code
+    record.response_body = _response_body(response)
+    record.save(update_fields=["response_status", "response_body"])
+
+
+def idempotent(view=None, *, scope=user_scope, atomic=True):
+    """
+    Decorate a view function or a DRF view method (self, request, ...).
+    `scope(request)` returns the namespace the keys live in (at most 64 chars).
+    `atomic=False` runs the view outside the key's transaction (see above).
+    """
+    if view is None:
+        return functools.partial(idempotent, scope=scope, atomic=atomic)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[1] if len(args) > 1 else args[0]
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _reply(request, {"detail": f"{HEADER} is too long."}, 400)
+
+        key_scope = scope(request)
+        fingerprint = _fingerprint(request)
+        now = timezone.now()
+
+        if not atomic:
+            return _run_detached(view, args, kwargs, request, key_scope, key, fingerprint, now)
+
+        with transaction.atomic():
+            # Blocks here while another request holding the same key is in flight.
+            record = _claim(key_scope, key, fingerprint, now)
+            if record is None:
+                return _replay(request, IdempotencyKey.objects.get(scope=key_scope, key=key), fingerprint)
+
+            response = view(*args, **kwargs)
+            if response.status_code >= 400:
+                # Only successes are replayed; a failed attempt frees the key for a retry.
+                transaction.set_rollback(True)
+                return response
+
+            _save_response(record, response)
+            return response
+
+    return wrapper
+
+
+def _run_detached(view, args, kwargs, request, key_scope, key, fingerprint, now):
+    with transaction.atomic():
+        record = _claim(key_scope, key, fingerprint, now)
+        if record is None:
+            stored = IdempotencyKey.objects.select_for_update().get(scope=key_scope, key=key)
+            if stored.response_status is not None or stored.fingerprint != fingerprint:
+                return _replay(request, stored, fingerprint)
+            if stored.created_at > now - IN_FLIGHT_TIMEOUT:
+                return _reply(
+                    request,
+                    {"detail": f"A request with this {HEADER} is still in progress."},
+                    409,
+                    headers={"Retry-After": "1"},
+                )
+            stored.created_at = now
+            stored.save(update_fields=["created_at"])
+            record = stored
+
+    try:
+        response = view(*args, **kwargs)
+    except Exception:
+        record.delete()
+        raise
+    if response.status_code >= 400:
+        record.delete()
+        return response
+    _save_response(record, response)
+    return response
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import webhooks
+
+
+class Command(BaseCommand):
+    help = "Apply Stripe webhook events stored in the inbox to their orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, polling the inbox every N seconds once it is empty.",
+        )
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=7,
+            help="Delete processed events older than this many days after each pass (0 keeps them).",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be >= 1.")
+
+        while True:
+            started = time.monotonic()
+            processed = webhooks.drain(batch_size=options["batch_size"])
+            elapsed = time.monotonic() - started
+            if processed or not options["interval"]:
+                stats = webhooks.stats()
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Processed {processed} events in {elapsed:.1f}s "
+                        f"({processed / elapsed if elapsed else processed:.0f} events/sec); "
+                        f"pending {stats['pending']}, failed {stats['failed']}, lag {stats['lag_seconds']}s"
+                    )
+                )
+            if options["keep_days"]:
+                webhooks.purge(options["keep_days"])
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import CharField, Q, Value
+from django.db.models.functions import Cast, Concat
+from django.test import RequestFactory
+
+from orders.models import Order
+from orders.views_stripe import stripe_webhook
+
+
+def sign(payload: bytes, secret: str) -> str:
+    """A Stripe-Signature header value that stripe.Webhook.construct_event accepts for `secret`."""
+    timestamp = int(time.time())
+    signed = f"{timestamp}.".encode() + payload
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Send signed fake payment_intent webhook events for pending orders, for load testing "
+        "the webhook inbox. Posts in-process by default, or to a running server with --url. "
+        "It rewrites the payment intent ids of the orders it picks and the events pay or cancel "
+        "them, so it only runs with DEBUG unless --i-know is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1000, help="Number of orders to send events for.")
+        parser.add_argument("--failed-ratio", type=float, default=0.1)
+        parser.add_argument(
+            "--duplicate-ratio",
+            type=float,
+            default=0.2,
+            help="Share of events delivered a second time, like Stripe's retries.",
+        )
+        parser.add_argument("--url", help="Webhook URL of a running server, e.g. http://localhost:8000/api/orders/webhook/")
+        parser.add_argument("--concurrency", type=int, default=8, help="Parallel requests with --url.")
+        parser.add_argument("--seed", type=int)
+        parser.add_argument(
+            "--i-know",
+            action="store_true",
+            help="Run even though DEBUG is off (the pending orders it picks will be paid or canceled).",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["i_know"]:
+            raise CommandError(
+                "Refusing to run with DEBUG off: this pays or cancels real pending orders. "
+                "Pass --i-know to run anyway."
+            )
+        if options["count"] < 1:
+            raise CommandError("--count must be >= 1.")
+        rng = random.Random(options["seed"])
+        secret = settings.STRIPE_WEBHOOK_SECRET
+
+        ids = list(
+            Order.objects.filter(status=Order.Status.PENDING)
+            .order_by("id")
+            .values_list("id", flat=True)[: options["count"]]
+        )
+        if not ids:
+            raise CommandError("No pending orders to send events for.")
+        # Orders that never reached create-intent get a fake intent id to match against.
+        Order.objects.filter(Q(stripe_payment_intent_id="") | Q(stripe_payment_intent_id__isnull=True), id__in=ids).update(
+            stripe_payment_intent_id=Concat(Value("pi_fake_"), Cast("id", CharField()))
+        )
+        intents = dict(Order.objects.filter(id__in=ids).values_list("id", "stripe_payment_intent_id"))
+
+        payloads = []
+        for order_id in ids:
+            event_type = (
+                "payment_intent.payment_failed"
+                if rng.random() < options["failed_ratio"]
+                else "payment_intent.succeeded"
+            )
+            event = {
+                "id": f"evt_fake_{uuid.uuid4().hex}",
+                "object": "event",
+                "type": event_type,
+                "data": {
+                    "object": {
+                        "id": intents[order_id],
+                        "object": "payment_intent",
+                        "metadata": {"order_id": str(order_id)},
+                    }
+                },
+            }
+            payloads.append(json.dumps(event).encode())
+        payloads += [p for p in payloads if rng.random() < options["duplicate_ratio"]]
+        rng.shuffle(payloads)
+
+        send = self.poster(options["url"], secret) if options["url"] else self.in_process(secret)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["concurrency"] if options["url"] else 1) as pool:
+            results = list(pool.map(send, payloads))
+        elapsed = time.monotonic() - started
+
+        statuses = {}
+        for status_code, _ in results:
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+        latencies = sorted(latency for _, latency in results)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {len(payloads)} events for {len(ids)} orders in {elapsed:.1f}s "
+                f"({len(payloads) / elapsed if elapsed else len(payloads):.0f} events/sec); "
+                f"responses {statuses}; p50 {p50:.1f} ms, p99 {p99:.1f} ms"
+            )
+        )
+
+    def in_process(self, secret):
+        factory = RequestFactory()
+
+        def send(payload):
+            request = factory.post(
+                "/api/orders/webhook/",
+                data=payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=sign(payload, secret),
+            )
+            started = time.monotonic()
+            response = stripe_webhook(request)
+            return response.status_code, time.monotonic() - started
+
+        return send
+
+    def poster(self, url, secret):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=32)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        def send(payload):
+            started = time.monotonic()
+            response = session.post(
+                url,
+                data=payload,
+                headers={"Content-Type": "application/json", "Stripe-Signature": sign(payload, secret)},
+                timeout=10,
+            )
+            return response.status_code, time.monotonic() - started
+
+        return send
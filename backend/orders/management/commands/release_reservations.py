@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import reservations
+
+
+class Command(BaseCommand):
+    help = "Cancel PENDING orders whose stock reservation has expired and return their units to stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running, sweeping every N seconds.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be >= 1.")
+
+        while True:
+            started = time.monotonic()
+            expired = reservations.expire_reservations(
+                batch_size=options["batch_size"],
+                progress=lambda done: self.stdout.write(f"{done} orders expired"),
+            )
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Expired {expired} orders in {elapsed:.1f}s "
+                    f"({expired / elapsed if elapsed else expired:.0f} orders/sec)"
+                )
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-17 01:37
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def reserve_pending_orders(apps, schema_editor):
+    # Orders placed before reservations existed get the default window from their creation time.
+    Order = apps.get_model("orders", "Order")
+    Order.objects.filter(status="pending", reserved_until__isnull=True).update(
+        reserved_until=F("created_at") + timedelta(minutes=30)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_shipping_amount_order_shipping_city_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='stock_released',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(reserve_pending_orders, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['reserved_until'], name='order_pending_reserved_idx'),
+        ),
+    ]
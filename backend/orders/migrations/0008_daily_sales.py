@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-17 01:40
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    # Same aggregation as orders.rollup.rebuild(), over the whole history.
+    tables = {
+        name: apps.get_model("orders", name)._meta.db_table
+        for name in ("DailySales", "DailyOrderTotals", "Order", "OrderItem")
+    }
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {DailySales} (day, candle_id, status, orders, units, revenue)
+            SELECT (o.created_at AT TIME ZONE %s)::date, i.candle_id, o.status,
+                   COUNT(DISTINCT o.id), SUM(i.quantity), SUM(i.unit_price * i.quantity)
+            FROM {Order} o JOIN {OrderItem} i ON i.order_id = o.id
+            GROUP BY 1, 2, 3
+            """.format(**tables),
+            [settings.TIME_ZONE],
+        )
+        cursor.execute(
+            """
+            INSERT INTO {DailyOrderTotals} (day, status, orders, revenue)
+            SELECT (o.created_at AT TIME ZONE %s)::date, o.status, COUNT(*), SUM(o.total_amount)
+            FROM {Order} o
+            GROUP BY 1, 2
+            """.format(**tables),
+            [settings.TIME_ZONE],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candles', '0010_back_in_stock'),
+        ('orders', '0007_order_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('canceled', 'Canceled'), ('shipped', 'Shipped'), ('completed', 'Completed'), ('refunded', 'Refunded')], max_length=20)),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='daily_order_totals_day_status_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('canceled', 'Canceled'), ('shipped', 'Shipped'), ('completed', 'Completed'), ('refunded', 'Refunded')], max_length=20)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('candle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='candles.candle')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'candle', 'status'), name='daily_sales_day_candle_status_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_stripe_event_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='needs_refund',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='reservation_expired',
+            field=models.BooleanField(default=False),
+        ),
+    ]
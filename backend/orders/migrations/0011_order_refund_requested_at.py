@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_needs_refund'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='refund_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
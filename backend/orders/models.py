@@ -1,7 +1,8 @@
 from decimal import Decimal
 
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 
 
 class Order(models.Model):
@@ -63,17 +64,40 @@ class Order(models.Model):
     stripe_payment_intent_id = models.CharField(max_length=255, blank=True, default="")
     stripe_tax_calculation_id = models.CharField(max_length=255, blank=True, default="")
 
+    # Stock is taken when the order is placed. A PENDING order holds it until
+    # reserved_until; after that the reservation sweeper cancels the order.
+    reserved_until = models.DateTimeField(null=True, blank=True)
+    # Set once the order's units have gone back to stock (cancel, refund or expiry).
+    stock_released = models.BooleanField(default=False)
+    # Set when the reservation sweeper (not staff or a failed payment) canceled the order.
+    reservation_expired = models.BooleanField(default=False)
+    # A payment succeeded for an order that cannot take it (canceled by staff,
+    # refunded, or its stock is gone). Staff refund it in Stripe and clear the flag.
+    needs_refund = models.BooleanField(default=False)
+    # Set, and committed, before a refund goes to the payment provider; until
+    # then the order can only move to REFUNDED (see OrderStatusUpdateAPIView).
+    refund_requested_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=["user"]),
+            # Order history: WHERE user = ? ORDER BY created_at DESC, id DESC, seeking by cursor.
+            models.Index(fields=["user", "-created_at", "-id"], name="order_user_created_idx"),
             models.Index(fields=["status"]),
             models.Index(fields=["created_at"]),
+            models.Index(
+                fields=["reserved_until"],
+                condition=models.Q(status="pending"),
+                name="order_pending_reserved_idx",
+            ),
         ]
         ordering = ["-created_at"]
 
+    # Statuses that count as a completed sale for reporting and ranking.
+    PAID_STATUSES = (Status.PAID, Status.SHIPPED, Status.COMPLETED)
+
     ALLOWED_TRANSITIONS = {
         Status.PENDING: {Status.PAID, Status.CANCELED},
         Status.PAID: {Status.SHIPPED, Status.REFUNDED},
@@ -84,13 +108,55 @@ class Order(models.Model):
     }
 
     def can_transition(self, new_status: str) -> bool:
+        if self.refund_requested_at and new_status != self.Status.REFUNDED:
+            return False
         return new_status in self.ALLOWED_TRANSITIONS.get(self.status, set())
 
-    def transition_to(self, new_status: str):
+    # Transitions that hand the order's units back to inventory.
+    RESTOCK_STATUSES = (Status.CANCELED, Status.REFUNDED)
+
+    @transaction.atomic
+    def transition_to(self, new_status: str) -> bool:
+        """
+        Move to `new_status` and run its side effects. The row is locked and its
+        status re-read first, so an instance loaded before a concurrent change
+        (staff, webhook, expiry sweep) cannot apply a transition twice. Returns
+        False, doing nothing, if the order is already in `new_status`.
+        """
+        locked = Order.objects.select_for_update().only("status", "stock_released", "refund_requested_at").get(
+            pk=self.pk
+        )
+        self.status, self.stock_released = locked.status, locked.stock_released
+        self.refund_requested_at = locked.refund_requested_at
+        if self.status == new_status:
+            return False
         if not self.can_transition(new_status):
             raise ValueError(f"Cannot transition from {self.status} to {new_status}")
+        from . import rollup
+
+        old_status = self.status
         self.status = new_status
-        self.save(update_fields=["status"])
+        self.save(update_fields=["status", "updated_at"])
+        rollup.record_transition([self.pk], old_status, new_status)
+        if new_status == self.Status.PAID:
+            self.on_paid()
+        elif new_status in self.RESTOCK_STATUSES:
+            from .reservations import release_stock
+
+            if release_stock([self.pk]):
+                self.stock_released = True
+        return True
+
+    def on_paid(self):
+        self.record_paid([self.pk])
+
+    @staticmethod
+    def record_paid(order_ids):
+        """Feed orders that just became paid into recommendations and sales ranks."""
+        from candles import ranking, recommendations
+
+        recommendations.record_paid_orders(order_ids)
+        ranking.record_paid_orders(order_ids)
 
     def __str__(self) -> str:
         return f"Order #{self.id} ({self.status})"
@@ -117,4 +183,81 @@ class OrderItem(models.Model):
         return (self.unit_price or Decimal("0.00")) * Decimal(self.quantity or 0)
 
     def __str__(self) -> str:
-        return f"{self.product_name} x{self.quantity}"
\ No newline at end of file
+        return f"{self.product_name} x{self.quantity}"
+
+
+class IdempotencyKey(models.Model):
+    """First response for an Idempotency-Key, replayed to retries (see orders.idempotency)."""
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_scope_key_uniq"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.scope}:{self.key}"
+
+
+class DailySales(models.Model):
+    """
+    Units and line revenue per day (of order creation), candle and order status.
+    Maintained by orders.rollup as orders are placed and change status.
+    """
+    day = models.DateField()
+    candle = models.ForeignKey("candles.Candle", on_delete=models.CASCADE, related_name="daily_sales")
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "candle", "status"], name="daily_sales_day_candle_status_uniq"),
+        ]
+
+
+class DailyOrderTotals(models.Model):
+    """Order count and order revenue (total_amount, incl. shipping/tax) per day and status."""
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "status"], name="daily_order_totals_day_status_uniq"),
+        ]
+
+
+
+class StripeEvent(models.Model):
+    """
+    Webhook inbox: verified Stripe events, stored by the webhook view and
+    applied later by orders.webhooks.drain (`manage.py drain_stripe_events`).
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                name="stripe_event_pending_idx",
+                condition=models.Q(processed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.type} {self.event_id}"
@@ -0,0 +1,13 @@
+# backend/orders/pagination.py
+from candles.pagination import CandleKeysetPagination
+
+
+class OrderKeysetPagination(CandleKeysetPagination):
+    """
+    Opt-in keyset pagination for order lists: `?page_size=` or `?cursor=`
+    switches from the plain list to pages seeking on (created_at, id).
+    """
+
+    page_size = 20
+    ordering = ("-created_at",)
+    tiebreakers = {}
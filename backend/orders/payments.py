@@ -0,0 +1,243 @@
+# backend/orders/payments.py
+"""
+Payment gateway used by the checkout and refund paths.
+
+Views never call the Stripe library directly; they go through get_gateway(),
+which returns the class named by settings.PAYMENT_GATEWAY:
+
+- StripeGateway (default) keeps one StripeClient per process on a pooled
+  requests.Session, with STRIPE_CONNECT_TIMEOUT / STRIPE_READ_TIMEOUT on
+  every call and at most STRIPE_MAX_RETRIES network retries (the library
+  adds idempotency keys, so a retried POST cannot charge twice). A
+  CircuitBreaker in front of it fails fast with GatewayUnavailable after
+  STRIPE_BREAKER_THRESHOLD consecutive provider failures, instead of letting
+  every checkout wait out the timeouts while Stripe is degraded.
+- FakeGateway answers in-process, with optional latency and failures, for
+  local development, tests and benchmarks.
+
+Gateways raise PaymentError for requests the provider rejected (card errors,
+invalid amounts) and GatewayUnavailable when it could not be reached.
+"""
+import random
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+import requests
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PaymentError(Exception):
+    """The provider rejected the request; retrying it will not help."""
+
+
+class GatewayUnavailable(PaymentError):
+    """The provider timed out, failed, or the circuit breaker is open. Safe to retry later."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `threshold` failures in a row the
+    circuit opens and calls are refused for `reset_timeout` seconds; then a
+    single trial call is let through, which closes the circuit on success or
+    reopens it on failure. State is per process.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        """Raise GatewayUnavailable if the call must not go out."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return
+            retry_after = max(self.reset_timeout - (self.clock() - self.opened_at), 1)
+            raise GatewayUnavailable("Payment provider is unavailable; try again shortly.", retry_after=retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+    def call(self, fn, *args, **kwargs):
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except PaymentError as e:
+            if isinstance(e, GatewayUnavailable):
+                self.record_failure()
+            else:
+                # A rejected request still proves the provider is up.
+                self.record_success()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Interrupted (KeyboardInterrupt, SystemExit): not the provider's fault,
+            # but a half-open trial slot must be given back.
+            with self._lock:
+                self.trial_running = False
+            raise
+        self.record_success()
+        return result
+
+
+def _provider_failed(error):
+    if isinstance(error, (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError)):
+        return True
+    return (error.http_status or 0) >= 500
+
+
+class StripeGateway:
+    def __init__(self, api_key, connect_timeout=3.0, read_timeout=10.0, max_retries=1, pool_size=10, breaker=None):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        self.client = stripe.StripeClient(
+            api_key,
+            http_client=stripe.RequestsClient(timeout=(connect_timeout, read_timeout), session=session),
+            max_network_retries=max_retries,
+        )
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.STRIPE_SECRET_KEY,
+            connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+            read_timeout=settings.STRIPE_READ_TIMEOUT,
+            max_retries=settings.STRIPE_MAX_RETRIES,
+            pool_size=settings.STRIPE_POOL_SIZE,
+            breaker=CircuitBreaker(settings.STRIPE_BREAKER_THRESHOLD, settings.STRIPE_BREAKER_RESET_SECONDS),
+        )
+
+    def _request(self, fn, params, idempotency_key=None):
+        options = {"idempotency_key": idempotency_key} if idempotency_key else {}
+
+        def send():
+            try:
+                return fn(params=params, options=options)
+            except stripe.StripeError as e:
+                if _provider_failed(e):
+                    raise GatewayUnavailable(f"Payment provider error: {e.user_message or e}") from e
+                raise PaymentError(e.user_message or str(e)) from e
+
+        return self.breaker.call(send)
+
+    def create_payment_intent(self, amount, currency, metadata=None, idempotency_key=None):
+        """amount in the currency's minor unit. Returns {"id", "client_secret"}."""
+        intent = self._request(
+            self.client.v1.payment_intents.create,
+            {"amount": amount, "currency": currency, "metadata": metadata or {}},
+            idempotency_key,
+        )
+        return {"id": intent.id, "client_secret": intent.client_secret}
+
+    def refund(self, payment_intent_id, amount=None, idempotency_key=None):
+        """Refund a payment intent, fully unless `amount` is given. Returns {"id", "status"}."""
+        params = {"payment_intent": payment_intent_id}
+        if amount is not None:
+            params["amount"] = amount
+        refund = self._request(self.client.v1.refunds.create, params, idempotency_key)
+        return {"id": refund.id, "status": refund.status}
+
+
+class FakeGateway:
+    """
+    In-process stand-in for StripeGateway. `latency` (seconds) is slept on
+    every call; `failure_rate` of calls raise GatewayUnavailable, through
+    the same circuit breaker as the real gateway. Calls are kept in `calls`.
+    Repeated idempotency keys return the first result, like Stripe.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, breaker=None, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.breaker = breaker or CircuitBreaker()
+        self.calls = []
+        self._results = {}
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            breaker=CircuitBreaker(settings.STRIPE_BREAKER_THRESHOLD, settings.STRIPE_BREAKER_RESET_SECONDS),
+        )
+
+    def _request(self, name, params, idempotency_key, build):
+        def send():
+            self.calls.append((name, params))
+            if self.latency:
+                time.sleep(self.latency)
+            if self._random.random() < self.failure_rate:
+                raise GatewayUnavailable("Fake payment provider failure.")
+            if idempotency_key and (name, idempotency_key) in self._results:
+                return self._results[(name, idempotency_key)]
+            result = build()
+            if idempotency_key:
+                self._results[(name, idempotency_key)] = result
+            return result
+
+        return self.breaker.call(send)
+
+    def create_payment_intent(self, amount, currency, metadata=None, idempotency_key=None):
+        if amount <= 0:
+            raise PaymentError("Amount must be positive.")
+        params = {"amount": amount, "currency": currency, "metadata": metadata or {}}
+
+        def build():
+            intent_id = f"pi_fake_{uuid.uuid4().hex[:24]}"
+            return {"id": intent_id, "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:12]}"}
+
+        return self._request("create_payment_intent", params, idempotency_key, build)
+
+    def refund(self, payment_intent_id, amount=None, idempotency_key=None):
+        params = {"payment_intent": payment_intent_id, "amount": amount}
+        return self._request(
+            "refund",
+            params,
+            idempotency_key,
+            lambda: {"id": f"re_fake_{uuid.uuid4().hex[:24]}", "status": "succeeded"},
+        )
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    """The process-wide gateway from settings.PAYMENT_GATEWAY (get_gateway.cache_clear() to rebuild)."""
+    return import_string(settings.PAYMENT_GATEWAY).from_settings()
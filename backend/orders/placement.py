@@ -0,0 +1,176 @@
+# backend/orders/placement.py
+"""
+Order placement in a fixed number of statements.
+
+Both checkout paths (explicit items and server cart) go through
+place_order(), which, whatever the number of lines, issues:
+
+1. one SELECT ... FOR UPDATE of the ordered candles,
+2. one INSERT of the order with its totals already computed,
+3. one bulk INSERT of the order items,
+4. one UPDATE ... FROM (VALUES ...) that takes the stock and refreshes in_stock.
+
+The two upserts that add the order to the daily sales rollups (orders.rollup)
+run after commit, in their own short transaction: every checkout of the day
+hits the same rollup rows, so holding their locks until the checkout commits
+would queue checkouts behind each other. The order is added to the bucket it
+was created in, so a status change that lands first still nets out.
+
+The stock UPDATE skips Candle.save on purpose: it only touches stock_qty and
+in_stock, so slugs and search vectors never need recomputing here. It locks
+the candle rows in id order before changing them, like the SELECT in step 1,
+and only bumps the catalog version when a candle sells out. A deadlock that
+still happens (against another statement's lock order) is answered with 409
+StockConflict so the client can retry.
+
+settings.INVENTORY_MODE picks how concurrent checkouts are kept from
+overselling:
+
+- "locking" (default) locks the candle rows in step 1, so checkouts of the
+  same candle queue behind each other for the whole transaction;
+- "conditional" reads the candles without locks and runs step 4 last as a
+  guarded UPDATE (... AND stock_qty >= qty). If any line no longer fits,
+  the transaction rolls back. Row locks are then held only from that
+  statement to commit, which keeps a single hot candle from serializing
+  every checkout during a launch.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from candles.cache import bump_catalog_version
+from candles.models import Candle
+from . import rollup
+from .models import Order, OrderItem
+
+
+def merge_lines(items):
+    """[{"candle_id", "quantity"}, ...] -> {candle_id: total quantity}, summing duplicates."""
+    merged: dict[int, int] = {}
+    for i in items:
+        cid = int(i["candle_id"])
+        merged[cid] = merged.get(cid, 0) + int(i["quantity"])
+    return merged
+
+
+INVENTORY_MODES = ("locking", "conditional")
+
+# SQLSTATE deadlock_detected.
+DEADLOCK_DETECTED = "40P01"
+
+
+class StockConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Another checkout is updating the same candles; please retry."
+    default_code = "stock_conflict"
+
+
+def take_stock(quantities, guarded=False):
+    """
+    Decrement stock for {candle_id: quantity} in one statement.
+    With guarded=True only rows that still have enough stock are changed;
+    returns the ids that were decremented.
+    """
+    if not quantities:
+        return set()
+    pairs = sorted(quantities.items())
+    values = ", ".join(["(%s, %s)"] * len(pairs))
+    params = [p for pair in pairs for p in pair]
+    guard = "AND c.stock_qty >= v.qty" if guarded else ""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH v(id, qty) AS (VALUES {values}),
+            locked AS (
+                SELECT id FROM {candles} WHERE id IN (SELECT id FROM v) ORDER BY id FOR UPDATE
+            )
+            UPDATE {candles} c
+            SET stock_qty = c.stock_qty - v.qty,
+                in_stock = c.stock_qty - v.qty > 0
+            FROM v JOIN locked ON locked.id = v.id
+            WHERE c.id = v.id {guard}
+            RETURNING c.id, c.stock_qty
+            """.format(candles=Candle._meta.db_table, values=values, guard=guard),
+            params,
+        )
+        rows = cursor.fetchall()
+    # Stock counts in cached pages may lag by CATALOG_CACHE_TIMEOUT; availability may not.
+    if any(stock_qty == 0 for _, stock_qty in rows):
+        bump_catalog_version()
+    return {candle_id for candle_id, _ in rows}
+
+
+@transaction.atomic
+def place_order(user, quantities, error_field="items", **order_fields):
+    """
+    Create a PENDING order for {candle_id: quantity}, taking the stock and
+    holding it for STOCK_RESERVATION_MINUTES (see orders.reservations).
+    `order_fields` are passed to Order (shipping address, shipping/tax amounts).
+    Raises ValidationError keyed by `error_field` for unknown candles or short stock.
+    """
+    mode = settings.INVENTORY_MODE
+    if mode not in INVENTORY_MODES:
+        raise ImproperlyConfigured(f"INVENTORY_MODE must be one of {INVENTORY_MODES}, not {mode!r}.")
+    locking = mode == "locking"
+
+    candle_ids = list(quantities)
+    candles = Candle.objects.filter(id__in=candle_ids).only("id", "name", "price", "stock_qty").order_by("id")
+    if locking:
+        candles = candles.select_for_update()
+    candle_map = {c.id: c for c in candles}
+
+    if len(candle_map) != len(candle_ids):
+        missing = sorted(set(candle_ids) - set(candle_map.keys()))
+        raise ValidationError({error_field: f"Some candle_id do not exist: {missing}"})
+
+    subtotal = Decimal("0.00")
+    lines = []
+    for cid, qty in quantities.items():
+        candle = candle_map[cid]
+        # Without row locks this is only an early exit; the guarded UPDATE decides.
+        if candle.stock_qty < qty:
+            raise ValidationError({error_field: f"Not enough stock for: {candle.name} (id={cid})"})
+        subtotal += candle.price * qty
+        lines.append(
+            OrderItem(candle_id=cid, product_name=candle.name, unit_price=candle.price, quantity=qty)
+        )
+
+    shipping = order_fields.pop("shipping_amount", Decimal("0.00"))
+    tax = order_fields.pop("tax_amount", Decimal("0.00"))
+    order = Order.objects.create(
+        user=user,
+        status=Order.Status.PENDING,
+        currency="usd",
+        subtotal_amount=subtotal,
+        shipping_amount=shipping,
+        tax_amount=tax,
+        total_amount=subtotal + shipping + tax,
+        reserved_until=timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES),
+        **order_fields,
+    )
+
+    for line in lines:
+        line.order = order
+    OrderItem.objects.bulk_create(lines)
+
+    try:
+        taken = take_stock(quantities, guarded=not locking)
+    except OperationalError as e:
+        if getattr(e.__cause__, "pgcode", None) != DEADLOCK_DETECTED:
+            raise
+        raise StockConflict() from e
+    if len(taken) != len(quantities):
+        short = min(set(quantities) - taken)
+        # Raising inside the atomic block rolls back the order and every decrement.
+        raise ValidationError({error_field: f"Not enough stock for: {candle_map[short].name} (id={short})"})
+
+    status_at_creation = order.status
+    # robust: a failed rollup write is logged, not reported as a failed checkout (rebuild_daily_sales repairs it).
+    transaction.on_commit(lambda: rollup.record_new_orders([order.pk], status_at_creation), robust=True)
+    return order
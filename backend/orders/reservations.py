@@ -0,0 +1,150 @@
+# backend/orders/reservations.py
+"""
+Stock reservations for unpaid orders.
+
+place_order() takes stock immediately and stamps the order with
+reserved_until. From then on:
+
+- paying the order keeps the units sold;
+- cancelling or refunding it (Order.transition_to) calls release_stock();
+- expire_reservations(), run by `manage.py release_reservations`, cancels
+  PENDING orders past reserved_until (marking them reservation_expired) and
+  releases their stock in batches.
+
+release_stock() is set-based and idempotent: Order.stock_released is flipped
+in the same statement that selects which orders to restock, so a unit can
+never go back twice.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from candles.cache import bump_catalog_version
+from candles.models import Candle, record_restocks
+from . import rollup
+from .models import Order, OrderItem
+from .placement import take_stock
+
+logger = logging.getLogger(__name__)
+
+
+def _tables():
+    return {
+        "orders": Order._meta.db_table,
+        "items": OrderItem._meta.db_table,
+        "candles": Candle._meta.db_table,
+    }
+
+
+@transaction.atomic
+def release_stock(order_ids):
+    """Return the units of `order_ids` to stock. Returns the ids actually released."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return []
+
+    tables = _tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE {orders} SET stock_released = TRUE
+            WHERE id = ANY(%s) AND NOT stock_released
+            RETURNING id
+            """.format(**tables),
+            [order_ids],
+        )
+        released = [row[0] for row in cursor.fetchall()]
+        if not released:
+            return []
+
+        # Candle rows are locked in id order, as in placement.take_stock, so a
+        # release never deadlocks against a checkout of the same candles.
+        cursor.execute(
+            """
+            WITH s AS (
+                SELECT candle_id, SUM(quantity) AS qty
+                FROM {items}
+                WHERE order_id = ANY(%s)
+                GROUP BY candle_id
+            ),
+            locked AS (
+                SELECT id FROM {candles} WHERE id IN (SELECT candle_id FROM s) ORDER BY id FOR UPDATE
+            )
+            UPDATE {candles} c
+            SET stock_qty = c.stock_qty + s.qty,
+                in_stock = TRUE
+            FROM s JOIN locked ON locked.id = s.candle_id
+            WHERE c.id = s.candle_id
+            RETURNING c.id, c.stock_qty - s.qty
+            """.format(**tables),
+            [released],
+        )
+        restocked = [candle_id for candle_id, before in cursor.fetchall() if before == 0]
+
+    record_restocks(restocked)
+    if restocked:
+        bump_catalog_version()
+    return released
+
+
+def retake_stock(order):
+    """
+    Take stock again for an order whose reservation was released, e.g. a
+    payment that succeeded after the order expired. Returns False (and leaves
+    stock_released set for staff to resolve) if the units are gone.
+    """
+    quantities = dict(
+        order.items.values_list("candle_id").annotate(qty=Sum("quantity")).order_by()
+    )
+    try:
+        with transaction.atomic():
+            taken = take_stock(quantities, guarded=True)
+            if len(taken) != len(quantities):
+                raise ValidationError("Not enough stock.")
+    except ValidationError:
+        logger.warning("Order %s was paid after its stock was released; not enough stock to re-reserve.", order.pk)
+        return False
+
+    Order.objects.filter(pk=order.pk).update(stock_released=False)
+    order.stock_released = False
+    return True
+
+
+def expire_reservations(batch_size=1000, now=None, progress=None):
+    """
+    Cancel PENDING orders whose reservation ran out and release their stock,
+    batch_size orders per short transaction. Returns the number of orders expired.
+    """
+    now = now or timezone.now()
+    tables = _tables()
+    total = 0
+
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE {orders} SET status = %s, reservation_expired = TRUE, updated_at = %s
+                    WHERE id IN (
+                        SELECT id FROM {orders}
+                        WHERE status = %s AND reserved_until < %s
+                        ORDER BY reserved_until
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id
+                    """.format(**tables),
+                    [str(Order.Status.CANCELED), now, str(Order.Status.PENDING), now, batch_size],
+                )
+                expired = [row[0] for row in cursor.fetchall()]
+            release_stock(expired)
+            rollup.record_transition(expired, Order.Status.PENDING, Order.Status.CANCELED)
+
+        if not expired:
+            return total
+        total += len(expired)
+        if progress:
+            progress(total)
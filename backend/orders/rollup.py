@@ -0,0 +1,169 @@
+# backend/orders/rollup.py
+"""
+Daily sales rollups behind the admin reports.
+
+DailySales (day, candle, status) and DailyOrderTotals (day, status) hold what
+the reports used to aggregate from the full order history on every request.
+Days are the order's creation date in settings.TIME_ZONE, so an order stays
+on the same day for its whole life; only its status bucket moves.
+
+- record_new_orders() adds freshly placed orders to their status bucket
+  (placement calls it after commit, see orders.placement).
+- record_transition() / record_transitions() move orders from one status
+  bucket to another.
+- record_removed_orders() takes orders out again before they are deleted.
+- rebuild() recomputes a date range from the orders themselves
+  (`manage.py rebuild_daily_sales`), for backfills and repairs.
+
+Every change is one upsert per table, whatever the number of orders. The
+upserts touch rollup rows in key order, so concurrent writers (several
+webhook drains, say) queue on a row instead of deadlocking; a caller that
+moves orders more than once in a transaction should batch the moves into
+one record_transitions() call to keep that ordering.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DailyOrderTotals, DailySales, Order, OrderItem
+
+
+def _tables():
+    return {
+        "sales": DailySales._meta.db_table,
+        "totals": DailyOrderTotals._meta.db_table,
+        "orders": Order._meta.db_table,
+        "items": OrderItem._meta.db_table,
+    }
+
+
+# {changes} yields m(order_id, status, sign): add (+1) or remove (-1) each
+# order in the given status bucket, or in its current one when status is NULL.
+_SALES_SQL = """
+    INSERT INTO {sales} (day, candle_id, status, orders, units, revenue)
+    SELECT day, candle_id, status, SUM(sign), SUM(sign * units), SUM(sign * revenue)
+    FROM (
+        SELECT (o.created_at AT TIME ZONE %(tz)s)::date AS day, i.candle_id,
+               COALESCE(m.status, o.status) AS status, m.sign,
+               SUM(i.quantity) AS units, SUM(i.unit_price * i.quantity) AS revenue
+        FROM {changes}
+        JOIN {orders} o ON o.id = m.order_id
+        JOIN {items} i ON i.order_id = o.id
+        GROUP BY 1, 2, 3, 4, o.id
+    ) per_order
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, candle_id, status) DO UPDATE
+    SET orders = {sales}.orders + EXCLUDED.orders,
+        units = {sales}.units + EXCLUDED.units,
+        revenue = {sales}.revenue + EXCLUDED.revenue
+"""
+
+_TOTALS_SQL = """
+    INSERT INTO {totals} (day, status, orders, revenue)
+    SELECT (o.created_at AT TIME ZONE %(tz)s)::date, COALESCE(m.status, o.status),
+           SUM(m.sign), SUM(m.sign * o.total_amount)
+    FROM {changes}
+    JOIN {orders} o ON o.id = m.order_id
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (day, status) DO UPDATE
+    SET orders = {totals}.orders + EXCLUDED.orders,
+        revenue = {totals}.revenue + EXCLUDED.revenue
+"""
+
+_CHANGES = "unnest(%(ids)s::bigint[], %(statuses)s::text[], %(signs)s::integer[]) AS m(order_id, status, sign)"
+
+
+@transaction.atomic
+def _apply(changes, params):
+    tables = _tables()
+    params = {**params, "tz": settings.TIME_ZONE}
+    with connection.cursor() as cursor:
+        cursor.execute(_SALES_SQL.format(changes=changes, **tables), params)
+        cursor.execute(_TOTALS_SQL.format(changes=changes, **tables), params)
+
+
+def _apply_changes(changes):
+    """[(order_id, status or None, sign), ...] -> both rollups, in one statement each."""
+    if changes:
+        ids, statuses, signs = zip(*changes)
+        _apply(_CHANGES, {"ids": list(ids), "statuses": list(statuses), "signs": list(signs)})
+
+
+def record_new_orders(order_ids, status=None):
+    """Add orders to `status`, or to their current status when it is None."""
+    _apply_changes([(order_id, status and str(status), 1) for order_id in order_ids])
+
+
+def record_removed_orders(order_ids):
+    """Take orders out of the rollups; call before deleting them."""
+    _apply_changes([(order_id, None, -1) for order_id in order_ids])
+
+
+def record_transitions(moves):
+    """Apply several [(order_ids, old_status, new_status), ...] moves together."""
+    changes = []
+    for order_ids, old_status, new_status in moves:
+        if old_status == new_status:
+            continue
+        for order_id in order_ids:
+            changes += [(order_id, str(old_status), -1), (order_id, str(new_status), 1)]
+    _apply_changes(changes)
+
+
+def record_transition(order_ids, old_status, new_status):
+    record_transitions([(order_ids, old_status, new_status)])
+
+
+def parse_day(raw):
+    """"YYYY-MM-DD" -> date, None for an empty value; ValueError if it is not a valid date."""
+    if not raw:
+        return None
+    try:
+        value = parse_date(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValueError(f"Invalid date: {raw!r} (expected YYYY-MM-DD).")
+    return value
+
+
+def day_bounds(date_from=None, date_to=None):
+    """Aware datetimes [start, end) covering whole local days, for index-friendly created_at filters."""
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz) if date_from else None
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz) if date_to else None
+    return start, end
+
+
+@transaction.atomic
+def rebuild(date_from=None, date_to=None):
+    """Recompute the rollups for [date_from, date_to] (inclusive; None = open-ended)."""
+    DailySales.objects.filter(**_day_range(date_from, date_to)).delete()
+    DailyOrderTotals.objects.filter(**_day_range(date_from, date_to)).delete()
+
+    start, end = day_bounds(date_from, date_to)
+    where, params = ["TRUE"], {}
+    if start:
+        where.append("created_at >= %(start)s")
+        params["start"] = start
+    if end:
+        where.append("created_at < %(end)s")
+        params["end"] = end
+    changes = "(SELECT id AS order_id, NULL::text AS status, 1 AS sign FROM {orders} WHERE {where}) m".format(
+        where=" AND ".join(where), **_tables()
+    )
+    _apply(changes, params)
+
+
+def _day_range(date_from, date_to):
+    lookups = {}
+    if date_from:
+        lookups["day__gte"] = date_from
+    if date_to:
+        lookups["day__lte"] = date_to
+    return lookups
@@ -1,15 +1,14 @@
 # backend/orders/serializers.py
 from decimal import Decimal
 
-from django.db import transaction
 from rest_framework import serializers
 
-from candles.models import Candle
 from .models import Order, OrderItem
+from .placement import merge_lines, place_order
 
 
 class OrderItemReadSerializer(serializers.ModelSerializer):
-    candle_id = serializers.IntegerField(source="candle.id", read_only=True)
+    candle_id = serializers.IntegerField(read_only=True)
     candle_name = serializers.CharField(source="candle.name", read_only=True)
 
     class Meta:
@@ -69,36 +68,14 @@ class OrderCreateSerializer(serializers.Serializer):
     items = OrderItemCreateSerializer(many=True)
     shipping = ShippingSerializer()
 
-    @transaction.atomic
     def create(self, validated_data):
         request = self.context["request"]
-        user = request.user
-
-        items_data = validated_data["items"]
         ship = validated_data["shipping"]
 
-        merged: dict[int, int] = {}
-        for i in items_data:
-            cid = int(i["candle_id"])
-            qty = int(i["quantity"])
-            merged[cid] = merged.get(cid, 0) + qty
-
-        candle_ids = list(merged.keys())
-        candles = Candle.objects.select_for_update().filter(id__in=candle_ids)
-        candle_map = {c.id: c for c in candles}
-
-        if len(candle_map) != len(candle_ids):
-            missing = sorted(set(candle_ids) - set(candle_map.keys()))
-            raise serializers.ValidationError({"items": f"Some candle_id do not exist: {missing}"})
-
-        order = Order.objects.create(
-            user=user,
-            status=Order.Status.PENDING,
-            currency="usd",
-            subtotal_amount=Decimal("0.00"),
+        return place_order(
+            request.user,
+            merge_lines(validated_data["items"]),
             shipping_amount=Decimal("15.00"),
-            tax_amount=Decimal("0.00"),
-            total_amount=Decimal("0.00"),
             shipping_full_name=ship["full_name"].strip(),
             shipping_line1=ship["line1"].strip(),
             shipping_line2=(ship.get("line2") or "").strip(),
@@ -108,33 +85,6 @@ class OrderCreateSerializer(serializers.Serializer):
             shipping_country=ship["country"].strip().upper(),
         )
 
-        subtotal = Decimal("0.00")
-
-        for cid, qty in merged.items():
-            candle = candle_map[cid]
-
-            if candle.stock_qty < qty:
-                raise serializers.ValidationError({"items": f"Not enough stock for: {candle.name} (id={cid})"})
-
-            candle.stock_qty -= qty
-            candle.save(update_fields=["stock_qty"])
-
-            OrderItem.objects.create(
-                order=order,
-                candle=candle,
-                product_name=candle.name,
-                unit_price=candle.price,
-                quantity=qty,
-            )
-
-            subtotal += candle.price * qty
-
-        order.subtotal_amount = subtotal
-        order.total_amount = subtotal + order.shipping_amount + order.tax_amount
-        order.save(update_fields=["subtotal_amount", "total_amount"])
-
-        return order
-
 
 class OrderStatusUpdateSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=Order.Status.choices)
@@ -1,3 +1,698 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.forms import model_to_dict
+from django.db import OperationalError, connection
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from candles.models import Candle, Category
+
+from . import idempotency, payments, rollup, webhooks
+from .admin import OrderAdmin
+from .management.commands.fake_stripe_events import sign
+from .models import DailyOrderTotals, DailySales, IdempotencyKey, Order, OrderItem, StripeEvent
+from .placement import StockConflict, place_order, take_stock
+from .reservations import expire_reservations, release_stock, retake_stock
+
+
+class OrdersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="buyer@example.com", password="x")
+        category = Category.objects.create(name="Soy")
+        cls.candles = [
+            Candle.objects.create(category=category, name=f"Candle {i}", price=10 + i, stock_qty=50)
+            for i in range(8)
+        ]
+
+    def quantities(self, lines, qty=1):
+        return {candle.pk: qty for candle in self.candles[:lines]}
+
+
+class PlaceOrderTests(OrdersTestCase):
+    def count_queries(self, lines):
+        with CaptureQueriesContext(connection) as queries:
+            place_order(self.user, self.quantities(lines))
+        return len(queries)
+
+    def test_statement_count_does_not_grow_with_lines(self):
+        self.assertEqual(self.count_queries(1), self.count_queries(6))
+
+    @override_settings(INVENTORY_MODE="conditional")
+    def test_statement_count_does_not_grow_with_lines_without_locks(self):
+        self.assertEqual(self.count_queries(1), self.count_queries(6))
+
+    def test_statements(self):
+        # Candle lock, order insert, items insert and stock update, plus the
+        # savepoint of place_order; the rollup upserts wait for the commit.
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(6):
+                order = place_order(self.user, self.quantities(6, qty=2))
+        self.assertEqual(len(callbacks), 1)
+
+        self.assertEqual(order.items.count(), 6)
+        self.assertEqual(Candle.objects.get(pk=self.candles[0].pk).stock_qty, 48)
+
+
+class TakeStockTests(OrdersTestCase):
+    def test_catalog_version_moves_only_when_a_candle_sells_out(self):
+        first, second = self.candles[:2]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(take_stock({second.pk: 1, first.pk: 1}), {first.pk, second.pk})
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            take_stock({first.pk: 49})
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Candle.objects.get(pk=first.pk).in_stock)
+
+    def test_guarded_skips_short_lines(self):
+        first, second = self.candles[:2]
+
+        self.assertEqual(take_stock({first.pk: 51, second.pk: 50}, guarded=True), {second.pk})
+        self.assertEqual(Candle.objects.get(pk=first.pk).stock_qty, 50)
+
+    def test_deadlock_is_a_conflict(self):
+        cause = Exception("deadlock detected")
+        cause.pgcode = "40P01"
+        error = OperationalError("deadlock detected")
+        error.__cause__ = cause
+
+        with mock.patch("orders.placement.take_stock", side_effect=error):
+            with self.assertRaises(StockConflict):
+                place_order(self.user, self.quantities(2))
+
+
+class ReleaseStockTests(OrdersTestCase):
+    def test_release_returns_units_once(self):
+        order = place_order(self.user, self.quantities(3, qty=5))
+        other = place_order(self.user, self.quantities(2, qty=1))
+
+        self.assertEqual(sorted(release_stock([other.pk, order.pk])), sorted([order.pk, other.pk]))
+        self.assertEqual(release_stock([order.pk]), [])
+        self.assertEqual(
+            list(Candle.objects.filter(pk__in=self.quantities(3)).values_list("stock_qty", flat=True)),
+            [50, 50, 50],
+        )
+
+
+class ReservationTests(OrdersTestCase):
+    def stock(self, lines):
+        candles = Candle.objects.filter(pk__in=self.quantities(lines)).order_by("id")
+        return list(candles.values_list("stock_qty", flat=True))
+
+    def expire_at(self, order, minutes_ago):
+        Order.objects.filter(pk=order.pk).update(reserved_until=timezone.now() - timedelta(minutes=minutes_ago))
+
+    @override_settings(STOCK_RESERVATION_MINUTES=15)
+    def test_new_orders_hold_stock_until_the_reservation_ends(self):
+        before = timezone.now()
+        order = place_order(self.user, self.quantities(2, qty=4))
+
+        self.assertEqual(self.stock(2), [46, 46])
+        self.assertGreaterEqual(order.reserved_until, before + timedelta(minutes=15))
+        self.assertLessEqual(order.reserved_until, timezone.now() + timedelta(minutes=15))
+
+    def test_expiry_cancels_only_overdue_pending_orders(self):
+        overdue = [place_order(self.user, self.quantities(2, qty=3)) for _ in range(3)]
+        current = place_order(self.user, self.quantities(1, qty=1))
+        paid = place_order(self.user, self.quantities(1, qty=2))
+        for order in overdue + [paid]:
+            self.expire_at(order, 5)
+        Order.objects.filter(pk=paid.pk).update(status=Order.Status.PAID)
+
+        progress = []
+        self.assertEqual(expire_reservations(batch_size=2, progress=progress.append), 3)
+
+        self.assertEqual(progress, [2, 3])
+        statuses = dict(Order.objects.values_list("id", "status"))
+        self.assertEqual({statuses[o.pk] for o in overdue}, {Order.Status.CANCELED})
+        self.assertEqual(statuses[current.pk], Order.Status.PENDING)
+        self.assertEqual(statuses[paid.pk], Order.Status.PAID)
+        self.assertEqual(self.stock(2), [47, 50])
+        self.assertEqual(expire_reservations(), 0)
+
+    def test_release_reservations_command(self):
+        order = place_order(self.user, self.quantities(1, qty=5))
+        self.expire_at(order, 1)
+        out = StringIO()
+
+        call_command("release_reservations", stdout=out)
+
+        self.assertIn("Expired 1 orders", out.getvalue())
+        self.assertTrue(Order.objects.get(pk=order.pk).stock_released)
+        self.assertEqual(self.stock(1), [50])
+
+    def test_retake_stock_after_expiry(self):
+        order = place_order(self.user, self.quantities(2, qty=10))
+        self.expire_at(order, 1)
+        expire_reservations()
+        order.refresh_from_db()
+
+        self.assertTrue(retake_stock(order))
+
+        self.assertFalse(Order.objects.get(pk=order.pk).stock_released)
+        self.assertEqual(self.stock(2), [40, 40])
+
+    def test_retake_stock_fails_when_the_units_are_gone(self):
+        order = place_order(self.user, self.quantities(2, qty=10))
+        self.expire_at(order, 1)
+        expire_reservations()
+        Candle.objects.filter(pk=self.candles[1].pk).update(stock_qty=5)
+        order.refresh_from_db()
+
+        self.assertFalse(retake_stock(order))
+
+        self.assertTrue(Order.objects.get(pk=order.pk).stock_released)
+        self.assertEqual(self.stock(2), [50, 5])
+
+
+class TransitionTests(OrdersTestCase):
+    def test_stale_instance_does_not_repeat_a_transition(self):
+        order = place_order(self.user, self.quantities(2, qty=5))
+        stale = Order.objects.get(pk=order.pk)
+        self.assertTrue(order.transition_to(Order.Status.CANCELED))
+
+        self.assertFalse(stale.transition_to(Order.Status.CANCELED))
+
+        self.assertEqual(Candle.objects.get(pk=self.candles[0].pk).stock_qty, 50)
+        self.assertEqual(dict(DailyOrderTotals.objects.values_list("status", "orders"))[Order.Status.CANCELED], 1)
+
+    def test_transition_is_checked_against_the_current_status(self):
+        order = place_order(self.user, self.quantities(1))
+        stale = Order.objects.get(pk=order.pk)
+        order.transition_to(Order.Status.CANCELED)
+
+        with mock.patch.object(Order, "record_paid") as record_paid, self.assertRaises(ValueError):
+            stale.transition_to(Order.Status.PAID)
+
+        record_paid.assert_not_called()
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.CANCELED)
+
+    def test_transition_locks_the_order_row(self):
+        order = place_order(self.user, self.quantities(1))
+
+        with CaptureQueriesContext(connection) as queries:
+            order.transition_to(Order.Status.CANCELED)
+
+        self.assertIn("FOR UPDATE", queries.captured_queries[1]["sql"])
+
+
+class RollupTests(OrdersTestCase):
+    def place(self, lines, qty=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(self.user, self.quantities(lines, qty))
+
+    def live_totals(self):
+        rows = (
+            Order.objects.annotate(day=TruncDate("created_at"))
+            .values("day", "status")
+            .annotate(orders=Count("id"), revenue=Sum("total_amount"))
+        )
+        return {(r["day"], r["status"]): (r["orders"], r["revenue"]) for r in rows}
+
+    def live_sales(self):
+        rows = (
+            OrderItem.objects.annotate(day=TruncDate("order__created_at"))
+            .values("day", "candle_id", "order__status")
+            .annotate(
+                orders=Count("order_id", distinct=True),
+                units=Sum("quantity"),
+                revenue=Sum(F("unit_price") * F("quantity")),
+            )
+        )
+        return {
+            (r["day"], r["candle_id"], r["order__status"]): (r["orders"], r["units"], r["revenue"]) for r in rows
+        }
+
+    def rollup_totals(self):
+        rows = DailyOrderTotals.objects.exclude(orders=0).values_list("day", "status", "orders", "revenue")
+        return {(day, status): tuple(values) for day, status, *values in rows}
+
+    def rollup_sales(self):
+        rows = DailySales.objects.exclude(orders=0).values_list(
+            "day", "candle_id", "status", "orders", "units", "revenue"
+        )
+        return {(day, candle, status): tuple(values) for day, candle, status, *values in rows}
+
+    def assert_rollups_match_live(self):
+        self.assertEqual(self.rollup_totals(), self.live_totals())
+        self.assertEqual(self.rollup_sales(), self.live_sales())
+
+    def test_rollups_and_rebuild_match_live_aggregates(self):
+        orders = [self.place(lines, qty) for lines, qty in [(1, 1), (3, 2), (2, 5), (4, 1), (1, 3)]]
+        orders[0].transition_to(Order.Status.PAID)
+        orders[0].transition_to(Order.Status.SHIPPED)
+        orders[1].transition_to(Order.Status.CANCELED)
+        Order.objects.filter(pk=orders[2].pk).update(reserved_until=timezone.now() - timedelta(minutes=1))
+        expire_reservations()
+
+        self.assert_rollups_match_live()
+
+        DailySales.objects.update(units=0)
+        DailyOrderTotals.objects.all().delete()
+        rollup.rebuild()
+
+        self.assert_rollups_match_live()
+
+    def test_status_change_before_the_rollup_write_nets_out(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            order = place_order(self.user, self.quantities(2, qty=2))
+        order.transition_to(Order.Status.PAID)
+
+        for callback in callbacks:
+            callback()
+
+        self.assert_rollups_match_live()
+
+
+class OrderAdminTests(OrdersTestCase):
+    def change_status(self, order, new_status):
+        request = RequestFactory().post("/")
+        request.user = get_user_model().objects.create_superuser(email="staff@example.com", password="x")
+        request._messages = CookieStorage(request)
+        self.messages = request._messages
+        model_admin = OrderAdmin(Order, site)
+        form_class = model_admin.get_form(request, order, change=True)
+        data = model_to_dict(order, fields=form_class.base_fields)
+        data["status"] = new_status
+        form = form_class(data, instance=order)
+        if not form.is_valid():
+            return form
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+        return form
+
+    def test_cancel_releases_stock_and_moves_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.user, self.quantities(2, qty=3))
+
+        self.change_status(order, Order.Status.CANCELED)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.CANCELED)
+        self.assertTrue(order.stock_released)
+        self.assertEqual(Candle.objects.get(pk=self.candles[0].pk).stock_qty, 50)
+        totals = dict(DailyOrderTotals.objects.values_list("status", "orders"))
+        self.assertEqual(totals.get(Order.Status.PENDING, 0), 0)
+        self.assertEqual(totals[Order.Status.CANCELED], 1)
+
+    def test_status_reached_since_the_form_loaded_is_not_overwritten(self):
+        order = place_order(self.user, self.quantities(1))
+        Order.objects.get(pk=order.pk).transition_to(Order.Status.PAID)
+
+        self.change_status(order, Order.Status.CANCELED)
+
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.PAID)
+        self.assertIn("Status not changed", [str(m) for m in self.messages][0])
+
+    def test_refund_is_a_form_error(self):
+        order = place_order(self.user, self.quantities(1))
+        Order.objects.filter(pk=order.pk).update(status=Order.Status.PAID)
+        order.refresh_from_db()
+
+        form = self.change_status(order, Order.Status.REFUNDED)
+
+        self.assertIn("PATCH /api/orders/<id>/status/", form.errors["status"][0])
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.PAID)
+
+    def test_disallowed_transition_is_a_form_error(self):
+        order = place_order(self.user, self.quantities(1))
+
+        form = self.change_status(order, Order.Status.COMPLETED)
+
+        self.assertIn("status", form.errors)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.PENDING)
+
+
+@override_settings(PAYMENT_GATEWAY="orders.payments.FakeGateway")
+class PaymentIntentIdempotencyTests(OrdersTestCase):
+    def setUp(self):
+        payments.get_gateway.cache_clear()
+        self.addCleanup(payments.get_gateway.cache_clear)
+
+    def create_intent(self, order, key):
+        return self.client.post(
+            "/api/orders/create-intent/",
+            data={"order_id": order.pk},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_same_key_replays_for_the_same_order(self):
+        order = place_order(self.user, self.quantities(1))
+
+        first = self.create_intent(order, "k1")
+        again = self.create_intent(order, "k1")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(again.json(), first.json())
+
+    def test_same_key_does_not_collide_across_orders(self):
+        order = place_order(self.user, self.quantities(1))
+        other = place_order(self.user, self.quantities(2))
+
+        first = self.create_intent(order, "k1")
+        second = self.create_intent(other, "k1")
+
+        self.assertEqual(second.status_code, 200)
+        self.assertFalse(second.has_header("Idempotent-Replayed"))
+        self.assertNotEqual(second.json(), first.json())
+
+    def test_gateway_is_called_after_the_key_is_committed(self):
+        order = place_order(self.user, self.quantities(1))
+        gateway = payments.get_gateway()
+        depth = len(connection.atomic_blocks)
+        seen = {}
+
+        def create_payment_intent(**kwargs):
+            seen["atomic_blocks"] = len(connection.atomic_blocks)
+            seen["key"] = IdempotencyKey.objects.get(key="k1")
+            return {"id": "pi_1", "client_secret": "pi_1_secret"}
+
+        with mock.patch.object(gateway, "create_payment_intent", side_effect=create_payment_intent):
+            response = self.create_intent(order, "k1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen["atomic_blocks"], depth)
+        self.assertIsNone(seen["key"].response_status)
+        self.assertEqual(IdempotencyKey.objects.get(key="k1").response_status, 200)
+
+    def test_duplicate_while_in_flight_gets_409(self):
+        order = place_order(self.user, self.quantities(1))
+        gateway = payments.get_gateway()
+        duplicates = []
+
+        def create_payment_intent(**kwargs):
+            duplicates.append(self.create_intent(order, "k1"))
+            return {"id": "pi_1", "client_secret": "pi_1_secret"}
+
+        with mock.patch.object(gateway, "create_payment_intent", side_effect=create_payment_intent) as call:
+            response = self.create_intent(order, "k1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0]["Retry-After"], "1")
+
+    def test_abandoned_in_flight_key_is_taken_over(self):
+        order = place_order(self.user, self.quantities(1))
+        self.create_intent(order, "k1")
+        IdempotencyKey.objects.filter(key="k1").update(
+            response_status=None,
+            response_body=None,
+            created_at=timezone.now() - idempotency.IN_FLIGHT_TIMEOUT - timedelta(seconds=1),
+        )
+
+        response = self.create_intent(order, "k1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(IdempotencyKey.objects.get(key="k1").response_status, 200)
+
+    def test_gateway_failure_frees_the_key(self):
+        order = place_order(self.user, self.quantities(1))
+        gateway = payments.get_gateway()
+
+        with mock.patch.object(
+            gateway, "create_payment_intent", side_effect=payments.GatewayUnavailable("down")
+        ):
+            failed = self.create_intent(order, "k1")
+        retried = self.create_intent(order, "k1")
+
+        self.assertEqual(failed.status_code, 503)
+        self.assertEqual(retried.status_code, 200)
+        self.assertFalse(retried.has_header("Idempotent-Replayed"))
+
+
+@override_settings(PAYMENT_GATEWAY="orders.payments.FakeGateway")
+class RefundTests(OrdersTestCase):
+    def setUp(self):
+        payments.get_gateway.cache_clear()
+        self.addCleanup(payments.get_gateway.cache_clear)
+        self.gateway = payments.get_gateway()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email="staff@example.com", password="x", is_staff=True
+        ))
+        self.order = place_order(self.user, self.quantities(2, qty=3))
+        Order.objects.filter(pk=self.order.pk).update(status=Order.Status.PAID, stripe_payment_intent_id="pi_1")
+
+    def set_status(self, new_status):
+        return self.client.patch(f"/api/orders/{self.order.pk}/status/", {"status": new_status}, format="json")
+
+    def refunds(self):
+        return [params for name, params in self.gateway.calls if name == "refund"]
+
+    def test_refund_is_sent_after_the_mark_commits_and_outside_a_transaction(self):
+        depth = len(connection.atomic_blocks)
+        seen = {}
+        refund = self.gateway.refund
+
+        def check_and_refund(*args, **kwargs):
+            seen["atomic_blocks"] = len(connection.atomic_blocks)
+            seen["marked"] = Order.objects.get(pk=self.order.pk).refund_requested_at is not None
+            return refund(*args, **kwargs)
+
+        with mock.patch.object(self.gateway, "refund", side_effect=check_and_refund):
+            response = self.set_status(Order.Status.REFUNDED)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen, {"atomic_blocks": depth, "marked": True})
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.status, Order.Status.REFUNDED)
+        self.assertTrue(order.stock_released)
+        self.assertEqual(self.refunds(), [{"payment_intent": "pi_1", "amount": None}])
+
+    def test_rejected_refund_leaves_the_order_paid_and_shippable(self):
+        with mock.patch.object(self.gateway, "refund", side_effect=payments.PaymentError("Charge disputed")):
+            response = self.set_status(Order.Status.REFUNDED)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Charge disputed", response.json()["status"])
+        self.assertIsNone(Order.objects.get(pk=self.order.pk).refund_requested_at)
+        self.assertEqual(self.set_status(Order.Status.SHIPPED).status_code, 200)
+
+    def test_unavailable_provider_keeps_the_order_for_a_refund_retry(self):
+        self.gateway.failure_rate = 1.0
+        response = self.set_status(Order.Status.REFUNDED)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.Status.PAID)
+        self.assertEqual(self.set_status(Order.Status.SHIPPED).status_code, 400)
+
+        self.gateway.failure_rate = 0.0
+        first = self.gateway.refund("pi_1", idempotency_key=f"order-{self.order.pk}-refund")
+        self.assertEqual(self.set_status(Order.Status.REFUNDED).status_code, 200)
+        again = self.gateway.refund("pi_1", idempotency_key=f"order-{self.order.pk}-refund")
+
+        self.assertEqual(again, first)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.Status.REFUNDED)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = payments.CircuitBreaker(threshold=2, reset_timeout=30, clock=lambda: self.now)
+        self.gateway = payments.FakeGateway(failure_rate=1.0, breaker=self.breaker)
+
+    def intent(self):
+        return self.gateway.create_payment_intent(1000, "usd", idempotency_key="k")
+
+    def test_opens_after_consecutive_failures_and_stops_calling(self):
+        for _ in range(3):
+            with self.assertRaises(payments.GatewayUnavailable):
+                self.intent()
+
+        self.assertEqual(self.breaker.state, payments.CircuitBreaker.OPEN)
+        self.assertEqual(len(self.gateway.calls), 2)
+
+    def test_successful_trial_closes_the_circuit(self):
+        for _ in range(2):
+            with self.assertRaises(payments.GatewayUnavailable):
+                self.intent()
+        self.now = 30
+        self.gateway.failure_rate = 0.0
+
+        self.assertEqual(self.intent(), self.intent())
+
+        self.assertEqual(self.breaker.state, payments.CircuitBreaker.CLOSED)
+
+    def test_rejected_request_counts_as_the_provider_being_up(self):
+        def rejected():
+            raise payments.PaymentError("Card declined")
+
+        for _ in range(3):
+            with self.assertRaises(payments.PaymentError):
+                self.breaker.call(rejected)
+
+        self.assertEqual(self.breaker.state, payments.CircuitBreaker.CLOSED)
+
+    def test_interrupt_is_not_counted_as_a_failure(self):
+        def interrupted():
+            raise KeyboardInterrupt
+
+        for _ in range(3):
+            with self.assertRaises(KeyboardInterrupt):
+                self.breaker.call(interrupted)
+
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_interrupted_trial_lets_the_next_call_through(self):
+        for _ in range(2):
+            with self.assertRaises(payments.GatewayUnavailable):
+                self.intent()
+        self.now = 30
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.breaker.call(mock.Mock(side_effect=KeyboardInterrupt))
+        self.gateway.failure_rate = 0.0
+
+        self.assertIn("client_secret", self.intent())
+
+
+class OrderListQueryCountTests(OrdersTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for lines in range(1, 6):
+            place_order(cls.user, {candle.pk: 1 for candle in cls.candles[:lines]})
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_prefetches_items(self):
+        # Orders, then their items with candle names.
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/orders/my/")
+
+        self.assertEqual([len(order["items"]) for order in response.data], [5, 4, 3, 2, 1])
+
+    def test_cursor_page(self):
+        first = self.client.get("/api/orders/my/?page_size=2").data
+
+        with self.assertNumQueries(2):
+            second = self.client.get(first["next"]).data
+
+        self.assertEqual([len(order["items"]) for order in second["results"]], [3, 2])
+        self.assertIsNotNone(second["next"])
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTests(OrdersTestCase):
+    def order_with_intent(self, status=Order.Status.PENDING):
+        order = place_order(self.user, self.quantities(1))
+        Order.objects.filter(pk=order.pk).update(status=status, stripe_payment_intent_id=f"pi_{order.pk}")
+        return order
+
+    def send(self, order, event_type=webhooks.SUCCEEDED):
+        payload = json.dumps({
+            "id": f"evt_{order.pk}_{event_type}",
+            "object": "event",
+            "type": event_type,
+            "data": {"object": {"id": f"pi_{order.pk}", "metadata": {"order_id": str(order.pk)}}},
+        }).encode()
+        return self.client.post(
+            "/api/orders/webhook/",
+            data=payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign(payload, "whsec_test"),
+        )
+
+    def expire(self, order):
+        Order.objects.filter(pk=order.pk).update(reserved_until=timezone.now() - timedelta(minutes=1))
+        expire_reservations()
+
+    def test_event_waits_for_the_worker_by_default(self):
+        order = self.order_with_intent()
+
+        self.assertEqual(self.send(order).status_code, 200)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.PENDING)
+
+        self.assertEqual(webhooks.drain(), 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.PAID)
+
+    @override_settings(WEBHOOK_INLINE_DRAIN_BATCH=50)
+    def test_event_is_applied_inline_when_enabled(self):
+        order = self.order_with_intent()
+
+        self.assertEqual(self.send(order).status_code, 200)
+
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.PAID)
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_success_does_not_reopen_shipped_or_refunded_orders(self):
+        shipped = self.order_with_intent(Order.Status.SHIPPED)
+        refunded = self.order_with_intent(Order.Status.REFUNDED)
+
+        with mock.patch.object(Order, "record_paid") as record_paid:
+            self.send(shipped)
+            self.send(refunded)
+            webhooks.drain()
+
+        shipped, refunded = Order.objects.get(pk=shipped.pk), Order.objects.get(pk=refunded.pk)
+        self.assertEqual((shipped.status, shipped.needs_refund), (Order.Status.SHIPPED, False))
+        self.assertEqual((refunded.status, refunded.needs_refund), (Order.Status.REFUNDED, True))
+        record_paid.assert_not_called()
+
+    def test_success_after_expiry_pays_the_canceled_order(self):
+        order = self.order_with_intent()
+        self.expire(order)
+
+        self.send(order)
+        webhooks.drain()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.PAID)
+        self.assertFalse(order.stock_released)
+        self.assertFalse(order.needs_refund)
+        self.assertEqual(Candle.objects.get(pk=self.candles[0].pk).stock_qty, 49)
+
+    def test_success_after_expiry_without_stock_flags_the_order(self):
+        order = self.order_with_intent()
+        self.expire(order)
+        Candle.objects.filter(pk=self.candles[0].pk).update(stock_qty=0)
+
+        self.send(order)
+        webhooks.drain()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.CANCELED)
+        self.assertTrue(order.stock_released)
+        self.assertTrue(order.needs_refund)
+
+    def test_success_for_a_staff_canceled_order_flags_it(self):
+        order = self.order_with_intent()
+        Order.objects.get(pk=order.pk).transition_to(Order.Status.CANCELED)
+
+        with mock.patch.object(Order, "record_paid") as record_paid:
+            self.send(order)
+            webhooks.drain()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.CANCELED)
+        self.assertTrue(order.needs_refund)
+        self.assertEqual(Candle.objects.get(pk=self.candles[0].pk).stock_qty, 50)
+        record_paid.assert_not_called()
+
+
+class FakeStripeEventsTests(OrdersTestCase):
+    @override_settings(DEBUG=False)
+    def test_refuses_without_debug(self):
+        place_order(self.user, self.quantities(1))
+
+        with self.assertRaisesMessage(CommandError, "--i-know"):
+            call_command("fake_stripe_events", "--count", "1")
+        self.assertFalse(Order.objects.exclude(stripe_payment_intent_id="").exists())
@@ -6,7 +6,9 @@ from .views import (
     CreateOrderFromCartAPIView,
     OrderDetailAPIView,
     OrderStatusUpdateAPIView,
-    StaffOrdersAPIView
+    StaffOrderExportAPIView,
+    StaffOrdersAPIView,
+    StripeEventStatsAPIView,
 )
 from .views_stripe import create_payment_intent, stripe_webhook
 
@@ -14,6 +16,7 @@ urlpatterns = [
     path("", CreateOrderAPIView.as_view(), name="create-order"),
     path("my/", MyOrdersAPIView.as_view(), name="orders-my"),
     path("staff/", StaffOrdersAPIView.as_view(), name="orders-staff"),
+    path("staff/export/", StaffOrderExportAPIView.as_view(), name="orders-staff-export"),
     
     path("from-cart/", CreateOrderFromCartAPIView.as_view(), name="create-order-from-cart"),
     path("<int:pk>/", OrderDetailAPIView.as_view(), name="order-detail"),
@@ -22,4 +25,5 @@ urlpatterns = [
     # Stripe later:
     path("create-intent/", create_payment_intent, name="create-payment-intent"),
     path("webhook/", stripe_webhook, name="stripe-webhook"),
+    path("webhook/stats/", StripeEventStatsAPIView.as_view(), name="stripe-webhook-stats"),
 ]
\ No newline at end of file
@@ -1,16 +1,25 @@
 # backend/orders/views.py
-from decimal import Decimal
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import generics, permissions, status
 from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.throttling import UserRateThrottle
 
-from candles.models import Candle
-from cart.models import Cart, CartItem
+from cart import repository
+from cart.models import CartItem
+from . import export, payments, rollup, webhooks
+from .idempotency import idempotent
 from .models import Order, OrderItem
+from .pagination import OrderKeysetPagination
+from .placement import place_order
 from .serializers import OrderCreateSerializer, OrderReadSerializer, OrderStatusUpdateSerializer
 
 
@@ -18,6 +27,14 @@ class OrderCreateThrottle(UserRateThrottle):
     scope = "orders_create"
 
 
+def with_items(queryset):
+    """Orders plus their items and candle names in two queries, whatever the page size."""
+    items = OrderItem.objects.select_related("candle").only(
+        "id", "order_id", "candle_id", "unit_price", "quantity", "candle__name"
+    )
+    return queryset.prefetch_related(Prefetch("items", queryset=items))
+
+
 @extend_schema(
     tags=["Orders"],
     summary="Create order from provided items",
@@ -34,6 +51,7 @@ class CreateOrderAPIView(generics.GenericAPIView):
     serializer_class = OrderCreateSerializer
     throttle_classes = [OrderCreateThrottle]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         items = request.data.get("items", [])
         if not items:
@@ -55,9 +73,10 @@ class CreateOrderAPIView(generics.GenericAPIView):
 class MyOrdersAPIView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = OrderReadSerializer
+    pagination_class = OrderKeysetPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by("-created_at")
+        return with_items(Order.objects.filter(user=self.request.user)).order_by("-created_at", "-id")
 
 
 @extend_schema(
@@ -83,6 +102,7 @@ class MyOrdersAPIView(generics.ListAPIView):
 class StaffOrdersAPIView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = OrderReadSerializer
+    pagination_class = OrderKeysetPagination
     search_fields = ("id", "user__email", "stripe_payment_intent_id")
     ordering_fields = ("created_at", "total_amount", "status")
     ordering = ("-created_at",)
@@ -90,7 +110,61 @@ class StaffOrdersAPIView(generics.ListAPIView):
     def get_queryset(self):
         if not self.request.user.is_staff:
             raise PermissionDenied("Only staff can view all orders.")
-        return Order.objects.select_related("user").prefetch_related("items").order_by("-created_at")
+        return with_items(Order.objects.select_related("user")).order_by("-created_at", "-id")
+
+
+class IgnoreFormatNegotiation(DefaultContentNegotiation):
+    """Always render with the first renderer: ?format= names the export format here, not a DRF renderer."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+@extend_schema(
+    tags=["Orders"],
+    summary="Staff: export orders",
+    description=(
+        "Staff-only endpoint. Streams one row per order line (order columns repeated) "
+        "for orders created between `from` and `to` (inclusive days), oldest first."
+    ),
+    parameters=[
+        OpenApiParameter(name="from", description="First day, YYYY-MM-DD.", required=False, type=str),
+        OpenApiParameter(name="to", description="Last day, YYYY-MM-DD.", required=False, type=str),
+        OpenApiParameter(name="status", description="Only orders in this status.", required=False, type=str),
+        OpenApiParameter(name="format", description="csv (default) or jsonl.", required=False, type=str),
+    ],
+    responses={(200, "text/csv"): str, (200, "application/x-ndjson"): str},
+)
+class StaffOrderExportAPIView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    content_negotiation_class = IgnoreFormatNegotiation
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied("Only staff can export orders.")
+
+        params = request.query_params
+        fmt = params.get("format") or "csv"
+        if fmt not in export.ENCODERS:
+            raise ValidationError({"format": f"Must be one of: {', '.join(export.ENCODERS)}."})
+
+        days = {}
+        for name in ("from", "to"):
+            try:
+                days[name] = rollup.parse_day(params.get(name))
+            except ValueError as e:
+                raise ValidationError({name: str(e)})
+
+        status_filter = params.get("status") or None
+        if status_filter and status_filter not in Order.Status.values:
+            raise ValidationError({"status": f"Must be one of: {', '.join(Order.Status.values)}."})
+
+        start, end = rollup.day_bounds(days["from"], days["to"])
+        records = export.rows(start, end, status_filter, chunk_size=settings.ORDER_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(export.ENCODERS[fmt](records), content_type=export.CONTENT_TYPES[fmt])
+        filename = "orders-{}-{}.{}".format(days["from"] or "start", days["to"] or "now", fmt)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
 
 @extend_schema(
@@ -103,57 +177,21 @@ class CreateOrderFromCartAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     throttle_classes = [OrderCreateThrottle]
 
+    @idempotent
     @transaction.atomic
     def post(self, request, *args, **kwargs):
         user = request.user
 
-        cart, _ = Cart.objects.get_or_create(user=user)
-        cart_items = CartItem.objects.select_related("candle").select_for_update().filter(cart=cart)
+        cart_items = CartItem.objects.select_for_update().filter(cart__user=user)
+        quantities = dict(cart_items.values_list("candle_id", "quantity"))
 
-        if not cart_items.exists():
+        if not quantities:
             raise ValidationError({"cart": "Cart is empty."})
 
-        candle_ids = list(cart_items.values_list("candle_id", flat=True))
-        candles = Candle.objects.select_for_update().filter(id__in=candle_ids)
-        candle_map = {c.id: c for c in candles}
-
-        if len(candle_map) != len(set(candle_ids)):
-            missing = sorted(set(candle_ids) - set(candle_map.keys()))
-            raise ValidationError({"cart": f"Some candle_id do not exist: {missing}"})
-
-        order = Order.objects.create(
-            user=user,
-            status=Order.Status.PENDING,
-            currency="usd",
-            total_amount=Decimal("0.00"),
-        )
-
-        total = Decimal("0.00")
-
-        for item in cart_items:
-            candle = candle_map[item.candle_id]
-            qty = int(item.quantity)
-
-            if candle.stock_qty < qty:
-                raise ValidationError({"cart": f"Not enough stock for: {candle.name} (id={candle.id})"})
-
-            candle.stock_qty -= qty
-            candle.save(update_fields=["stock_qty"])
-
-            OrderItem.objects.create(
-                order=order,
-                candle=candle,
-                product_name=candle.name,
-                unit_price=candle.price,
-                quantity=qty,
-            )
-
-            total += candle.price * qty
-
-        order.total_amount = total
-        order.save(update_fields=["total_amount"])
+        order = place_order(user, quantities, error_field="cart")
 
         cart_items.delete()
+        repository.touch_cart(user)
 
         return Response(OrderReadSerializer(order).data, status=status.HTTP_201_CREATED)
 
@@ -169,7 +207,7 @@ class OrderDetailAPIView(generics.RetrieveAPIView):
     serializer_class = OrderReadSerializer
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return with_items(Order.objects.filter(user=self.request.user))
 
 
 @extend_schema(
@@ -187,19 +225,58 @@ class OrderStatusUpdateAPIView(generics.GenericAPIView):
         if not request.user.is_staff:
             raise PermissionDenied("Only staff can update order status.")
 
-        order_id = kwargs.get("pk")
-        try:
-            order = Order.objects.get(pk=order_id)
-        except Order.DoesNotExist:
-            return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
-
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         new_status = serializer.validated_data["status"]
 
+        order_id = kwargs.get("pk")
+        with transaction.atomic():
+            try:
+                order = Order.objects.select_for_update().get(pk=order_id)
+            except Order.DoesNotExist:
+                return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            if not order.can_transition(new_status):
+                raise ValidationError({"status": f"Cannot transition from {order.status} to {new_status}"})
+
+            refund = new_status == Order.Status.REFUNDED and bool(order.stripe_payment_intent_id)
+            if refund:
+                # Committed before the provider is called: from here the order can only be refunded.
+                order.refund_requested_at = timezone.now()
+                order.save(update_fields=["refund_requested_at", "updated_at"])
+
+        if refund:
+            # No transaction or row lock is held during the call. A retry repeats
+            # it under the same key, so the provider refunds only once.
+            try:
+                payments.get_gateway().refund(
+                    order.stripe_payment_intent_id,
+                    idempotency_key=f"order-{order.id}-refund",
+                )
+            except payments.GatewayUnavailable as e:
+                # The refund may or may not have gone through: keep the mark and let staff retry.
+                headers = {"Retry-After": str(int(e.retry_after))} if e.retry_after else None
+                return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=headers)
+            except payments.PaymentError as e:
+                # Rejected by the provider: nothing was refunded, so the order is released again.
+                Order.objects.filter(pk=order.pk).update(refund_requested_at=None)
+                raise ValidationError({"status": f"Refund failed: {e}"})
+
         try:
             order.transition_to(new_status)
         except ValueError as e:
             raise ValidationError({"status": str(e)})
 
-        return Response(OrderReadSerializer(order).data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(OrderReadSerializer(order).data, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=["Orders"],
+    summary="Staff: Stripe webhook inbox stats",
+    description="Backlog, lag (age of the oldest pending event) and throughput over the last minute.",
+)
+class StripeEventStatsAPIView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(webhooks.stats())
@@ -0,0 +1,240 @@
+# backend/orders/webhooks.py
+"""
+Stripe webhook inbox.
+
+The webhook view only verifies the signature and calls enqueue(), a single
+INSERT ... ON CONFLICT (event_id) DO NOTHING, then answers 200. Stripe's
+redeliveries of an event collapse onto the same row, and a burst of events
+costs the web workers one short insert each.
+
+drain() (`manage.py drain_stripe_events`) applies the stored events. The
+view can also call drain_inline() after each enqueue (WEBHOOK_INLINE_DRAIN_BATCH,
+off by default) for setups without that worker, at the cost of applying
+events on the request path. Either way:
+
+- each batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+  workers can drain side by side without waiting on each other;
+- the batch's payment_intent.succeeded events become one UPDATE of the
+  matching PENDING orders to PAID, then its payment_intent.payment_failed
+  events one UPDATE to CANCELED (for orders that can still be canceled).
+  Successes go first, so an intent that failed and was then paid ends up PAID;
+- a success for an order the reservation sweeper canceled pays it too if its
+  units can be taken back. A success for any other order that is not paid
+  (canceled by staff or a failed payment, refunded, or out of stock) leaves
+  its status alone and flags it needs_refund for staff;
+- if a batch raises, its events are retried one by one so a single bad
+  event cannot hold back the rest. An event that keeps failing stops being
+  picked after WEBHOOK_MAX_ATTEMPTS and shows up as failed in stats().
+"""
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from . import rollup
+from .models import Order, StripeEvent
+from .reservations import release_stock, retake_stock
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = "payment_intent.succeeded"
+FAILED = "payment_intent.payment_failed"
+HANDLED_TYPES = (SUCCEEDED, FAILED)
+
+# Statuses a failed payment may still cancel.
+CANCELABLE_STATUSES = [
+    status for status, targets in Order.ALLOWED_TRANSITIONS.items() if Order.Status.CANCELED in targets
+]
+# Statuses a successful payment acts on, by paying the order or flagging it for a refund.
+UNPAID_STATUSES = [status for status in Order.Status if status not in Order.PAID_STATUSES]
+
+
+def enqueue(event) -> bool:
+    """Store a verified event ({"id", "type", "data": {"object"}}). Returns False for a redelivery."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {events} (event_id, type, payload, received_at, attempts, last_error)
+            VALUES (%s, %s, %s::jsonb, NOW(), 0, '')
+            ON CONFLICT (event_id) DO NOTHING
+            RETURNING id
+            """.format(events=StripeEvent._meta.db_table),
+            [event["id"], event["type"], json.dumps(event["data"]["object"])],
+        )
+        return cursor.fetchone() is not None
+
+
+def _intent_pairs(events, event_type):
+    """{(order_id, payment_intent_id)} for the events of one type."""
+    pairs = set()
+    for event in events:
+        if event.type != event_type:
+            continue
+        order_id = str((event.payload.get("metadata") or {}).get("order_id") or "")
+        if order_id.isdigit():
+            pairs.add((int(order_id), event.payload.get("id")))
+    return pairs
+
+
+def _lock_orders(pairs, statuses=None):
+    orders = Order.objects.select_for_update().filter(id__in={order_id for order_id, _ in pairs})
+    if statuses is not None:
+        orders = orders.filter(status__in=statuses)
+    orders = orders.only(
+        "id", "status", "stock_released", "reservation_expired", "stripe_payment_intent_id"
+    ).order_by("id")
+    return [o for o in orders if (o.id, o.stripe_payment_intent_id) in pairs]
+
+
+def _move(orders, new_status, moves):
+    """Set `orders` to new_status with one UPDATE; the rollup moves are appended to `moves`."""
+    ids = [o.id for o in orders]
+    Order.objects.filter(id__in=ids).update(status=new_status, updated_at=timezone.now())
+    for o in orders:
+        moves.append(([o.id], o.status, new_status))
+    return ids
+
+
+def _can_take_payment(order):
+    if order.status == Order.Status.PENDING:
+        return True
+    if order.status == Order.Status.CANCELED and order.reservation_expired:
+        # Paid after the reservation expired: the one move to PAID outside
+        # Order.ALLOWED_TRANSITIONS, and only if the units are still there.
+        return not order.stock_released or retake_stock(order)
+    return False
+
+
+def mark_paid(pairs, moves):
+    payable, unpayable = [], []
+    for order in _lock_orders(pairs, statuses=UNPAID_STATUSES):
+        (payable if _can_take_payment(order) else unpayable).append(order)
+
+    if unpayable:
+        flagged = [o.id for o in unpayable]
+        Order.objects.filter(id__in=flagged).update(needs_refund=True, updated_at=timezone.now())
+        logger.warning("Payment succeeded for orders that cannot take it; flagged for refund: %s", flagged)
+    if not payable:
+        return []
+    ids = _move(payable, Order.Status.PAID, moves)
+    Order.record_paid(ids)
+    return ids
+
+
+def mark_failed(pairs, moves):
+    orders = _lock_orders(pairs, statuses=CANCELABLE_STATUSES)
+    if not orders:
+        return []
+    ids = _move(orders, Order.Status.CANCELED, moves)
+    release_stock(ids)
+    return ids
+
+
+def apply_events(events):
+    moves = []
+    mark_paid(_intent_pairs(events, SUCCEEDED), moves)
+    mark_failed(_intent_pairs(events, FAILED), moves)
+    # One pass over the rollups for the whole batch keeps their rows locked in key order.
+    rollup.record_transitions(moves)
+
+
+def drain_batch(batch_size=500, max_attempts=None):
+    """Claim and apply up to batch_size pending events. Returns the number claimed."""
+    max_attempts = max_attempts or settings.WEBHOOK_MAX_ATTEMPTS
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, attempts__lt=max_attempts)
+            .only("id", "type", "payload")
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        done = [e.pk for e in events]
+        try:
+            with transaction.atomic():
+                apply_events(events)
+        except Exception:
+            logger.exception("Stripe event batch failed; retrying its %s events one by one.", len(events))
+            done = []
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        apply_events([event])
+                except Exception as e:
+                    StripeEvent.objects.filter(pk=event.pk).update(
+                        attempts=F("attempts") + 1, last_error=str(e)[:2000]
+                    )
+                else:
+                    done.append(event.pk)
+
+        StripeEvent.objects.filter(pk__in=done).update(processed_at=timezone.now(), attempts=F("attempts") + 1)
+    return len(events)
+
+
+def drain_inline():
+    """
+    Apply up to WEBHOOK_INLINE_DRAIN_BATCH pending events from the webhook view.
+    The event is already stored, so a failure here only leaves it for the next call.
+    """
+    if settings.WEBHOOK_INLINE_DRAIN_BATCH < 1:
+        return 0
+    try:
+        return drain_batch(settings.WEBHOOK_INLINE_DRAIN_BATCH)
+    except Exception:
+        logger.exception("Inline drain of the Stripe event inbox failed; events stay pending.")
+        return 0
+
+
+def drain(batch_size=500, max_attempts=None, progress=None):
+    """Apply pending events until none are left. Returns the number processed."""
+    total = 0
+    while True:
+        claimed = drain_batch(batch_size, max_attempts)
+        if not claimed:
+            return total
+        total += claimed
+        if progress:
+            progress(total)
+
+
+def purge(keep_days, batch_size=5000):
+    """Delete processed events older than keep_days, batch_size rows per statement."""
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    total = 0
+    while True:
+        ids = list(
+            StripeEvent.objects.filter(processed_at__lt=cutoff).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += StripeEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def stats(window_seconds=60, max_attempts=None):
+    """Inbox backlog, lag and recent throughput."""
+    max_attempts = max_attempts or settings.WEBHOOK_MAX_ATTEMPTS
+    now = timezone.now()
+    backlog = StripeEvent.objects.filter(processed_at__isnull=True).aggregate(
+        pending=Count("id", filter=Q(attempts__lt=max_attempts)),
+        failed=Count("id", filter=Q(attempts__gte=max_attempts)),
+        oldest=Min("received_at", filter=Q(attempts__lt=max_attempts)),
+    )
+    recent = StripeEvent.objects.filter(processed_at__gte=now - timedelta(seconds=window_seconds)).aggregate(
+        processed=Count("id"),
+        delay=Avg(ExpressionWrapper(F("processed_at") - F("received_at"), output_field=DurationField())),
+    )
+    return {
+        "pending": backlog["pending"],
+        "failed": backlog["failed"],
+        "lag_seconds": round((now - backlog["oldest"]).total_seconds(), 3) if backlog["oldest"] else 0.0,
+        "window_seconds": window_seconds,
+        "processed": recent["processed"],
+        "throughput_per_second": round(recent["processed"] / window_seconds, 2),
+        "avg_delay_seconds": round(recent["delay"].total_seconds(), 3) if recent["delay"] else None,
+    }